@@ -0,0 +1,81 @@
+import hashlib
+import logging
+from typing import Self, Optional
+
+from mevy_bot.text_chunker import TextChunker
+from mevy_bot.models.openai import EmbeddingModel
+from mevy_bot.models.ingestion import ChunkPlan
+from mevy_bot.embedder.chunk_plan_cache import ChunkPlanCache
+from mevy_bot.embedder.tokenizer_registry import TokenizerRegistry
+
+l = logging.getLogger(__name__)
+
+
+class ChunkPlanner:
+    """
+    Build chunk plans (chunk boundaries and per-chunk embedding token
+    counts) once per text content, so that cost prediction and ingestion
+    share the same tokenization work.
+    """
+
+    def __init__(
+        self: Self,
+        text_chunker: TextChunker,
+        embedding_model: EmbeddingModel,
+        cache: Optional[ChunkPlanCache] = None
+    ) -> None:
+        self.text_chunker = text_chunker
+        self.embedding_model = embedding_model
+        self.cache = cache
+
+    def plan(
+        self: Self,
+        text: str,
+        chunk_size: int,
+        chunk_overlap: float,
+        content_defined: bool = False
+    ) -> ChunkPlan:
+        key = self.plan_key(text, chunk_size, chunk_overlap, content_defined)
+        if self.cache is not None:
+            plan = self.cache.get(key)
+            if plan is not None:
+                return plan
+
+        if content_defined:
+            chunk_offsets = self.text_chunker.content_defined_offsets(
+                text, chunk_size)
+        else:
+            chunk_offsets = self.text_chunker.semchunk_offsets(
+                text, chunk_size, chunk_overlap)
+
+        # Counted with the embedding model tokenizer: these are the billed tokens
+        chunk_token_counts = TokenizerRegistry.count_tokens(
+            self.embedding_model.name,
+            [text[start:end] for start, end in chunk_offsets]
+        )
+        plan = ChunkPlan(
+            nb_tokens=len(TokenizerRegistry.get(
+                self.embedding_model.name).encode_ordinary(text)),
+            nb_chars=len(text),
+            chunk_offsets=chunk_offsets,
+            chunk_token_counts=chunk_token_counts
+        )
+
+        if self.cache is not None:
+            self.cache.put(key, plan)
+        return plan
+
+    def plan_key(
+        self: Self,
+        text: str,
+        chunk_size: int,
+        chunk_overlap: float,
+        content_defined: bool
+    ) -> str:
+        digest = hashlib.sha256()
+        method = "content_defined" if content_defined else "semchunk"
+        digest.update(
+            f"{method}:{chunk_size}:{chunk_overlap}:"
+            f"{self.text_chunker.chat_model.name}:{self.embedding_model.name}:".encode("utf8"))
+        digest.update(text.encode("utf8"))
+        return digest.hexdigest()
@@ -0,0 +1,119 @@
+import os
+import logging
+import sqlite3
+import threading
+import time
+from typing import Self, Any, List, Sequence, Tuple
+
+l = logging.getLogger(__name__)
+
+
+class SqliteLruCache:
+    """
+    Cache table stored in SQLite, whose least recently used rows are
+    evicted once it holds max_entries.
+
+    Subclasses name their TABLE, declare its KEY_COLUMNS and VALUE_COLUMN
+    (COLUMNS holds their SQL definitions) and build their typed accessors
+    on select_rows and put_rows.
+    """
+
+    TABLE: str
+    COLUMNS: str
+    KEY_COLUMNS: Tuple[str, ...] = ("key",)
+    VALUE_COLUMN: str
+    DESCRIPTION = "cache"
+    MAX_ENTRIES = 500_000
+    EVICTION_FRACTION = 0.1
+    # SQLite limits the number of bound parameters per statement
+    MAX_KEYS_PER_STATEMENT = 500
+
+    def __init__(self: Self, filepath: str, max_entries: int) -> None:
+        self.filepath = filepath
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(self.filepath), exist_ok=True)
+        self.connection = sqlite3.connect(
+            self.filepath, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {self.TABLE} (
+                {self.COLUMNS},
+                last_access REAL NOT NULL,
+                PRIMARY KEY ({", ".join(self.KEY_COLUMNS)})
+            )
+            """
+        )
+        self.connection.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_{self.TABLE}_last_access ON {self.TABLE} (last_access)"
+        )
+        self.connection.commit()
+
+    def select_rows(self: Self, where: str, parameters: Sequence[Any]) -> List[tuple]:
+        """ (key columns..., value) of the rows matching where, now most recently used """
+        columns = ", ".join((*self.KEY_COLUMNS, self.VALUE_COLUMN))
+        with self._lock:
+            rows = self.connection.execute(
+                f"SELECT {columns} FROM {self.TABLE} WHERE {where}", parameters
+            ).fetchall()
+            if rows:
+                self.connection.execute(
+                    f"UPDATE {self.TABLE} SET last_access = ? WHERE {where}",
+                    (time.time(), *parameters)
+                )
+                self.connection.commit()
+        return rows
+
+    def get_values(self: Self, keys: Sequence[Any]) -> dict:
+        """ Value of each cached key, for single-column keys """
+        found = {}
+        unique_keys = list(set(keys))
+        for i in range(0, len(unique_keys), self.MAX_KEYS_PER_STATEMENT):
+            keys_slice = unique_keys[i:i + self.MAX_KEYS_PER_STATEMENT]
+            placeholders = ",".join("?" * len(keys_slice))
+            found.update(self.select_rows(
+                f"{self.KEY_COLUMNS[0]} IN ({placeholders})", keys_slice))
+        return found
+
+    def put_rows(self: Self, rows: Sequence[tuple]) -> None:
+        """ Insert or replace (key columns..., value) rows """
+        columns = (*self.KEY_COLUMNS, self.VALUE_COLUMN, "last_access")
+        placeholders = ", ".join("?" * len(columns))
+        now = time.time()
+        with self._lock:
+            self.connection.executemany(
+                f"INSERT OR REPLACE INTO {self.TABLE} ({', '.join(columns)}) VALUES ({placeholders})",
+                [(*row, now) for row in rows]
+            )
+            self.connection.commit()
+            self._evict()
+
+    def nb_entries(self: Self) -> int:
+        with self._lock:
+            return self.connection.execute(
+                f"SELECT COUNT(*) FROM {self.TABLE}").fetchone()[0]
+
+    def close(self: Self) -> None:
+        self.connection.close()
+
+    def _evict(self: Self) -> None:
+        nb_entries = self.connection.execute(
+            f"SELECT COUNT(*) FROM {self.TABLE}").fetchone()[0]
+        if nb_entries <= self.max_entries:
+            return
+
+        # Evict a slab of entries at once so eviction does not run on every insert
+        nb_to_evict = nb_entries - self.max_entries + \
+            int(self.max_entries * self.EVICTION_FRACTION)
+        l.info("Evicting %d entries from %s...", nb_to_evict, self.DESCRIPTION)
+        self.connection.execute(
+            f"""
+            DELETE FROM {self.TABLE} WHERE rowid IN (
+                SELECT rowid FROM {self.TABLE} ORDER BY last_access LIMIT ?
+            )
+            """,
+            (nb_to_evict,)
+        )
+        self.connection.commit()
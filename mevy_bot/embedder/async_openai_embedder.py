@@ -0,0 +1,150 @@
+import os
+import asyncio
+import logging
+import random
+from typing import Self, List, Optional
+
+from openai import (
+    AsyncOpenAI,
+    APIConnectionError,
+    APIStatusError,
+    RateLimitError
+)
+from openai.types import CreateEmbeddingResponse
+
+from mevy_bot.models.openai import EmbeddingModel
+from mevy_bot.embedder.embedding_cache import EmbeddingCache
+from mevy_bot.embedder.rate_limiter import RateLimiter
+
+l = logging.getLogger(__name__)
+
+
+class AsyncOpenAIEmbedder:
+    """
+    Embedder built on AsyncOpenAI.
+
+    At most max_concurrency requests are in flight at once, requests are
+    throttled to the account requests/tokens per minute limits, and
+    429/5xx/connection errors are retried with jittered exponential backoff.
+    """
+
+    MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "8"))
+    REQUESTS_PER_MINUTE = int(os.getenv("EMBEDDING_REQUESTS_PER_MINUTE", "3000"))
+    TOKENS_PER_MINUTE = int(os.getenv("EMBEDDING_TOKENS_PER_MINUTE", "1000000"))
+    MAX_RETRIES = 6
+    BACKOFF_BASE_SECONDS = 1.0
+    BACKOFF_MAX_SECONDS = 60.0
+
+    def __init__(
+        self: Self,
+        embedding_model: EmbeddingModel,
+        cache: Optional[EmbeddingCache] = None,
+        max_concurrency: int = MAX_CONCURRENCY,
+        requests_per_minute: int = REQUESTS_PER_MINUTE,
+        tokens_per_minute: int = TOKENS_PER_MINUTE
+    ) -> None:
+        self.embedding_model = embedding_model
+        self.cache = cache
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        # Retries are handled here so they also go through the rate limiter
+        self.client = AsyncOpenAI(max_retries=0)
+
+    async def generate_embeddings(self: Self, text_chunk: str) -> CreateEmbeddingResponse:
+        return await self._create_embeddings(text_chunk, self.estimate_tokens(text_chunk))
+
+    async def generate_embeddings_batch(
+        self: Self,
+        text_chunks: List[str],
+        nb_tokens: Optional[int] = None
+    ) -> List[List[float]]:
+        """ Embed several text chunks in a single request (input order is kept) """
+        if self.cache is None:
+            return await self._request_embeddings(text_chunks, nb_tokens)
+
+        embeddings = self.cache.get_many(text_chunks)
+        missing_indices = [
+            i for i, embedding in enumerate(embeddings) if embedding is None
+        ]
+        if missing_indices:
+            missing_chunks = [text_chunks[i] for i in missing_indices]
+            if len(missing_chunks) < len(text_chunks):
+                nb_tokens = None
+            missing_embeddings = await self._request_embeddings(
+                missing_chunks, nb_tokens)
+            self.cache.put_many(missing_chunks, missing_embeddings)
+            for i, embedding in zip(missing_indices, missing_embeddings):
+                embeddings[i] = embedding
+        return embeddings  # type: ignore
+
+    async def generate_embeddings_batches(
+        self: Self,
+        batches: List[List[str]],
+        batches_nb_tokens: Optional[List[int]] = None
+    ) -> List[List[List[float]]]:
+        """ Embed batches concurrently, results are returned in input order """
+        if batches_nb_tokens is None:
+            batches_nb_tokens = [None] * len(batches)  # type: ignore
+        return await asyncio.gather(*[
+            self.generate_embeddings_batch(batch, nb_tokens)
+            for batch, nb_tokens in zip(batches, batches_nb_tokens)  # type: ignore
+        ])
+
+    async def _request_embeddings(
+        self: Self,
+        text_chunks: List[str],
+        nb_tokens: Optional[int] = None
+    ) -> List[List[float]]:
+        if nb_tokens is None:
+            nb_tokens = sum(self.estimate_tokens(text_chunk)
+                            for text_chunk in text_chunks)
+        response = await self._create_embeddings(text_chunks, nb_tokens)
+        embeddings = sorted(response.data, key=lambda item: item.index)
+        return [item.embedding for item in embeddings]
+
+    async def _create_embeddings(
+        self: Self,
+        embedding_input: str | List[str],
+        nb_tokens: int
+    ) -> CreateEmbeddingResponse:
+        attempt = 0
+        while True:
+            await self.rate_limiter.acquire(nb_tokens)
+            try:
+                async with self.semaphore:
+                    return await self.client.embeddings.create(
+                        input=embedding_input,
+                        model=self.embedding_model.name
+                    )
+            except (RateLimitError, APIConnectionError, APIStatusError) as exc:
+                if not self.is_retryable(exc) or attempt >= self.MAX_RETRIES:
+                    raise
+                delay = self.backoff_delay(attempt, exc)
+                l.warning("Embedding request failed (%s), retrying in %.1fs (attempt %d/%d)...",
+                          exc.__class__.__name__, delay, attempt + 1, self.MAX_RETRIES)
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    @staticmethod
+    def is_retryable(exc: Exception) -> bool:
+        if isinstance(exc, (RateLimitError, APIConnectionError)):
+            return True
+        return isinstance(exc, APIStatusError) and exc.status_code >= 500
+
+    def backoff_delay(self: Self, attempt: int, exc: Exception) -> float:
+        # Honor the server hint when there is one, otherwise use full jitter
+        if isinstance(exc, APIStatusError):
+            retry_after = exc.response.headers.get("retry-after")
+            if retry_after is not None:
+                try:
+                    return float(retry_after)
+                except ValueError:
+                    pass
+        max_delay = min(self.BACKOFF_MAX_SECONDS,
+                        self.BACKOFF_BASE_SECONDS * 2 ** attempt)
+        return random.uniform(0, max_delay)
+
+    @staticmethod
+    def estimate_tokens(text_chunk: str) -> int:
+        # 1 token ~= 4 chars (see CostPredictor)
+        return len(text_chunk) // 4 + 1
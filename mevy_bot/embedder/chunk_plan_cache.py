@@ -0,0 +1,40 @@
+import json
+from dataclasses import asdict
+from typing import Self, Optional
+
+from mevy_bot.path_finder import PathFinder
+from mevy_bot.models.ingestion import ChunkPlan
+from mevy_bot.database.sqlite_lru_cache import SqliteLruCache
+
+
+class ChunkPlanCache(SqliteLruCache):
+    """
+    Persistent cache of chunk plans stored in SQLite, keyed by the hash of
+    the text content and the chunking parameters.
+    """
+
+    TABLE = "chunk_plans"
+    COLUMNS = "key TEXT NOT NULL, plan TEXT NOT NULL"
+    VALUE_COLUMN = "plan"
+    DESCRIPTION = "chunk plan cache"
+
+    def __init__(
+        self: Self,
+        filepath: Optional[str] = None,
+        max_entries: int = SqliteLruCache.MAX_ENTRIES
+    ) -> None:
+        super().__init__(filepath or PathFinder.chunk_plan_cache(), max_entries)
+
+    def get(self: Self, key: str) -> Optional[ChunkPlan]:
+        plan_json = self.get_values([key]).get(key)
+        if plan_json is None:
+            return None
+
+        plan_dict = json.loads(plan_json)
+        plan_dict["chunk_offsets"] = [
+            tuple(offsets) for offsets in plan_dict["chunk_offsets"]
+        ]
+        return ChunkPlan(**plan_dict)
+
+    def put(self: Self, key: str, plan: ChunkPlan) -> None:
+        self.put_rows([(key, json.dumps(asdict(plan)))])
@@ -0,0 +1,74 @@
+import hashlib
+from array import array
+from typing import Self, List, Optional, Sequence
+
+from mevy_bot.path_finder import PathFinder
+from mevy_bot.models.openai import EmbeddingModel
+from mevy_bot.database.sqlite_lru_cache import SqliteLruCache
+
+
+class EmbeddingCache(SqliteLruCache):
+    """
+    Persistent embedding cache stored in SQLite.
+
+    Entries are keyed by the hash of the chunk text, the embedding model
+    name and its dimensions. Vectors are stored as float32 blobs and the
+    least recently used entries are evicted once max_entries is reached.
+    """
+
+    TABLE = "embeddings"
+    COLUMNS = "key TEXT NOT NULL, vector BLOB NOT NULL"
+    VALUE_COLUMN = "vector"
+    DESCRIPTION = "embedding cache"
+    MAX_ENTRIES = 200_000
+
+    def __init__(
+        self: Self,
+        embedding_model: EmbeddingModel,
+        filepath: Optional[str] = None,
+        max_entries: int = MAX_ENTRIES
+    ) -> None:
+        super().__init__(filepath or PathFinder.embedding_cache(), max_entries)
+        self.embedding_model = embedding_model
+        self.hits = 0
+        self.misses = 0
+
+    def key(self: Self, text_chunk: str) -> str:
+        digest = hashlib.sha256()
+        digest.update(
+            f"{self.embedding_model.name}:{self.embedding_model.vector_dimensions}:".encode("utf8"))
+        digest.update(text_chunk.encode("utf8"))
+        return digest.hexdigest()
+
+    def get_many(self: Self, text_chunks: Sequence[str]) -> List[Optional[List[float]]]:
+        """ Return cached embeddings in input order (None on miss) """
+        keys = [self.key(text_chunk) for text_chunk in text_chunks]
+        found = self.get_values(keys)
+
+        embeddings = []
+        for key in keys:
+            if key in found:
+                embeddings.append(array("f", found[key]).tolist())
+                self.hits += 1
+            else:
+                embeddings.append(None)
+                self.misses += 1
+        return embeddings
+
+    def put_many(
+        self: Self,
+        text_chunks: Sequence[str],
+        embeddings: Sequence[Sequence[float]]
+    ) -> None:
+        self.put_rows([
+            (self.key(text_chunk), array("f", embedding).tobytes())
+            for text_chunk, embedding in zip(text_chunks, embeddings)
+        ])
+
+    def stats(self: Self) -> dict:
+        nb_lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / nb_lookups if nb_lookups else 0.0,
+        }
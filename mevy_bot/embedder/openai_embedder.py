@@ -1,20 +1,22 @@
-
-from typing import Self
+from typing import Self, List, Optional
 from decimal import Decimal
 
 from openai import OpenAI
 from openai.types import CreateEmbeddingResponse
 
 from mevy_bot.models.openai import EmbeddingModel
+from mevy_bot.embedder.embedding_cache import EmbeddingCache
 
 
 class OpenAIEmbedder:
 
     def __init__(
         self: Self,
-        embedding_model: EmbeddingModel
+        embedding_model: EmbeddingModel,
+        cache: Optional[EmbeddingCache] = None
     ) -> None:
         self.embedding_model = embedding_model
+        self.cache = cache
         self.client = OpenAI()
 
     def generate_embeddings(self: Self, text_chunk: str) -> CreateEmbeddingResponse:
@@ -22,3 +24,28 @@ class OpenAIEmbedder:
             input=text_chunk,
             model=self.embedding_model.name
         )
+
+    def generate_embeddings_batch(self: Self, text_chunks: List[str]) -> List[List[float]]:
+        """ Embed several text chunks in a single request (input order is kept) """
+        if self.cache is None:
+            return self._request_embeddings(text_chunks)
+
+        embeddings = self.cache.get_many(text_chunks)
+        missing_indices = [
+            i for i, embedding in enumerate(embeddings) if embedding is None
+        ]
+        if missing_indices:
+            missing_chunks = [text_chunks[i] for i in missing_indices]
+            missing_embeddings = self._request_embeddings(missing_chunks)
+            self.cache.put_many(missing_chunks, missing_embeddings)
+            for i, embedding in zip(missing_indices, missing_embeddings):
+                embeddings[i] = embedding
+        return embeddings  # type: ignore
+
+    def _request_embeddings(self: Self, text_chunks: List[str]) -> List[List[float]]:
+        response = self.client.embeddings.create(
+            input=text_chunks,
+            model=self.embedding_model.name
+        )
+        embeddings = sorted(response.data, key=lambda item: item.index)
+        return [item.embedding for item in embeddings]
@@ -1,57 +1,107 @@
 import logging
 import uuid
+import hashlib
 from abc import ABC
-from typing import Self, List
+from typing import Self, List, Sequence, Optional
 from datetime import datetime
 
 from qdrant_client.http.models import PointStruct
 
 from mevy_bot.embedder.openai_embedder import OpenAIEmbedder
+from mevy_bot.embedder.async_openai_embedder import AsyncOpenAIEmbedder
+from mevy_bot.models.ingestion import TextChunk
 
 l = logging.getLogger(__name__)
 
 
 class QdrantEmbeddingConverter(ABC):
 
+    MAX_BATCH_SIZE = 256
+    # Fixed namespace so that point ids are stable across runs and hosts
+    POINT_ID_NAMESPACE = uuid.UUID("5b6f1d2e-8c43-4f0e-9a57-3c1d7e2b9f60")
+
     def __init__(
         self: Self,
-        embedder: OpenAIEmbedder
+        embedder: OpenAIEmbedder,
+        max_batch_size: int = MAX_BATCH_SIZE,
+        async_embedder: Optional[AsyncOpenAIEmbedder] = None
     ) -> None:
         self.embedder = embedder
+        self.max_batch_size = max_batch_size
+        self.async_embedder = async_embedder
 
-    def get_embeddings_text_chunk(
-        self: Self,
-        text_chunk: str,
-        filename: str
-    ) -> PointStruct:
-        response = self.embedder.generate_embeddings(text_chunk)
+    @staticmethod
+    def text_hash(text_chunk: str) -> str:
+        return hashlib.sha256(text_chunk.encode("utf8")).hexdigest()
+
+    @classmethod
+    def point_ids_for_chunks(
+        cls,
+        source_id: str,
+        text_chunks: Sequence[str]
+    ) -> List[str]:
+        """
+        Derive point ids from the source id, the chunk text hash and the
+        number of identical chunks seen before in the same source.
 
-        point_embeddings = response.data[0].embedding
-        point_id = str(uuid.uuid4())
+        Identical chunks of a source get distinct ids, while an unchanged
+        chunk keeps its id even if chunks are inserted or removed before it.
+        """
+        occurrences: dict[str, int] = {}
+        point_ids = []
+        for text_chunk in text_chunks:
+            text_hash = cls.text_hash(text_chunk)
+            occurrence = occurrences.get(text_hash, 0)
+            occurrences[text_hash] = occurrence + 1
+            point_ids.append(str(uuid.uuid5(
+                cls.POINT_ID_NAMESPACE, f"{source_id}/{text_hash}/{occurrence}")))
+        return point_ids
 
+    @staticmethod
+    def build_payload(
+        text_chunk: str,
+        filename: str,
+        metadata: Optional[dict] = None
+    ) -> dict:
         now = datetime.now()
         str_now = now.strftime("%m-%d-%Y")
-        return PointStruct(
-            id=point_id,
-            vector=point_embeddings,
-            payload={
-                "text": text_chunk,
-                "source": filename,
-                "last_update_date": str_now,
-                **({"type": "meta"} if "meta-questions" in filename else {})
+        return {
+            "text": text_chunk,
+            "source": filename,
+            "last_update_date": str_now,
+            **(metadata or {}),
+            **({"type": "meta"} if "meta-questions" in filename else {})
+        }
+
+    def chunk_payload(self: Self, text_chunk: TextChunk) -> dict:
+        """ Payload of the point of a chunk, as written by get_embeddings_for_chunks """
+        return self.build_payload(
+            text_chunk.text,
+            text_chunk.source_name,
+            {
+                "source_id": text_chunk.source_id,
+                "chunk_index": text_chunk.chunk_index,
+                **text_chunk.metadata
             }
         )
 
-    def get_embeddings_text_chunks(
+    async def get_embeddings_for_chunks(
         self: Self,
-        text_chunks: List[str],
-        filename: str
+        text_chunks: List[TextChunk]
     ) -> List[PointStruct]:
-        nb_chunks = len(text_chunks)
-        points = []
-        for chunk_index, text_chunk in enumerate(text_chunks):
-            point = self.get_embeddings_text_chunk(text_chunk, filename)
-            points.append(point)
-            l.info("%d/%d chunks have been processed.",
-                   chunk_index + 1, nb_chunks)
-        return points
+        """ Embed one batch of chunks (possibly from several sources) """
+        if self.async_embedder is None:
+            raise ValueError("async_embedder is required for this operation")
+
+        batch_embeddings = await self.async_embedder.generate_embeddings_batch(
+            [text_chunk.text for text_chunk in text_chunks],
+            sum(text_chunk.nb_tokens for text_chunk in text_chunks)
+        )
+        return [
+            PointStruct(
+                id=text_chunk.point_id,
+                vector=point_embeddings,
+                payload=self.chunk_payload(text_chunk)
+            )
+            for text_chunk, point_embeddings in zip(text_chunks, batch_embeddings)
+        ]
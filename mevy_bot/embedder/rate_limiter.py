@@ -0,0 +1,59 @@
+import asyncio
+import time
+from typing import Self
+
+
+class RateLimiter:
+    """
+    Async token-bucket limiter for requests per period and tokens per period.
+
+    Both buckets start full and refill continuously, so a burst of up to
+    one period worth of capacity is allowed before callers start waiting.
+    """
+
+    def __init__(
+        self: Self,
+        requests_per_period: int,
+        tokens_per_period: int,
+        period_seconds: float = 60.0
+    ) -> None:
+        self.requests_per_period = requests_per_period
+        self.tokens_per_period = tokens_per_period
+        self.period_seconds = period_seconds
+        self.available_requests = float(requests_per_period)
+        self.available_tokens = float(tokens_per_period)
+        self.last_refill = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self: Self, nb_tokens: int) -> None:
+        # A single request bigger than the bucket could never be served
+        nb_tokens = min(nb_tokens, self.tokens_per_period)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.available_requests >= 1 and self.available_tokens >= nb_tokens:
+                    self.available_requests -= 1
+                    self.available_tokens -= nb_tokens
+                    return
+                await asyncio.sleep(self._delay_until_available(nb_tokens))
+
+    def _refill(self: Self) -> None:
+        now = time.monotonic()
+        elapsed_periods = (now - self.last_refill) / self.period_seconds
+        self.last_refill = now
+        self.available_requests = min(
+            float(self.requests_per_period),
+            self.available_requests + elapsed_periods * self.requests_per_period
+        )
+        self.available_tokens = min(
+            float(self.tokens_per_period),
+            self.available_tokens + elapsed_periods * self.tokens_per_period
+        )
+
+    def _delay_until_available(self: Self, nb_tokens: int) -> float:
+        missing_requests = max(0.0, 1 - self.available_requests)
+        missing_tokens = max(0.0, nb_tokens - self.available_tokens)
+        return max(
+            missing_requests / self.requests_per_period,
+            missing_tokens / self.tokens_per_period
+        ) * self.period_seconds
@@ -1,8 +1,7 @@
 from typing import Self, List, Tuple
 
-import tiktoken
-
 from mevy_bot.models.openai import ChatModel
+from mevy_bot.embedder.tokenizer_registry import TokenizerRegistry
 
 
 class TokenCalculator:
@@ -11,7 +10,7 @@ class TokenCalculator:
         self.chat_model = chat_model
 
     def nb_tokens_in_text_chunk(self: Self, text_chunk: str) -> int:
-        tokenizer = tiktoken.encoding_for_model(self.chat_model.name)
+        tokenizer = TokenizerRegistry.get(self.chat_model.name)
         tokenized_text: List[int] = tokenizer.encode(text_chunk)
         return len(tokenized_text)
 
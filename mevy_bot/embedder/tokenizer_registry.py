@@ -0,0 +1,88 @@
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Sequence, Optional, Callable, TypeVar
+
+import tiktoken
+
+l = logging.getLogger(__name__)
+
+T = TypeVar("T")
+U = TypeVar("U")
+
+
+class TokenizerRegistry:
+    """
+    Process-wide tiktoken encodings, built once per model.
+
+    Batch operations run on a shared thread pool: tiktoken releases the GIL
+    while encoding, so several documents are tokenized in parallel.
+    """
+
+    MAX_WORKERS = int(os.getenv("TOKENIZER_MAX_WORKERS", str(os.cpu_count() or 4)))
+    MIN_GROUP_SIZE = 8
+
+    _encodings: dict[str, tiktoken.Encoding] = {}
+    _lock = threading.Lock()
+    _executor: Optional[ThreadPoolExecutor] = None
+
+    @classmethod
+    def get(cls, model_name: str) -> tiktoken.Encoding:
+        encoding = cls._encodings.get(model_name)
+        if encoding is None:
+            with cls._lock:
+                encoding = cls._encodings.get(model_name)
+                if encoding is None:
+                    encoding = tiktoken.encoding_for_model(model_name)
+                    cls._encodings[model_name] = encoding
+        return encoding
+
+    @classmethod
+    def register(cls, model_name: str, encoding: tiktoken.Encoding) -> None:
+        with cls._lock:
+            cls._encodings[model_name] = encoding
+
+    @classmethod
+    def warm_up(cls, model_names: Sequence[str]) -> None:
+        """ Build the encodings ahead of the first request """
+        for model_name in model_names:
+            cls.get(model_name)
+        l.info("Tokenizers loaded for %s", ", ".join(model_names))
+
+    @classmethod
+    def encode_batch(cls, model_name: str, texts: Sequence[str]) -> List[List[int]]:
+        encoding = cls.get(model_name)
+        return cls._map_in_groups(encoding.encode_ordinary, texts)
+
+    @classmethod
+    def decode_batch(cls, model_name: str, token_batches: Sequence[Sequence[int]]) -> List[str]:
+        encoding = cls.get(model_name)
+        return cls._map_in_groups(encoding.decode, token_batches)  # type: ignore
+
+    @classmethod
+    def _map_in_groups(cls, function: Callable[[T], U], items: Sequence[T]) -> List[U]:
+        # One task per worker: one task per item costs more than decoding it
+        nb_groups = min(cls.MAX_WORKERS, len(items) // cls.MIN_GROUP_SIZE)
+        if nb_groups < 2:
+            return [function(item) for item in items]
+
+        group_size = -(-len(items) // nb_groups)
+        groups_results = cls._get_executor().map(
+            lambda group: [function(item) for item in group],
+            [items[i:i + group_size] for i in range(0, len(items), group_size)]
+        )
+        return [result for group_results in groups_results for result in group_results]
+
+    @classmethod
+    def count_tokens(cls, model_name: str, texts: Sequence[str]) -> List[int]:
+        return [len(tokens) for tokens in cls.encode_batch(model_name, texts)]
+
+    @classmethod
+    def _get_executor(cls) -> ThreadPoolExecutor:
+        if cls._executor is None:
+            with cls._lock:
+                if cls._executor is None:
+                    cls._executor = ThreadPoolExecutor(
+                        cls.MAX_WORKERS, thread_name_prefix="tokenizer")
+        return cls._executor
@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta
+from typing import Self, Optional
+
+
+class CronSchedule:
+    """
+    Standard five-field cron expression: minute hour day-of-month month
+    day-of-week. Fields accept *, lists, ranges and steps (e.g. "*/15",
+    "1-5", "0,30"). Day-of-week 0 and 7 are Sunday.
+    """
+
+    FIELD_RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+    MAX_DAYS_AHEAD = 4 * 366
+
+    def __init__(self: Self, expression: str) -> None:
+        fields = expression.split()
+        if len(fields) != len(self.FIELD_RANGES):
+            raise ValueError(
+                f"Cron expression must have {len(self.FIELD_RANGES)} fields: {expression!r}")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, self.weekdays = [
+            self.parse_field(field, low, high)
+            for field, (low, high) in zip(fields, self.FIELD_RANGES)
+        ]
+        if 7 in self.weekdays:
+            self.weekdays.add(0)
+        # As in cron, restricting both day fields matches either of them
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    @staticmethod
+    def parse_field(field: str, low: int, high: int) -> set[int]:
+        values: set[int] = set()
+        for part in field.split(","):
+            value_range, _, step = part.partition("/")
+            if value_range == "*":
+                start, end = low, high
+            elif "-" in value_range:
+                start, end = (int(value) for value in value_range.split("-"))
+            else:
+                start = int(value_range)
+                end = high if step else start
+            if not low <= start <= end <= high:
+                raise ValueError(f"Invalid cron field {field!r}")
+            values.update(range(start, end + 1, int(step or 1)))
+        return values
+
+    def next_after(self: Self, moment: datetime) -> datetime:
+        """ First matching minute strictly after moment """
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        for _ in range(self.MAX_DAYS_AHEAD):
+            if self.matches_day(candidate):
+                first_time = self.first_time_from(candidate.hour, candidate.minute)
+                if first_time is not None:
+                    hour, minute = first_time
+                    return candidate.replace(hour=hour, minute=minute)
+            candidate = (candidate + timedelta(days=1)).replace(hour=0, minute=0)
+        raise ValueError(f"Cron expression never matches: {self.expression!r}")
+
+    def matches_day(self: Self, moment: datetime) -> bool:
+        if moment.month not in self.months:
+            return False
+        day_matches = moment.day in self.days
+        # datetime weekdays start on Monday, cron ones on Sunday
+        weekday_matches = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day_matches and weekday_matches
+        return day_matches or weekday_matches
+
+    def first_time_from(self: Self, hour: int, minute: int) -> Optional[tuple[int, int]]:
+        """ First (hour, minute) of the day at or after hour:minute """
+        return min(
+            (
+                (candidate_hour, candidate_minute)
+                for candidate_hour in self.hours
+                for candidate_minute in self.minutes
+                if (candidate_hour, candidate_minute) >= (hour, minute)
+            ),
+            default=None
+        )
@@ -1,22 +1,49 @@
+import os
+import threading
+import time
+import hashlib
+import asyncio
 import logging
 import tempfile
 import itertools
-from typing import Self
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from typing import Self, List, AsyncIterator, Iterator, Tuple, Optional, Callable
 
 from mevy_bot.etl.workflow_etl import WorkflowEtl
 from mevy_bot.services.gdrive_service import GdriveService
-from mevy_bot.services.gdrive_cache_service import GdriveCacheService
+from mevy_bot.services.gdrive_source_registry_service import GdriveSourceRegistryService
+from mevy_bot.path_finder import PathFinder
 from mevy_bot.vector_store.vector_store import VectorStore
 from mevy_bot.vector_store.qdrant_collection import QdrantCollection
 from mevy_bot.etl.workflow_logger import WorkflowLogger
+from mevy_bot.models.ingestion import SourceDocument
+from mevy_bot.exceptions.unsupported_file_type_error import UnsupportedFileTypeError
 
 
 class GdriveEtl(WorkflowEtl):
 
-    def __init__(self: Self, logger: WorkflowLogger) -> None:
-        super().__init__(logger)
+    # Needed for incremental updates: an edit only shifts nearby chunks
+    CONTENT_DEFINED_CHUNKS = True
+    SPILL_THRESHOLD_BYTES = int(
+        os.getenv("GDRIVE_SPILL_THRESHOLD_BYTES", str(32 * 1024 * 1024)))
+    DOWNLOAD_WORKERS = int(os.getenv("GDRIVE_DOWNLOAD_WORKERS", "4"))
+    RECONCILIATION_INTERVAL_SECONDS = int(
+        os.getenv("GDRIVE_RECONCILIATION_INTERVAL_SECONDS", str(24 * 60 * 60)))
+
+    def __init__(
+        self: Self,
+        logger: WorkflowLogger,
+        stop_event: Optional[threading.Event] = None,
+        lease_check: Optional[Callable[[], bool]] = None
+    ) -> None:
+        super().__init__(logger, stop_event, lease_check)
+        # Files which could not be read this run and their error, recorded
+        # in the registry to be retried with a backoff
+        self.failed_files: List[Tuple[dict, str]] = []
         self.gdrive_service = GdriveService()
-        self.gdrive_cache_service = GdriveCacheService()
+        self.source_registry = GdriveSourceRegistryService()
+        self.source_registry.import_json_cache(
+            os.path.join(PathFinder.data_storage(), "gdrive_known_files.json"))
         self.store_client = QdrantCollection(
             self.embedding_model_info.vector_dimensions)
         self.vector_store = VectorStore(
@@ -27,97 +54,388 @@ class GdriveEtl(WorkflowEtl):
 
     async def run(self: Self, predict_only=False) -> None:
         await super().run()
-        self.logger.info("Step 1: Listing files in Google Drive folder...")
-        knowledge_files = self.gdrive_service.list_knowledge_files()
-        self.logger.info(
-            f"Step 1: {len(knowledge_files['files'])} files in folder.")
+        self.failed_files = []
+        changes_state = self.source_registry.read_changes_state()
+        failed_files = self.source_registry.get_failed_files()
+        folder_id = self.gdrive_service.get_folder_id(
+            self.gdrive_service.KNOWLEDGE_FOLDER_NAME)
 
-        self.logger.info(
-            "Step 2: Determining files to create, update and delete...")
-        cached_files = self.gdrive_cache_service.read()
+        if self.is_reconciliation_due(changes_state):
+            self.logger.info("Step 1: Listing files in Google Drive folder...")
+            # Taken before listing: changes made meanwhile are listed next run
+            start_page_token = self.gdrive_service.get_start_page_token()
+            knowledge_files = self.gdrive_service.list_files_in_folder(folder_id)
+            last_reconciliation = time.time()
+            self.logger.info(
+                f"Step 1: {len(knowledge_files['files'])} files in folder.")
 
-        files_to_create = []
-        files_to_update = []
-        for file_data in knowledge_files["files"]:
-            if file_data['id'] not in cached_files:
-                files_to_create.append(file_data)
+            self.logger.info(
+                "Step 2: Determining files to create, update and delete...")
+            files_to_create, files_to_update, files_to_delete = self.source_registry.diff_listing(
+                knowledge_files["files"])
+            left_file_ids = failed_files.keys() - {
+                file["id"] for file in knowledge_files["files"]}
+        else:
+            self.logger.info("Step 1: Listing changes in Google Drive...")
+            changes, start_page_token = self.gdrive_service.list_changes(
+                changes_state["startPageToken"])
+            last_reconciliation = changes_state["lastReconciliation"]
+            self.logger.info(f"Step 1: {len(changes)} changes in Google Drive.")
 
-            elif file_data["modifiedTime"] != cached_files[file_data["id"]]["modifiedTime"]:
-                files_to_update.append(file_data)
+            self.logger.info(
+                "Step 2: Determining files to create, update and delete...")
+            files_to_create, files_to_update, files_to_delete = self.diff_changes(
+                changes, folder_id)
+            last_changes = {change["fileId"]: change for change in changes}
+            left_file_ids = {
+                file_id for file_id, change in last_changes.items()
+                if not self.is_in_folder(change, folder_id)
+            }
 
-        files_to_delete = []
-        knowledge_file_ids = [file_data["id"]
-                              for file_data in knowledge_files["files"]]
-        for file_id, file_data in cached_files.items():
-            if file_id not in knowledge_file_ids:
-                files_to_delete.append(
-                    {"id": file_id, "name": file_data["name"]})
+        left_failed_file_ids = left_file_ids & failed_files.keys()
+        if left_failed_file_ids and not predict_only:
+            await self.ensure_lease_held()
+            for file_id in left_failed_file_ids:
+                self.source_registry.delete_failed_file(file_id)
+        files_to_create, files_to_update = self.schedule_failed_files(
+            files_to_create, files_to_update, failed_files, left_failed_file_ids)
         self.logger.info(
             f"Step 2: Results=({len(files_to_create)} create, {len(files_to_update)} update, {len(files_to_delete)} delete)"
         )
 
+        if not (files_to_create or files_to_update or files_to_delete):
+            if not predict_only:
+                await self.ensure_lease_held()
+                self.source_registry.write_changes_state(
+                    start_page_token, last_reconciliation)
+            self.logger.info("Workflow complete: nothing to do.")
+            return
+
         self.logger.info(
-            "Step 3: Deleting deleted and updated files from vector store...")
-        for file_data in itertools.chain(files_to_update, files_to_delete):
+            "Step 3: Deleting deleted files from vector store...")
+        for file_data in files_to_delete:
+            if self.is_stop_requested():
+                self.logger.info("Workflow stopped: deleted files have been saved.")
+                return
+            await self.ensure_lease_held()
             await self.vector_store.delete_vectors_for_source(
                 self.collection_name, file_data["name"])
+            self.source_registry.delete_file(file_data["id"])
         self.logger.info(
-            "Step 3: Deleted and updated files have been deleted from vector store.")
+            "Step 3: Deleted files have been deleted from vector store.")
 
-        self.logger.info("Step 4: Downloading files from Google Drive...")
+        self.logger.info("Step 4: Downloading and indexing files from Google Drive...")
+        registered_files = self.source_registry.get_files(
+            file["id"] for file in files_to_update)
+        # Same checksum: renamed, moved or shared, the content is already indexed
+        metadata_only_files = [
+            file for file in files_to_update
+            if self.is_content_unchanged(file, registered_files)
+        ]
+        metadata_only_file_ids = {file["id"] for file in metadata_only_files}
+        files_to_index = [
+            file for file in itertools.chain(files_to_create, files_to_update)
+            if file["id"] not in metadata_only_file_ids
+        ]
+        # Only files above SPILL_THRESHOLD_BYTES are written here
         with tempfile.TemporaryDirectory() as tmp_dir:
-            for file in itertools.chain(files_to_create, files_to_update):
-                self.logger.info(f"Step 4: Downloading file {file}...")
-                self.gdrive_service.download_and_write_file(
-                    file.get("id"),
-                    file.get("name"),
-                    file.get("mimeType"),
-                    tmp_dir
+            if predict_only:
+                self.vector_store.predict_costs_for_documents(
+                    self.iter_drive_documents(files_to_index, tmp_dir, registered_files),
+                    self.CONTENT_DEFINED_CHUNKS
                 )
-                self.logger.info(f"Step 4: File {file} downloaded.")
-                self.logger.info("Step 4: All files have been downloaded.")
+                return
 
-                if predict_only:
-                    self.vector_store.predict_costs_for_embedding_files(
-                        tmp_dir)
-                    return
+            for file_data in metadata_only_files:
+                await self.record_metadata_only_update(
+                    file_data, registered_files[file_data["id"]])
+
+            files_by_id = {file["id"]: file for file in files_to_index}
+
+            async def record_indexed_file(file_id: str, point_ids: set[str]) -> None:
+                # Checkpoint: a file indexed before a stop or a crash is not
+                # indexed again by the next run
+                await self.ensure_lease_held()
+                file_data = files_by_id[file_id]
+                registered_file = registered_files.get(file_id)
+                if registered_file is not None and registered_file["name"] != file_data["name"]:
+                    await self.vector_store.rename_source(
+                        self.collection_name, file_id, file_data["name"])
+                self.source_registry.put_file(file_data, point_ids)
+
+            # Updated files are re-indexed incrementally: only chunks whose
+            # point id was not recorded for the previous version are embedded
+            # and the recorded points which disappeared are deleted.
+            known_point_ids = {
+                file_id: set(file_data["pointIds"])
+                for file_id, file_data in registered_files.items()
+            }
+            await self.vector_store.build_from_documents(
+                self.collection_name,
+                self.skip_unchanged_documents(
+                    self.drive_documents(files_to_index, tmp_dir, registered_files),
+                    files_by_id,
+                    registered_files,
+                    metadata_only_files
+                ),
+                known_point_ids=known_point_ids,
+                content_defined_chunks=self.CONTENT_DEFINED_CHUNKS,
+                on_source_indexed=record_indexed_file,
+                before_upsert=self.ensure_lease_held
+            )
+        if self.failed_files:
+            await self.ensure_lease_held()
+            for file_data, error in self.failed_files:
+                self.source_registry.record_failure(file_data, error)
+            self.logger.warning(
+                f"Step 4: {len(self.failed_files)} files could not be read, "
+                "they will be retried with a backoff.")
+        if self.is_stop_requested():
+            # The changes are listed again next run, the indexed files are skipped
+            self.logger.info("Workflow stopped: indexed files have been saved.")
+            return
+        self.logger.info(
+            f"Step 4: All files have been indexed ({len(metadata_only_files)} metadata-only updates).")
 
-                await self.vector_store.build_from_directory_files(
-                    self.collection_name, tmp_dir)
-        self.logger.info("Step 5: Updating known files cache...")
-        self._update_cache(files_to_create, files_to_update,
-                           files_to_delete, cached_files)
-        self.logger.info("Step 5: Cache updated.")
+        self.logger.info("Step 5: Saving Google Drive changes position...")
+        await self.ensure_lease_held()
+        self.source_registry.write_changes_state(
+            start_page_token, last_reconciliation)
+        self.logger.info("Step 5: Changes position saved.")
 
         self.logger.info("Workflow complete.")
 
-    def _update_cache(
+    def is_reconciliation_due(self: Self, changes_state: dict) -> bool:
+        """
+        Changes are listed from the saved token; the whole folder is listed
+        again every RECONCILIATION_INTERVAL_SECONDS to catch anything missed.
+        """
+        if "startPageToken" not in changes_state:
+            return True
+        elapsed_seconds = time.time() - changes_state["lastReconciliation"]
+        return elapsed_seconds >= self.RECONCILIATION_INTERVAL_SECONDS
+
+    def diff_changes(
+        self: Self,
+        changes: List[dict],
+        folder_id: str
+    ) -> Tuple[List[dict], List[dict], List[dict]]:
+        """
+        Same as the registry diff_listing from the changes of the whole
+        drive: files removed, trashed or moved out of the folder are deleted.
+        """
+        # Only the last change of a file matters
+        last_changes = {change["fileId"]: change for change in changes}
+        registered_files = self.source_registry.get_files(last_changes)
+
+        files_to_create = []
+        files_to_update = []
+        files_to_delete = []
+        for file_id, change in last_changes.items():
+            file_data = change.get("file")
+            if self.is_in_folder(change, folder_id):
+                if file_id not in registered_files:
+                    files_to_create.append(file_data)
+                elif file_data["modifiedTime"] != registered_files[file_id]["modifiedTime"]:
+                    files_to_update.append(file_data)
+            elif file_id in registered_files:
+                files_to_delete.append(registered_files[file_id])
+        return files_to_create, files_to_update, files_to_delete
+
+    @staticmethod
+    def is_in_folder(change: dict, folder_id: str) -> bool:
+        file_data = change.get("file")
+        return (
+            not change.get("removed", False)
+            and file_data is not None
+            and not file_data.get("trashed", False)
+            and folder_id in file_data.get("parents", [])
+        )
+
+    def schedule_failed_files(
+        self: Self,
+        files_to_create: List[dict],
+        files_to_update: List[dict],
+        failed_files: dict[str, dict],
+        left_file_ids: set[str]
+    ) -> Tuple[List[dict], List[dict]]:
+        """
+        Files which could not be read are retried once their backoff is
+        over (see GdriveSourceRegistryService.record_failure), or as soon
+        as they are modified again, instead of holding back the changes
+        position until they can be read.
+        """
+        now = time.time()
+
+        def is_waiting(file_data: dict) -> bool:
+            failure = failed_files.get(file_data["id"])
+            return (
+                failure is not None
+                and failure["nextAttempt"] > now
+                and failure["file"]["modifiedTime"] == file_data["modifiedTime"]
+            )
+
+        listed_file_ids = {
+            file["id"] for file in itertools.chain(files_to_create, files_to_update)}
+        files_to_create = [file for file in files_to_create if not is_waiting(file)]
+        files_to_update = [file for file in files_to_update if not is_waiting(file)]
+
+        due_files = [
+            failure["file"] for file_id, failure in failed_files.items()
+            if file_id not in listed_file_ids
+            and file_id not in left_file_ids
+            and failure["nextAttempt"] <= now
+        ]
+        if due_files:
+            self.logger.info(f"Step 2: Retrying {len(due_files)} files which could not be read.")
+        registered_files = self.source_registry.get_files(file["id"] for file in due_files)
+        for file_data in due_files:
+            if file_data["id"] in registered_files:
+                files_to_update.append(file_data)
+            else:
+                files_to_create.append(file_data)
+        return files_to_create, files_to_update
+
+    @staticmethod
+    def is_content_unchanged(file_data: dict, registered_files: dict[str, dict]) -> bool:
+        registered_file = registered_files.get(file_data["id"])
+        return (
+            file_data.get("md5Checksum") is not None
+            and registered_file is not None
+            and registered_file["md5Checksum"] == file_data["md5Checksum"]
+        )
+
+    async def record_metadata_only_update(
         self: Self,
-        files_to_create: list,
-        files_to_update: list,
-        files_to_delete: list,
-        cached_files: dict,
+        file_data: dict,
+        registered_file: dict
     ) -> None:
-        for file_data in files_to_delete:
-            self.logger.info(
-                f"Deleting file {file_data['name']} (id {file_data['id']}) from cache...")
-            cached_files.pop(file_data["id"])
-            self.logger.info("File info deleted from cache.")
+        """ Keep the indexed chunks, only their source name may change """
+        await self.ensure_lease_held()
+        if registered_file["name"] != file_data["name"]:
+            await self.vector_store.rename_source(
+                self.collection_name, file_data["id"], file_data["name"])
+        self.source_registry.put_file(file_data, registered_file["pointIds"])
 
-        for file_data in files_to_update:
-            self.logger.info(
-                f"Updating file info {file_data['name']} (id [file_data['id']]) in cache...")
-            cached_files[file_data["id"]
-                         ]["modifiedTime"] = file_data["modifiedTime"]
-            self.logger.info("File info updated in cache.")
+    async def skip_unchanged_documents(
+        self: Self,
+        documents: AsyncIterator[SourceDocument],
+        files_by_id: dict[str, dict],
+        registered_files: dict[str, dict],
+        metadata_only_files: List[dict]
+    ) -> AsyncIterator[SourceDocument]:
+        """
+        Google Docs have no md5Checksum: their checksum is only known once
+        exported, so unchanged ones are filtered out after the download
+        (read_drive_file leaves them unparsed).
+        """
+        async for document in documents:
+            file_data = files_by_id[document.source_id]
+            if self.is_content_unchanged(file_data, registered_files):
+                self.logger.info(f"Step 4: {file_data['name']} content is unchanged.")
+                await self.record_metadata_only_update(
+                    file_data, registered_files[file_data["id"]])
+                metadata_only_files.append(file_data)
+                continue
+            yield document
 
-        for file_data in files_to_create:
-            self.logger.info(
-                "Adding file {file_data['name']} (id [file_data['id']]) to cache...")
-            cached_files[file_data["id"]] = {
-                "name": file_data["name"],
-                "modifiedTime": file_data["modifiedTime"]
-            }
-            self.logger.info("File created in cache.")
+    async def drive_documents(
+        self: Self,
+        files: List[dict],
+        tmp_dir: str,
+        registered_files: Optional[dict[str, dict]] = None
+    ) -> AsyncIterator[SourceDocument]:
+        documents = self.iter_drive_documents(files, tmp_dir, registered_files)
+        try:
+            while (document := await asyncio.to_thread(next, documents, None)) is not None:
+                yield document
+        finally:
+            documents.close()
+
+    def iter_drive_documents(
+        self: Self,
+        files: List[dict],
+        tmp_dir: str,
+        registered_files: Optional[dict[str, dict]] = None
+    ) -> Iterator[SourceDocument]:
+        """
+        Download and read up to DOWNLOAD_WORKERS files at a time, yielding
+        each document as soon as it is ready (not in the order of files).
+        """
+        files_iter = iter(files)
+        with ThreadPoolExecutor(self.DOWNLOAD_WORKERS, thread_name_prefix="gdrive") as executor:
+            pending: dict[Future, dict] = {}
+
+            def submit_next() -> None:
+                # Stopping: the downloads in progress are still indexed
+                if self.is_stop_requested():
+                    return
+                file = next(files_iter, None)
+                if file is not None:
+                    self.logger.info(f"Step 4: Downloading file {file['name']}...")
+                    pending[executor.submit(
+                        self.read_drive_file, file, tmp_dir, registered_files)] = file
+
+            try:
+                for _ in range(self.DOWNLOAD_WORKERS):
+                    submit_next()
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        file = pending.pop(future)
+                        submit_next()
+                        try:
+                            document = future.result()
+                        except UnsupportedFileTypeError:
+                            self.logger.warning(
+                                f"Step 4: File {file['name']} skipped: unsupported file type.")
+                            continue
+                        except Exception as e:  # pylint: disable=broad-exception-caught
+                            self.logger.error(f"Step 4: File {file['name']} skipped: {e}")
+                            self.failed_files.append((file, str(e)))
+                            continue
+                        self.logger.info(f"Step 4: File {file['name']} downloaded.")
+                        yield document
+            finally:
+                # Stopped early: do not start the downloads still queued
+                for future in pending:
+                    future.cancel()
 
-        self.gdrive_cache_service.write(cached_files)
+    def read_drive_file(
+        self: Self,
+        file: dict,
+        tmp_dir: str,
+        registered_files: Optional[dict[str, dict]] = None
+    ) -> SourceDocument:
+        """
+        Download a file and extract its text. Files bigger than
+        SPILL_THRESHOLD_BYTES are written to a temporary file instead of
+        being held in memory. PDF pages are extracted by the process pool
+        either way.
+
+        An exported Google Doc whose checksum matches its registered one is
+        not parsed: its document has no text.
+        """
+        if int(file.get("size", 0)) > self.SPILL_THRESHOLD_BYTES:
+            # Prefixed by the id: files downloaded concurrently may share a name
+            file_name = f"{file['id']}_{file['name']}"
+            filepath = os.path.join(tmp_dir, file_name)
+            try:
+                self.gdrive_service.download_and_write_file(
+                    file["id"], file_name, file["mimeType"], tmp_dir)
+                file_text = self.vector_store.file_reader.detect_format_and_read(filepath)
+            finally:
+                # Also removes what a failed download left behind
+                if os.path.exists(filepath):
+                    os.remove(filepath)
+        else:
+            file_content = self.gdrive_service.download_file(
+                file["id"], file["mimeType"])
+            if "md5Checksum" not in file:
+                # Exported Google Docs: checksum of the exported content
+                file["md5Checksum"] = "sha256:" + hashlib.sha256(file_content).hexdigest()
+                if self.is_content_unchanged(file, registered_files or {}):
+                    return SourceDocument(file["id"], file["name"], "")
+            file_text = self.vector_store.file_reader.detect_format_and_read_bytes(
+                file_content, file["name"], file["mimeType"])
+        return SourceDocument(file["id"], file["name"], file_text)
@@ -1,51 +1,275 @@
 import os
+import time
 import json
-import tempfile
-from typing import Self
+import threading
+import asyncio
+from collections import Counter
+from typing import Self, AsyncIterator, List, Tuple, Optional, Callable
+
+from pydantic import ValidationError
+from unidecode import unidecode
 
 from mevy_bot.path_finder import PathFinder
 from mevy_bot.etl.workflow_etl import WorkflowEtl
 from mevy_bot.services.legifrance_service import LegifranceService
+from mevy_bot.services.legifrance_manifest_service import LegifranceManifestService
+from mevy_bot.services.legifrance_text_cache_service import LegifranceTextCacheService
+from mevy_bot.services.legifrance_response_cache_service import LegifranceResponseCacheService
 from mevy_bot.vector_store.qdrant_collection import QdrantCollection
 from mevy_bot.vector_store.vector_store import VectorStore
 from mevy_bot.etl.workflow_logger import WorkflowLogger
-
+from mevy_bot.models.ingestion import SourceDocument
+from mevy_bot.embedder.async_openai_embedder import AsyncOpenAIEmbedder
+from mevy_bot.embedder.human_number import HumanNumber
+from mevy_bot.models.legifrance import Article, LegifranceSource
 
 
 class LegifranceEtl(WorkflowEtl):
 
-    def __init__(self: Self, logger: WorkflowLogger) -> None:
-        super().__init__(logger)
-        self.legifrance_service = LegifranceService()
+    # Articles in any other state (abrogated, not yet in force...) are not indexed
+    ARTICLE_STATES = {
+        state.strip()
+        for state in os.getenv("LEGIFRANCE_ARTICLE_STATES", "VIGUEUR").split(",")
+    }
+    # The manifest is rewritten as a whole, so indexed articles are saved in groups
+    CHECKPOINT_INTERVAL_SECONDS = int(
+        os.getenv("LEGIFRANCE_CHECKPOINT_INTERVAL_SECONDS", "30"))
+
+    def __init__(
+        self: Self,
+        logger: WorkflowLogger,
+        stop_event: Optional[threading.Event] = None,
+        lease_check: Optional[Callable[[], bool]] = None
+    ) -> None:
+        super().__init__(logger, stop_event, lease_check)
+        self.legifrance_service = LegifranceService(
+            LegifranceTextCacheService(),
+            LegifranceResponseCacheService()
+        )
+        self.manifest_service = LegifranceManifestService()
 
     async def run(self: Self, predict_only: bool = False) -> None:
         await super().run()
         self.logger.info("Step 1: Loading JSON referential...")
         sources_dict = self.load_json_referential()
-        codes_to_load = sources_dict["codes"]
+        sources, referential_errors = self.sources_from_referential(sources_dict)
+        for error in referential_errors:
+            self.logger.warning(f"Step 1: source skipped, {error}")
         self.logger.info("Step 1: JSON referential loaded.")
 
-        self.logger.info("Step 2: Downloading codes from Legifrance API...")
-        with tempfile.TemporaryDirectory() as tmp_dir:
-            for code_name in codes_to_load:
-                self.logger.info(f"Step 2: Downloading code {code_name} from Legifrance API...")
-                self.legifrance_service.download_code(code_name, tmp_dir)
-                self.logger.info("Step 2: Code {code_name} downloaded.")
-
-            store_client = QdrantCollection(
-                self.embedding_model_info.vector_dimensions)
-            vector_store = VectorStore(
-                store_client,
-                self.embedding_model_info,
-                self.generator_model_info
-            )
-
-            if predict_only:
-                vector_store.predict_costs_for_embedding_files(tmp_dir)
+        store_client = QdrantCollection(
+            self.embedding_model_info.vector_dimensions)
+        vector_store = VectorStore(
+            store_client,
+            self.embedding_model_info,
+            self.generator_model_info
+        )
+        manifest = self.manifest_service.read()
+
+        self.logger.info(
+            f"Step 2: Downloading {len(sources)} sources from Legifrance API...")
+        await asyncio.to_thread(
+            self.legifrance_service.prefetch, sources, self.stop_event)
+        self.logger.info("Step 2: Sources downloaded.")
+
+        self.logger.info("Step 3: Syncing sources...")
+        for source in sources:
+            if self.is_stop_requested():
+                break
+            try:
+                await self.sync_source(
+                    source, manifest, store_client, vector_store, predict_only)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                # Aborts the run instead if its lease was lost meanwhile
+                await self.ensure_lease_held()
+                # The articles indexed so far are kept, the rest is retried next run
+                self.logger.error(f"Step 3: {source.name} skipped: {e}")
+
+        if self.is_stop_requested():
+            self.logger.info("Workflow stopped: synced articles have been saved.")
+            return
+        self.logger.info("Workflow complete.")
+
+    async def sync_source(
+        self: Self,
+        source: LegifranceSource,
+        manifest: dict,
+        store_client: QdrantCollection,
+        vector_store: VectorStore,
+        predict_only: bool
+    ) -> None:
+        code_name = source.name
+        code_title, articles = await asyncio.to_thread(
+            self.legifrance_service.iter_source, source)
+
+        code_manifest = manifest.get(code_name, {})
+        new_code_manifest = {}
+        changed_articles = []
+        dropped_states: Counter[str] = Counter()
+        nb_dropped_tokens = 0
+        for section_path, article in articles:
+            if not self.is_article_kept(article):
+                dropped_states[article.etat] += 1
+                nb_dropped_tokens += AsyncOpenAIEmbedder.estimate_tokens(article.content)
+                continue
+
+            article_hash = self.legifrance_service.article_hash(
+                section_path, article)
+            new_code_manifest[article.id] = {
+                "cid": article.cid,
+                "hash": article_hash
+            }
+            previous_entry = code_manifest.get(article.id)
+            if (
+                previous_entry is not None
+                and previous_entry["hash"] == article_hash
+                and "pointIds" in previous_entry
+            ):
+                new_code_manifest[article.id]["pointIds"] = previous_entry["pointIds"]
+            else:
+                changed_articles.append((section_path, article))
+
+        removed_article_ids = set(code_manifest) - set(new_code_manifest)
+        nb_added = sum(
+            1 for _, article in changed_articles
+            if article.id not in code_manifest
+        )
+        self.logger.info(
+            f"Step 3: {code_name}: {nb_added} added, "
+            f"{len(changed_articles) - nb_added} modified, "
+            f"{len(removed_article_ids)} removed, "
+            f"{len(new_code_manifest) - len(changed_articles)} unchanged articles skipped.")
+        self.log_dropped_articles(code_name, dropped_states, nb_dropped_tokens)
+
+        article_texts = self.legifrance_service.extract_article_texts(
+            [article for _, article in changed_articles])
+
+        if predict_only:
+            # Planned per article, like the ingestion run will
+            vector_store.predict_costs_for_documents([
+                self.legifrance_service.article_document(
+                    code_title, section_path, article, article_texts[article.id])
+                for section_path, article in changed_articles
+            ])
+            return
+
+        await self.ensure_lease_held()
+        if source.kind == "code" and code_name not in manifest:
+            # First article-level run: drop the points indexed from the
+            # former whole-code text file
+            await vector_store.delete_vectors_for_source(
+                self.collection_name, self.legacy_filename(code_name))
+
+        removed_point_ids = [
+            point_id
+            for article_id in removed_article_ids
+            for point_id in code_manifest[article_id].get("pointIds", [])
+        ]
+        await store_client.delete_points(
+            self.collection_name, removed_point_ids)
+
+        # The checkpoint is the previous manifest of the code, updated as
+        # articles are indexed: if the run is stopped or crashes, the
+        # next one only indexes the articles which are not in it yet.
+        checkpoint = {
+            article_id: entry for article_id, entry in code_manifest.items()
+            if article_id not in removed_article_ids
+        }
+        manifest[code_name] = checkpoint
+        await self.save_manifest(manifest)
+        last_checkpoint_time = time.monotonic()
+
+        async def record_indexed_article(article_id: str, point_ids: set[str]) -> None:
+            nonlocal last_checkpoint_time
+            checkpoint[article_id] = {
+                **new_code_manifest[article_id],
+                "pointIds": sorted(point_ids)
+            }
+            if time.monotonic() - last_checkpoint_time >= self.CHECKPOINT_INTERVAL_SECONDS:
+                await self.save_manifest(manifest)
+                last_checkpoint_time = time.monotonic()
+
+        await vector_store.build_from_documents(
+            self.collection_name,
+            self.article_documents(code_title, changed_articles, article_texts),
+            known_point_ids={
+                article.id: set(code_manifest.get(article.id, {}).get("pointIds", []))
+                for _, article in changed_articles
+            },
+            on_source_indexed=record_indexed_article,
+            before_upsert=self.ensure_lease_held
+        )
+
+        if self.is_stop_requested():
+            await self.save_manifest(manifest)
+            return
+
+        for _, article in changed_articles:
+            new_code_manifest[article.id]["pointIds"] = checkpoint[article.id]["pointIds"]
+        manifest[code_name] = new_code_manifest
+        await self.save_manifest(manifest)
+        self.logger.info(f"Step 3: {code_name} synced.")
+
+    async def save_manifest(self: Self, manifest: dict) -> None:
+        await self.ensure_lease_held()
+        await asyncio.to_thread(self.manifest_service.write, manifest)
+
+    def is_article_kept(self: Self, article: Article) -> bool:
+        return article.etat in self.ARTICLE_STATES
+
+    def log_dropped_articles(
+        self: Self,
+        code_name: str,
+        dropped_states: Counter[str],
+        nb_dropped_tokens: int
+    ) -> None:
+        """
+        Report what the article state filter saves on this code. Tokens are
+        estimated from the HTML content: dropped articles are not extracted.
+        """
+        if not dropped_states:
+            return
+        self.logger.info(
+            f"Step 3: {code_name}: {dropped_states.total()} articles not indexed "
+            f"({', '.join(f'{nb} {state}' for state, nb in dropped_states.most_common())}), "
+            f"~{HumanNumber.format(nb_dropped_tokens)} tokens saved.")
+
+    @staticmethod
+    def sources_from_referential(
+        sources_dict: dict
+    ) -> Tuple[List[LegifranceSource], List[str]]:
+        """ Sources listed in the referential, each one only once, and invalid entries """
+        sources = [
+            LegifranceSource(kind="code", name=code_name)
+            for code_name in sources_dict.get("codes", [])
+        ]
+        errors = []
+        for kind, key in [("decret", "decrets"), ("arrete", "arretes")]:
+            for entry in sources_dict.get(key, []):
+                try:
+                    sources.append(LegifranceSource(
+                        kind=kind, name=entry["name"], text_id=entry.get("id")))
+                except ValidationError as e:
+                    errors.append(str(e.errors()[0]["msg"]))
+        return list({source.key: source for source in sources}.values()), errors
+
+    async def article_documents(
+        self: Self,
+        code_title: str,
+        articles: List[Tuple[List[str], Article]],
+        article_texts: dict[str, str]
+    ) -> AsyncIterator[SourceDocument]:
+        for section_path, article in articles:
+            if self.is_stop_requested():
+                # The articles already sent are still indexed
                 return
+            yield self.legifrance_service.article_document(
+                code_title, section_path, article, article_texts[article.id])
 
-            await vector_store.build_from_directory_files(
-                self.collection_name, tmp_dir)
+    @staticmethod
+    def legacy_filename(code_name: str) -> str:
+        filename = unidecode(code_name).lower().replace(" ", "_")
+        return f"{filename}.txt"
 
     def load_json_referential(self: Self) -> dict:
         data_storage_path = PathFinder.data_definition()
@@ -1,14 +1,26 @@
-from typing import Self
+import asyncio
+import threading
+from typing import Self, Optional, Callable
 from abc import ABC, abstractmethod
 
 from mevy_bot.models.openai import OpenAIModelFactory
+from mevy_bot.exceptions.workflows import LeaseLostError
 from mevy_bot.etl.workflow_logger import WorkflowLogger
 
 
 class WorkflowEtl(ABC):
 
-    def __init__(self: Self, workflow_logger: WorkflowLogger) -> None:
+    def __init__(
+        self: Self,
+        workflow_logger: WorkflowLogger,
+        stop_event: Optional[threading.Event] = None,
+        lease_check: Optional[Callable[[], bool]] = None
+    ) -> None:
         self.logger = workflow_logger
+        # Set to stop the run once its in-flight work is saved
+        self.stop_event = stop_event or threading.Event()
+        # Whether the run still holds the lease (and fencing token) of its workflow
+        self.lease_check = lease_check
         self.embedding_model_info = OpenAIModelFactory.text_embedding_3_small()
         self.generator_model_info = OpenAIModelFactory.gpt4o_mini()
         self.collection_name = "mevy_bot"
@@ -17,5 +29,16 @@ class WorkflowEtl(ABC):
     async def run(self: Self, predict_only: bool = False) -> None:
         self.logger.info(f"Starting workflow {self.__class__.__name__}")
     
+    def is_stop_requested(self: Self) -> bool:
+        return self.stop_event.is_set()
+
+    async def ensure_lease_held(self: Self) -> None:
+        """
+        Called before each write to the vector store or checkpoint: raise
+        LeaseLostError once another worker has taken the workflow over.
+        """
+        if self.lease_check is not None and not await asyncio.to_thread(self.lease_check):
+            raise LeaseLostError()
+
     def get_workflow_logger(self: Self) -> WorkflowLogger:
         return self.logger
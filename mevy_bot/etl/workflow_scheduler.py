@@ -0,0 +1,335 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from datetime import datetime, timedelta, timezone
+from typing import Self, Optional, Callable
+
+from redis import RedisError
+
+from mevy_bot.models.workflows import WorkflowInfo
+from mevy_bot.exceptions.workflows import JobActiveError
+from mevy_bot.services.workflow_lease_service import WorkflowLeaseService
+from mevy_bot.etl.cron_schedule import CronSchedule
+from mevy_bot.factories.workflow_factory import WorkflowFactory
+
+l = logging.getLogger(__name__)
+
+
+class WorkflowScheduler:
+    """
+    Run workflows on their own schedule from the application event loop.
+
+    A workflow declares either a cron expression or a triggerInterval in
+    triggerIntervalUnit. A run never overlaps the previous one of the same
+    workflow: a run that outlasts its interval delays the next one instead
+    of stacking up. Runs execute on a bounded thread pool, each with its
+    own event loop, so that ETLs never block the API.
+
+    With a lease service, a workflow is scheduled by a single worker of the
+    cluster: the one holding its lease, renewed for as long as it is
+    scheduled there and until its last run is over. Runs check the lease
+    before each write and abort once it is lost. The start of its last
+    successful run is saved next to the lease, so a restart does not run it
+    early. A failed run is retried after RETRY_DELAY_SECONDS, doubled at
+    each consecutive failure up to MAX_RETRY_DELAY_SECONDS, unless its next
+    scheduled run comes first.
+    """
+
+    MAX_WORKERS = int(os.getenv("WORKFLOW_MAX_WORKERS", "2"))
+    JITTER_FRACTION = 0.1
+    MAX_JITTER_SECONDS = 60
+    RETRY_DELAY_SECONDS = int(os.getenv("WORKFLOW_RETRY_DELAY_SECONDS", "60"))
+    MAX_RETRY_DELAY_SECONDS = int(
+        os.getenv("WORKFLOW_MAX_RETRY_DELAY_SECONDS", str(6 * 60 * 60)))
+    INTERVAL_UNITS_SECONDS = {
+        "seconds": 1,
+        "minutes": 60,
+        "hours": 60 * 60,
+        "days": 24 * 60 * 60
+    }
+
+    def __init__(self: Self, lease_service: Optional[WorkflowLeaseService] = None) -> None:
+        self.lease_service = lease_service
+        self.workflows: dict[int, WorkflowInfo] = {}
+        # Kept after stop: a stopped workflow may still be completing a run
+        self._runs: dict[int, Future] = {}
+        self._run_stop_events: dict[int, threading.Event] = {}
+        self._release_tasks: set[asyncio.Task] = set()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    async def start(self: Self, workflow: dict) -> None:
+        """
+        Schedule workflow. Its first run is right away, unless its last run
+        was less than an interval ago. Raises ValueError on an invalid
+        schedule.
+        """
+        self.validate_schedule(workflow)
+        fencing_token = None
+        if self.lease_service is not None:
+            fencing_token = await asyncio.to_thread(
+                self.lease_service.acquire, workflow["id"])
+            if fencing_token is None:
+                raise JobActiveError()
+
+        loop = asyncio.get_running_loop()
+        schedule_task = loop.create_task(
+            self._schedule_loop(workflow), name=f"workflow-{workflow['id']}")
+        workflow_info = WorkflowInfo(schedule_task, fencing_token=fencing_token)
+        self.workflows[workflow["id"]] = workflow_info
+        if fencing_token is not None:
+            workflow_info.heartbeat_task = loop.create_task(
+                self._heartbeat_loop(workflow["id"], fencing_token))
+
+    def stop(self: Self, workflow_id: int, release_lease: bool = True) -> None:
+        """
+        Cancel the next runs and ask the run in progress to stop: it saves
+        its in-flight work and returns, the next run resumes from there.
+        """
+        workflow_info = self.workflows.pop(workflow_id)
+        workflow_info.schedule_task.cancel()
+        run_stop_event = self._run_stop_events.get(workflow_id)
+        if run_stop_event is not None:
+            run_stop_event.set()
+        if workflow_info.fencing_token is not None and release_lease:
+            # The lease is kept, and renewed, until the run in progress is over
+            release_task = asyncio.get_running_loop().create_task(self._release_when_idle(
+                workflow_id, workflow_info.fencing_token, workflow_info.heartbeat_task))
+            self._release_tasks.add(release_task)
+            release_task.add_done_callback(self._release_tasks.discard)
+        elif workflow_info.heartbeat_task is not None:
+            workflow_info.heartbeat_task.cancel()
+
+    async def shutdown(self: Self, timeout_seconds: float = 5) -> None:
+        """
+        Stop the workflows scheduled here. Leases still held by a run in
+        progress after timeout_seconds expire on their own.
+        """
+        for workflow_id in list(self.workflows):
+            self.stop(workflow_id)
+        if self._release_tasks:
+            await asyncio.wait(self._release_tasks, timeout=timeout_seconds)
+
+    async def request_stop(self: Self, workflow_id: int) -> None:
+        """ Stop the workflow, wherever it is scheduled in the cluster """
+        if workflow_id in self.workflows:
+            self.stop(workflow_id)
+        elif self.lease_service is not None:
+            await asyncio.to_thread(self.lease_service.request_stop, workflow_id)
+
+    def is_active(self: Self, workflow_id: int) -> bool:
+        """
+        Whether the workflow is scheduled, by this worker or another one.
+        Blocking: reads the lease from Redis.
+        """
+        if workflow_id in self.workflows:
+            return True
+        return (
+            self.lease_service is not None
+            and self.lease_service.get_owner(workflow_id) is not None
+        )
+
+    def status(self: Self, workflow_id: int) -> dict:
+        """ Blocking: reads the lease from Redis, once """
+        owner = None
+        if self.lease_service is not None:
+            owner = self.lease_service.get_owner(workflow_id)
+        workflow_info = self.workflows.get(workflow_id)
+        if workflow_info is None:
+            # Unknown here when scheduled by another worker
+            return {"isActive": owner is not None, "nextRun": None, "lastRun": None,
+                    "lastRunDuration": None, "isRunning": None if owner else False,
+                    "owner": owner}
+        return {
+            "isActive": True,
+            "nextRun": workflow_info.next_run,
+            "lastRun": workflow_info.last_run,
+            "lastRunDuration": workflow_info.last_duration_seconds,
+            "isRunning": workflow_info.is_running,
+            "owner": owner
+        }
+
+    @classmethod
+    def next_run_time(
+        cls,
+        workflow: dict,
+        last_run: Optional[datetime],
+        now: datetime,
+        nb_failed_runs: int = 0
+    ) -> datetime:
+        if workflow.get("cron"):
+            next_run = CronSchedule(workflow["cron"]).next_after(now)
+            period = next_run - now
+        else:
+            period = timedelta(seconds=cls.interval_seconds(workflow))
+            # A late run starts now, missed runs are not caught up
+            next_run = now if last_run is None else max(last_run + period, now)
+        if nb_failed_runs > 0:
+            retry_delay_seconds = min(
+                cls.RETRY_DELAY_SECONDS * 2 ** (nb_failed_runs - 1),
+                cls.MAX_RETRY_DELAY_SECONDS
+            )
+            next_run = min(next_run, now + timedelta(seconds=retry_delay_seconds))
+            period = min(period, timedelta(seconds=retry_delay_seconds))
+        # Spread the runs of workflows due at the same time
+        jitter_seconds = random.uniform(
+            0, min(period.total_seconds() * cls.JITTER_FRACTION, cls.MAX_JITTER_SECONDS))
+        return next_run + timedelta(seconds=jitter_seconds)
+
+    @classmethod
+    def validate_schedule(cls, workflow: dict) -> None:
+        if workflow.get("cron"):
+            CronSchedule(workflow["cron"])
+        elif cls.interval_seconds(workflow) <= 0:
+            raise ValueError(
+                f"Trigger interval must be positive: {workflow['triggerInterval']!r}")
+
+    @classmethod
+    def interval_seconds(cls, workflow: dict) -> int:
+        unit = workflow.get("triggerIntervalUnit", "minutes")
+        if unit not in cls.INTERVAL_UNITS_SECONDS:
+            raise ValueError(f"Unknown trigger interval unit {unit!r}")
+        return workflow["triggerInterval"] * cls.INTERVAL_UNITS_SECONDS[unit]
+
+    async def _schedule_loop(self: Self, workflow: dict) -> None:
+        workflow_info = self.workflows[workflow["id"]]
+        workflow_info.last_run = await self._read_last_run(workflow["id"])
+        while True:
+            now = datetime.now(timezone.utc)
+            workflow_info.next_run = self.next_run_time(
+                workflow, workflow_info.last_run, now, workflow_info.nb_failed_runs)
+            l.info("Next run of workflow %d at %s",
+                   workflow["id"], workflow_info.next_run.isoformat())
+            await asyncio.sleep((workflow_info.next_run - now).total_seconds())
+
+            if workflow_info.fencing_token is not None and not await self._renew_lease(
+                    workflow["id"], workflow_info.fencing_token):
+                l.error("Lease of workflow %d lost, not running it.", workflow["id"])
+                return
+
+            workflow_info.next_run = None
+            workflow_info.last_run = datetime.now(timezone.utc)
+            workflow_info.is_running = True
+            start_time = time.perf_counter()
+            try:
+                previous_run = self._runs.get(workflow["id"])
+                if previous_run is not None and not previous_run.done():
+                    l.info("Waiting for the previous run of workflow %d...", workflow["id"])
+                    await asyncio.wrap_future(previous_run)
+                run_stop_event = threading.Event()
+                run = self._get_executor().submit(
+                    self.run_workflow, workflow["id"], run_stop_event,
+                    self._lease_check(workflow["id"], workflow_info.fencing_token))
+                self._runs[workflow["id"]] = run
+                self._run_stop_events[workflow["id"]] = run_stop_event
+                await asyncio.wrap_future(run)
+            except Exception:  # pylint: disable=broad-exception-caught
+                # Not saved as the last run: a restart runs it right away
+                workflow_info.nb_failed_runs += 1
+                l.exception("Workflow %d failed (%d in a row), retrying it sooner",
+                            workflow["id"], workflow_info.nb_failed_runs)
+            else:
+                workflow_info.nb_failed_runs = 0
+                await self._save_last_run(workflow["id"], workflow_info.last_run)
+            finally:
+                workflow_info.is_running = False
+                workflow_info.last_duration_seconds = time.perf_counter() - start_time
+
+    async def _renew_lease(self: Self, workflow_id: int, fencing_token: int) -> bool:
+        """ Heartbeat before a run, retried while Redis is unreachable """
+        assert self.lease_service is not None
+        while True:
+            try:
+                return await asyncio.to_thread(
+                    self.lease_service.heartbeat, workflow_id, fencing_token)
+            except RedisError as exc:
+                l.warning("Heartbeat of workflow %d failed, retrying: %s", workflow_id, exc)
+                await asyncio.sleep(self.lease_service.HEARTBEAT_INTERVAL_SECONDS)
+
+    def _lease_check(
+        self: Self,
+        workflow_id: int,
+        fencing_token: Optional[int]
+    ) -> Optional[Callable[[], bool]]:
+        if self.lease_service is None or fencing_token is None:
+            return None
+        return functools.partial(self.lease_service.is_held, workflow_id, fencing_token)
+
+    async def _read_last_run(self: Self, workflow_id: int) -> Optional[datetime]:
+        if self.lease_service is None:
+            return None
+        try:
+            return await asyncio.to_thread(self.lease_service.get_last_run, workflow_id)
+        except RedisError as exc:
+            l.warning("Last run of workflow %d unknown: %s", workflow_id, exc)
+            return None
+
+    async def _save_last_run(self: Self, workflow_id: int, last_run: datetime) -> None:
+        if self.lease_service is None:
+            return
+        try:
+            await asyncio.to_thread(self.lease_service.set_last_run, workflow_id, last_run)
+        except RedisError as exc:
+            l.warning("Last run of workflow %d not saved: %s", workflow_id, exc)
+
+    async def _heartbeat_loop(self: Self, workflow_id: int, fencing_token: int) -> None:
+        """ Renew the lease, stop the workflow if asked to or if the lease is lost """
+        assert self.lease_service is not None
+        while True:
+            await asyncio.sleep(self.lease_service.HEARTBEAT_INTERVAL_SECONDS)
+            try:
+                is_lease_held = await asyncio.to_thread(
+                    self.lease_service.heartbeat, workflow_id, fencing_token)
+                is_stop_requested = is_lease_held and await asyncio.to_thread(
+                    self.lease_service.is_stop_requested, workflow_id)
+            except RedisError as exc:
+                # The lease expires if Redis stays unreachable for its whole TTL
+                l.warning("Heartbeat of workflow %d failed: %s", workflow_id, exc)
+                continue
+
+            workflow_info = self.workflows.get(workflow_id)
+            if workflow_info is None or workflow_info.fencing_token != fencing_token:
+                # Stopped here: keep renewing until the lease is released
+                continue
+            if not is_lease_held:
+                l.error("Lease of workflow %d lost, unscheduling it.", workflow_id)
+                self.stop(workflow_id, release_lease=False)
+                return
+            if is_stop_requested:
+                l.info("Stop of workflow %d requested by another worker.", workflow_id)
+                self.stop(workflow_id)
+                return
+
+    async def _release_when_idle(
+        self: Self,
+        workflow_id: int,
+        fencing_token: int,
+        heartbeat_task: Optional[asyncio.Task]
+    ) -> None:
+        assert self.lease_service is not None
+        run = self._runs.get(workflow_id)
+        if run is not None and not run.done():
+            await asyncio.wait([asyncio.wrap_future(run)])
+        if heartbeat_task is not None:
+            heartbeat_task.cancel()
+        await asyncio.to_thread(self.lease_service.release, workflow_id, fencing_token)
+
+    @staticmethod
+    def run_workflow(
+        workflow_id: int,
+        stop_event: threading.Event,
+        lease_check: Optional[Callable[[], bool]] = None
+    ) -> None:
+        # Built for each run: async clients are bound to the run's event loop
+        workflow = WorkflowFactory.create_workflow(workflow_id, stop_event, lease_check)
+        asyncio.run(workflow.run())
+
+    def _get_executor(self: Self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                self.MAX_WORKERS, thread_name_prefix="workflow")
+        return self._executor
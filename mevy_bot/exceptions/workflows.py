@@ -3,3 +3,6 @@ class JobActiveError(Exception):
 
 class JobNotActiveError(Exception):
     pass
+
+class LeaseLostError(Exception):
+    pass
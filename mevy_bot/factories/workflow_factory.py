@@ -1,4 +1,6 @@
 import logging
+import threading
+from typing import Optional, Callable
 
 from mevy_bot.etl.workflow_etl import WorkflowEtl
 from mevy_bot.etl.gdrive_etl import GdriveEtl
@@ -11,13 +13,17 @@ l = logging.getLogger()
 class WorkflowFactory():
 
     @staticmethod
-    def create_workflow(workflow_id: int) -> WorkflowEtl:
+    def create_workflow(
+        workflow_id: int,
+        stop_event: Optional[threading.Event] = None,
+        lease_check: Optional[Callable[[], bool]] = None
+    ) -> WorkflowEtl:
         workflow_logger = WorkflowLogger(workflow_id)
         if workflow_id == 1:
             l.info("Instanciating Google Drive Workflow...")
-            return GdriveEtl(workflow_logger)
+            return GdriveEtl(workflow_logger, stop_event, lease_check)
         elif workflow_id == 2:
             l.info("Instanciating Legifrance Workflow...")
-            return LegifranceEtl(workflow_logger)
+            return LegifranceEtl(workflow_logger, stop_event, lease_check)
         else:
             raise ValueError(f"Workflow with id {workflow_id} does not exist.")
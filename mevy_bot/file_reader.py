@@ -1,14 +1,55 @@
 from collections import deque
 import io
-from typing import Self, List
+import os
+import hashlib
+import logging
+import multiprocessing
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Self, List, Iterator, Optional, Callable
 
 from PyPDF2 import PdfReader
 
 from mevy_bot.exceptions.unsupported_file_type_error import UnsupportedFileTypeError
+from mevy_bot.services.pdf_page_cache_service import PdfPageCacheService
+
+l = logging.getLogger(__name__)
+
+
+# Last PDF opened by each thread, pool workers included: the batches of a
+# file reuse its reader instead of parsing the file again for each batch
+_pdf_readers = threading.local()
+
+
+def open_pdf(filepath: str, file_hash: str) -> PdfReader:
+    if getattr(_pdf_readers, "file_hash", None) != file_hash:
+        _pdf_readers.reader = PdfReader(filepath)
+        _pdf_readers.file_hash = file_hash
+    return _pdf_readers.reader
+
+
+def extract_pdf_pages(filepath: str, file_hash: str, page_numbers: List[int]) -> List[str]:
+    # Module level so that it can be sent to pool worker processes
+    pdf_reader = open_pdf(filepath, file_hash)
+    return [pdf_reader.pages[page_number].extract_text() or "" for page_number in page_numbers]
 
 
 class FileReader:
 
+    PDF_EXTRACTION_WORKERS = int(
+        os.getenv("PDF_EXTRACTION_WORKERS", str(os.cpu_count() or 1)))
+    PAGES_PER_TASK = 8
+    # Google Docs are exported as plain text
+    TEXT_MIME_TYPES = {"text/plain", "application/vnd.google-apps.document"}
+
+    _executor: Optional[ProcessPoolExecutor] = None
+    _executor_lock = threading.Lock()
+
+    def __init__(self: Self, page_cache: Optional[PdfPageCacheService] = None) -> None:
+        self.page_cache = page_cache
+
     def detect_format_and_read(self: Self, filepath: str) -> str:
         if filepath.endswith('.txt'):
             file_text = self.read_text_from_txt(filepath)
@@ -25,20 +66,142 @@ class FileReader:
         return file_text
 
     def read_text_from_pdf(self: Self, filepath: str) -> str:
-        pdf_reader = PdfReader(filepath)
-        file_text = ""
-        with open(filepath, 'rb') as f:
-            for page in pdf_reader.pages:
-                file_text += page.extract_text()
+        return "".join(self.iter_pdf_pages(filepath))
+
+    def detect_format_and_read_bytes(
+        self: Self,
+        file_content: bytes,
+        filename: str,
+        mime_type: Optional[str] = None
+    ) -> str:
+        """ Same as detect_format_and_read for a file held in memory """
+        if filename.endswith('.txt') or mime_type in self.TEXT_MIME_TYPES:
+            file_text = file_content.decode('utf8')
+        elif filename.endswith('.pdf'):
+            file_text = "".join(self.iter_pdf_pages_from_bytes(file_content))
+        else:
+            raise UnsupportedFileTypeError(filename)
+
         return file_text
 
+    def iter_pdf_pages(self: Self, filepath: str) -> Iterator[str]:
+        """
+        Yield the text of each page in order, as soon as it is available.
+
+        Pages missing from the page cache are extracted PAGES_PER_TASK at a
+        time across a process pool.
+        """
+        file_hash = self.file_hash(filepath)
+
+        def extract_batches(batches: List[List[int]]) -> Iterator[List[str]]:
+            if len(batches) > 1 and self.PDF_EXTRACTION_WORKERS > 1:
+                return self._get_executor().map(
+                    extract_pdf_pages, repeat(filepath), repeat(file_hash), batches)
+            return map(extract_pdf_pages, repeat(filepath), repeat(file_hash), batches)
+
+        yield from self._iter_cached_pages(
+            file_hash,
+            len(open_pdf(filepath, file_hash).pages),
+            extract_batches,
+            os.path.basename(filepath)
+        )
+
+    def iter_pdf_pages_from_bytes(self: Self, pdf_bytes: bytes) -> Iterator[str]:
+        """
+        Same as iter_pdf_pages for a PDF held in memory. It is written to a
+        temporary file for the process pool, so that its pages are not
+        extracted in the calling thread.
+        """
+        pdf_reader = PdfReader(io.BytesIO(pdf_bytes))
+        file_hash = hashlib.sha256(pdf_bytes).hexdigest()
+
+        def extract_batches(batches: List[List[int]]) -> Iterator[List[str]]:
+            if len(batches) > 1 and self.PDF_EXTRACTION_WORKERS > 1:
+                yield from self._extract_spilled_batches(pdf_bytes, file_hash, batches)
+                return
+            for batch in batches:
+                yield [pdf_reader.pages[page_number].extract_text() or "" for page_number in batch]
+
+        yield from self._iter_cached_pages(
+            file_hash,
+            len(pdf_reader.pages),
+            extract_batches,
+            "in-memory PDF"
+        )
+
+    def _extract_spilled_batches(
+        self: Self,
+        pdf_bytes: bytes,
+        file_hash: str,
+        batches: List[List[int]]
+    ) -> Iterator[List[str]]:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filepath = os.path.join(tmp_dir, f"{file_hash}.pdf")
+            with open(filepath, "wb") as f:
+                f.write(pdf_bytes)
+            yield from self._get_executor().map(
+                extract_pdf_pages, repeat(filepath), repeat(file_hash), batches)
+
+    def _iter_cached_pages(
+        self: Self,
+        file_hash: str,
+        nb_pages: int,
+        extract_batches: Callable[[List[List[int]]], Iterator[List[str]]],
+        display_name: str
+    ) -> Iterator[str]:
+        if self.page_cache is not None:
+            page_texts = self.page_cache.get_pages(file_hash, nb_pages)
+        else:
+            page_texts = [None] * nb_pages
+
+        missing_pages = [
+            page_number for page_number, text in enumerate(page_texts) if text is None
+        ]
+        batches = [
+            missing_pages[i:i + self.PAGES_PER_TASK]
+            for i in range(0, len(missing_pages), self.PAGES_PER_TASK)
+        ]
+        if batches:
+            l.info("Extracting %d/%d pages [%s]",
+                   len(missing_pages), nb_pages, display_name)
+        batches_texts = extract_batches(batches)
+
+        extracted_texts: dict[int, str] = {}
+        batches_iter = iter(batches)
+        for page_number, text in enumerate(page_texts):
+            if text is None:
+                # Batches are in page order, so the page is in the next ones
+                while page_number not in extracted_texts:
+                    batch = next(batches_iter)
+                    texts = next(batches_texts)
+                    extracted_texts.update(zip(batch, texts))
+                    if self.page_cache is not None:
+                        self.page_cache.put_pages(file_hash, batch, texts)
+                text = extracted_texts.pop(page_number)
+            yield text
+
     def read_text_from_pdf_as_bytes(self: Self, pdf_bytes: bytes) -> str:
-        pdf_stream = io.BytesIO(pdf_bytes)
-        pdf_reader = PdfReader(pdf_stream)
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text() or ""
-        return text
+        return "".join(self.iter_pdf_pages_from_bytes(pdf_bytes))
+
+    @staticmethod
+    def file_hash(filepath: str) -> str:
+        digest = hashlib.sha256()
+        with open(filepath, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @classmethod
+    def _get_executor(cls) -> ProcessPoolExecutor:
+        if cls._executor is None:
+            with cls._executor_lock:
+                if cls._executor is None:
+                    # Spawned workers: forking the threaded ETL process is unsafe
+                    cls._executor = ProcessPoolExecutor(
+                        cls.PDF_EXTRACTION_WORKERS,
+                        mp_context=multiprocessing.get_context("spawn")
+                    )
+        return cls._executor
 
     @staticmethod
     def tail(file_path: str, n:int=1000) -> List[str]:
@@ -0,0 +1,61 @@
+import time
+from dataclasses import dataclass, field
+
+
+@dataclass
+class SourceDocument:
+    source_id: str
+    source_name: str
+    text: str
+    metadata: dict = field(default_factory=dict)
+
+
+@dataclass
+class TextChunk:
+    source_id: str
+    source_name: str
+    chunk_index: int
+    text: str
+    nb_tokens: int
+    point_id: str
+    metadata: dict = field(default_factory=dict)
+
+
+@dataclass
+class StageStats:
+    name: str
+    nb_items: int = 0
+    start_time: float = field(default_factory=time.perf_counter)
+    end_time: float | None = None
+
+    def add(self, nb_items: int) -> None:
+        self.nb_items += nb_items
+
+    def stop(self) -> None:
+        self.end_time = time.perf_counter()
+
+    @property
+    def elapsed_seconds(self) -> float:
+        end_time = self.end_time or time.perf_counter()
+        return end_time - self.start_time
+
+    @property
+    def throughput(self) -> float:
+        return self.nb_items / max(self.elapsed_seconds, 1e-9)
+
+
+@dataclass
+class ChunkPlan:
+    """ How a text is split into chunks, and how many tokens each chunk costs """
+    nb_tokens: int
+    nb_chars: int
+    chunk_offsets: list[tuple[int, int]]
+    chunk_token_counts: list[int]
+
+    def chunk_texts(self, text: str) -> list[str]:
+        return [text[start:end] for start, end in self.chunk_offsets]
+
+    @property
+    def nb_chunk_tokens(self) -> int:
+        """ Tokens actually sent for embedding (overlap included) """
+        return sum(self.chunk_token_counts)
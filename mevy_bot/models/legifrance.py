@@ -1,6 +1,6 @@
 from __future__ import annotations  # For recursive pydantic models
-from typing import List
-from pydantic import BaseModel
+from typing import ClassVar, List, Literal, Self, Tuple
+from pydantic import BaseModel, model_validator
 
 
 class Article(BaseModel):
@@ -30,10 +30,37 @@ class Code(BaseModel):
     nature: str
     sections: List[Section]
 
+
 class Law(BaseModel):
     id: str
     cid: str
     title: str
     modifDate: str
     nature: str
-    sections: List[Section]
\ No newline at end of file
+    sections: List[Section]
+
+
+class LegifranceSource(BaseModel):
+    """
+    Entry of the auto_sources.json referential. Décrets and arrêtés are
+    fetched by the LEGITEXT id of their consolidated version, which the
+    fetch layer resolves from one of their LEGIARTI articles or from their
+    JORFTEXT id when given those instead.
+    """
+    kind: Literal["code", "decret", "arrete"]
+    name: str
+    text_id: str | None = None
+
+    TEXT_ID_PREFIXES: ClassVar[Tuple[str, ...]] = ("LEGITEXT", "LEGIARTI", "JORFTEXT")
+
+    @model_validator(mode="after")
+    def check_text_id(self) -> Self:
+        if self.kind != "code" and not (self.text_id or "").startswith(self.TEXT_ID_PREFIXES):
+            raise ValueError(
+                f"{self.name}: a LEGITEXT, LEGIARTI or JORFTEXT id is required, "
+                f"got {self.text_id!r}")
+        return self
+
+    @property
+    def key(self) -> str:
+        return f"{self.kind}:{self.text_id or self.name}"
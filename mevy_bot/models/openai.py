@@ -12,6 +12,7 @@ class GenerativeAiModel:
 @dataclass
 class EmbeddingModel(GenerativeAiModel):
     vector_dimensions: int
+    max_tokens_per_request: int
 
 
 @dataclass
@@ -29,6 +30,7 @@ class OpenAIModelFactory:
             name="text-embedding-3-small",
             max_tokens_input=8191,
             vector_dimensions=1536,
+            max_tokens_per_request=300_000,
             price_per_1k_input_tokens=Decimal("0.000020")
         )
 
@@ -39,6 +41,7 @@ class OpenAIModelFactory:
             name="text-embedding-3-large",
             max_tokens_input=8191,
             vector_dimensions=3072,
+            max_tokens_per_request=300_000,
             price_per_1k_input_tokens=Decimal("0.000130")
         )
 
@@ -1,6 +1,15 @@
+import asyncio
+from datetime import datetime
 from dataclasses import dataclass
-from multiprocessing import Process
+from typing import Optional
 
 @dataclass
 class WorkflowInfo:
-    workflow_process: Process
+    schedule_task: asyncio.Task
+    next_run: Optional[datetime] = None
+    last_run: Optional[datetime] = None
+    last_duration_seconds: Optional[float] = None
+    nb_failed_runs: int = 0
+    is_running: bool = False
+    fencing_token: Optional[int] = None
+    heartbeat_task: Optional[asyncio.Task] = None
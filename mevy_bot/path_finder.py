@@ -31,6 +31,30 @@ class PathFinder:
     def data_storage_manual(cls) -> str:
         return os.path.join(cls.data_storage(), "manual")
     
+    @classmethod
+    def embedding_cache(cls) -> str:
+        return os.path.join(cls.data_storage(), "cache", "embeddings.sqlite3")
+
+    @classmethod
+    def chunk_plan_cache(cls) -> str:
+        return os.path.join(cls.data_storage(), "cache", "chunk_plans.sqlite3")
+
+    @classmethod
+    def legifrance_text_cache(cls) -> str:
+        return os.path.join(cls.data_storage(), "cache", "legifrance_texts.sqlite3")
+
+    @classmethod
+    def legifrance_response_cache(cls) -> str:
+        return os.path.join(cls.data_storage(), "cache", "legifrance")
+
+    @classmethod
+    def pdf_page_cache(cls) -> str:
+        return os.path.join(cls.data_storage(), "cache", "pdf_pages.sqlite3")
+
+    @classmethod
+    def gdrive_source_registry(cls) -> str:
+        return os.path.join(cls.data_storage(), "gdrive_sources.sqlite3")
+
     @classmethod
     def log_dirpath(cls) -> str:
         log_dirpath = os.getenv('LOGS_DIRPATH')
@@ -3,6 +3,7 @@ from http import HTTPStatus
 
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel, Field
+from redis import RedisError
 
 from mevy_bot.services.workflow_service import WorkflowService
 from mevy_bot.exceptions.workflows import JobActiveError, JobNotActiveError
@@ -20,33 +21,60 @@ class RunEtlWorkflowDto(BaseModel):
 @router.post("/{workflow_id}", dependencies=[Depends(CookieAuthentication())])
 async def start_workflow(workflow_id: int):
     try:
-        WorkflowService.start_workflow(workflow_id)
+        await WorkflowService.start_workflow(workflow_id)
     except JobActiveError as exc:
         raise HTTPException(
             status_code=HTTPStatus.BAD_REQUEST,
             detail="Workflow is already active."
         ) from exc
+    except ValueError as exc:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail=str(exc)
+        ) from exc
+    except RedisError as exc:
+        raise HTTPException(
+            status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+            detail="Workflow states cannot be read, Redis is unreachable."
+        ) from exc
 
 
 @router.delete("/{workflow_id}", dependencies=[Depends(CookieAuthentication())])
 async def stop_workflow(workflow_id: int):
     try:
-        WorkflowService.stop_workflow(workflow_id)
+        await WorkflowService.stop_workflow(workflow_id)
     except JobNotActiveError as exc:
         raise HTTPException(
             status_code=HTTPStatus.BAD_REQUEST,
             detail="Workflow is currently inactive."
         ) from exc
+    except RedisError as exc:
+        raise HTTPException(
+            status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+            detail="Workflow states cannot be read, Redis is unreachable."
+        ) from exc
 
 
 @router.get("/active", dependencies=[Depends(CookieAuthentication())])
 async def list_active_workflows():
-    return {"active": WorkflowService.list_active_workflows()}
+    try:
+        return {"active": await WorkflowService.list_active_workflows()}
+    except RedisError as exc:
+        raise HTTPException(
+            status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+            detail="Workflow states cannot be read, Redis is unreachable."
+        ) from exc
 
 
 @router.get("/all", dependencies=[Depends(CookieAuthentication())])
 async def list_workflows():
-    return WorkflowService.list_workflows()
+    try:
+        return await WorkflowService.list_workflows()
+    except RedisError as exc:
+        raise HTTPException(
+            status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+            detail="Workflow states cannot be read, Redis is unreachable."
+        ) from exc
 
 
 @router.get("/logs/{workflow_id}", dependencies=[Depends(CookieAuthentication())])
@@ -66,4 +94,10 @@ async def retrieve_logs(workflow_id: int):
 
 @router.get("/details/{workflow_id}", dependencies=[Depends(CookieAuthentication())])
 async def get_workflow_details(workflow_id: int):
-    return WorkflowService.get_workflow_by_id(workflow_id)
+    try:
+        return await WorkflowService.get_workflow_by_id(workflow_id)
+    except RedisError as exc:
+        raise HTTPException(
+            status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+            detail="Workflow states cannot be read, Redis is unreachable."
+        ) from exc
@@ -1,7 +1,8 @@
-import tempfile
+from urllib.parse import quote
+
 from fastapi import APIRouter
 
-from fastapi.responses import FileResponse
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
 from mevy_bot.services.legifrance_service import LegifranceService
@@ -16,12 +17,13 @@ class CodeDto(BaseModel):
 @router.post("/code")
 async def download_code(code_dto: CodeDto):
     legifrance_service = LegifranceService()
-    code_content = legifrance_service.fetch_code(code_dto.name)
-
-    with tempfile.NamedTemporaryFile(delete=False) as fp:
-        fp.write(code_content.encode('utf8'))
-
-        return FileResponse(
-            fp.name,
-            filename=f"{code_dto.name}.txt"
-        )
+    code = legifrance_service.fetch_code_model(code_dto.name)
+
+    # Streamed section by section, the whole code text is never built
+    return StreamingResponse(
+        (part.encode('utf8') for part in legifrance_service.iter_code_parts(code)),
+        media_type="text/plain; charset=utf-8",
+        headers={
+            "Content-Disposition": f"attachment; filename*=utf-8''{quote(code_dto.name)}.txt"
+        }
+    )
@@ -1,6 +1,7 @@
 """ REST API Entrypoint """
 import os
 import sys
+import asyncio
 import logging
 
 from contextlib import asynccontextmanager
@@ -18,7 +19,10 @@ from mevy_bot.routers import (
 )
 
 from mevy_bot.database.database_handler import DatabaseHandler
+from mevy_bot.embedder.tokenizer_registry import TokenizerRegistry
+from mevy_bot.models.openai import OpenAIModelFactory
 from mevy_bot.services.user_service import UserService
+from mevy_bot.services.workflow_service import WorkflowService
 from mevy_bot.authentication.authentication_handler import AuthenticationHandler
 
 logger = logging.getLogger(__name__)
@@ -65,8 +69,19 @@ async def lifespan(app: FastAPI):
         create_first_user(db_session)
     finally:
         db_session.close()
+
+    # Loading an encoding takes a while, keep it off the first chat query
+    try:
+        await asyncio.to_thread(TokenizerRegistry.warm_up, [
+            OpenAIModelFactory.text_embedding_3_small().name,
+            OpenAIModelFactory.gpt4o_mini().name
+        ])
+    except Exception as e:
+        logger.warning("Could not warm up tokenizers: %s", e)
     yield
 
+    await WorkflowService.shutdown()
+
 APP_MODE = os.environ.get("APP_MODE", "production").lower()
 
 if APP_MODE == "production":
@@ -1,7 +1,8 @@
 import logging
 import os
 import io
-from typing import Self
+import threading
+from typing import Self, Any, IO, List, Tuple
 
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseDownload
@@ -25,16 +26,34 @@ class GdriveService:
         'mimeType': KNOWLEDGE_FOLDER_MIMETYPE
     }
 
+    LIST_PAGE_SIZE = 1000
+    FILE_FIELDS = "id, name, modifiedTime, md5Checksum, mimeType, size, parents, trashed"
+    DOWNLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
     def __init__(self: Self) -> None:
         credentials_filepath = os.path.join(
             PathFinder.secrets(), 'credentials.json')
-        credentials = service_account.Credentials.from_service_account_file(
+        self.credentials = service_account.Credentials.from_service_account_file(
             credentials_filepath,
             scopes=[
                 'https://www.googleapis.com/auth/drive'
             ]
         )
-        self.service = build("drive", "v3", credentials=credentials)
+        self.service = build("drive", "v3", credentials=self.credentials)
+        self._thread_local = threading.local()
+
+    @property
+    def thread_service(self: Self) -> Any:
+        """
+        Drive client of the current thread: the underlying HTTP connection is
+        not thread-safe, so concurrent downloads each get their own.
+        """
+        service = getattr(self._thread_local, "service", None)
+        if service is None:
+            service = build("drive", "v3", credentials=self.credentials,
+                            cache_discovery=False)
+            self._thread_local.service = service
+        return service
 
     def retrieve_meta_file(self: Self) -> str:
         """ Retrieve meta file (one maximum)"""
@@ -62,13 +81,45 @@ class GdriveService:
         return self.list_files_in_folder(folder_id)
 
     def list_files_in_folder(self: Self, folder_id: str) -> dict:
-        raw_query = f"'{folder_id}' in parents"
+        raw_query = f"'{folder_id}' in parents and trashed = false"
+        files = []
+        page_token = None
+        while True:
+            # pylint: disable=maybe-no-member
+            results = self.service.files().list(
+                q=raw_query,
+                pageSize=self.LIST_PAGE_SIZE,
+                pageToken=page_token,
+                fields=f"nextPageToken, files({self.FILE_FIELDS})"
+            ).execute()
+            files.extend(results.get("files", []))
+            page_token = results.get("nextPageToken")
+            if page_token is None:
+                return {"files": files}
+
+    def get_start_page_token(self: Self) -> str:
+        """ Token of the current state of the drive, to list later changes from """
         # pylint: disable=maybe-no-member
-        results = self.service.files().list(
-            q=raw_query,
-            fields="files(id, name, modifiedTime, mimeType)"
-        ).execute()
-        return results
+        response = self.service.changes().getStartPageToken().execute()
+        return response["startPageToken"]
+
+    def list_changes(self: Self, page_token: str) -> Tuple[List[dict], str]:
+        """
+        All changes since page_token, and the token to list the next changes
+        from. Each change has a fileId, a removed flag and the file metadata.
+        """
+        changes = []
+        while True:
+            # pylint: disable=maybe-no-member
+            results = self.service.changes().list(
+                pageToken=page_token,
+                pageSize=self.LIST_PAGE_SIZE,
+                fields=f"nextPageToken, newStartPageToken, changes(fileId, removed, file({self.FILE_FIELDS}))"
+            ).execute()
+            changes.extend(results.get("changes", []))
+            if "newStartPageToken" in results:
+                return changes, results["newStartPageToken"]
+            page_token = results["nextPageToken"]
 
     def get_folder_id(self: Self, folder_name: str) -> str:
         raw_query = f"mimeType = '{self.KNOWLEDGE_FOLDER_MIMETYPE}' and name = '{folder_name}'"
@@ -88,35 +139,47 @@ class GdriveService:
         file_mime_type: str,
         target_dir: str
     ) -> None:
-        file_content = self.download_file(file_id, file_mime_type)
-        self.write_file(file_content, file_name, target_dir)
+        """ Stream the file to target_dir chunk by chunk """
+        file_path = os.path.join(target_dir, file_name)
+        with open(file_path, 'wb') as fp:
+            self.download_file_to(file_id, file_mime_type, fp)
 
     def download_file(self: Self, file_id: str, file_mime_type: str) -> bytes:
+        file = io.BytesIO()
+        self.download_file_to(file_id, file_mime_type, file)
+        return file.getvalue()
+
+    def download_file_to(
+        self: Self,
+        file_id: str,
+        file_mime_type: str,
+        fd: IO[bytes]
+    ) -> None:
+        """ Raises HttpError: fd then holds a partial file """
         logging.info("Trying to download file %s (mimeType: %s)", file_id, file_mime_type)
+        service = self.thread_service
         try:
             if file_mime_type == "application/vnd.google-apps.document":
                 # Export Google Docs as PDF
                 # pylint: disable=maybe-no-member
-                request = self.service.files().export_media(
+                request = service.files().export_media(
                     fileId=file_id, mimeType="text/plain"
                 )
             else:
                 # Download binary file directly
                 # pylint: disable=maybe-no-member
-                request = self.service.files().get_media(fileId=file_id)
+                request = service.files().get_media(fileId=file_id)
 
-            file = io.BytesIO()
-            downloader = MediaIoBaseDownload(file, request)
+            downloader = MediaIoBaseDownload(
+                fd, request, chunksize=self.DOWNLOAD_CHUNK_SIZE)
             done = False
             while done is False:
                 status, done = downloader.next_chunk()
                 logging.info("Download %s.", int(status.progress() * 100))
 
         except HttpError as error:
-            logging.error("Unknown error : %s", error)
-            return bytes()
-
-        return file.getvalue()
+            logging.error("Download of file %s failed: %s", file_id, error)
+            raise
 
     def write_file(
         self: Self,
@@ -0,0 +1,265 @@
+import os
+import json
+import logging
+import sqlite3
+import time
+import threading
+from typing import Self, List, Optional, Tuple, Iterable
+
+from mevy_bot.path_finder import PathFinder
+
+logger = logging.getLogger()
+
+
+class GdriveSourceRegistryService:
+    """
+    Google Drive files indexed in the vector store, stored in SQLite.
+
+    Each file is committed on its own, so a crash never loses the state of
+    the files already indexed. Replaces gdrive_known_files.json, which is
+    imported on first use.
+    """
+
+    # Files which could not be read are retried after a doubling delay
+    RETRY_DELAY_SECONDS = int(os.getenv("GDRIVE_RETRY_DELAY_SECONDS", str(15 * 60)))
+    MAX_RETRY_DELAY_SECONDS = int(
+        os.getenv("GDRIVE_MAX_RETRY_DELAY_SECONDS", str(24 * 60 * 60)))
+
+    def __init__(self: Self, filepath: Optional[str] = None) -> None:
+        self.filepath = filepath or PathFinder.gdrive_source_registry()
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(self.filepath), exist_ok=True)
+        self.connection = sqlite3.connect(
+            self.filepath, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                file_id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                modified_time TEXT NOT NULL,
+                md5_checksum TEXT,
+                mime_type TEXT,
+                point_ids TEXT NOT NULL
+            )
+            """
+        )
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sync_state (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+            """
+        )
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS failed_files (
+                file_id TEXT PRIMARY KEY,
+                file_data TEXT NOT NULL,
+                nb_attempts INTEGER NOT NULL,
+                next_attempt REAL NOT NULL,
+                error TEXT
+            )
+            """
+        )
+        self.connection.commit()
+
+    def get_files(self: Self, file_ids: Iterable[str]) -> dict[str, dict]:
+        """ Registered files among file_ids, by id """
+        with self._lock:
+            self._fill_lookup_table(file_ids)
+            rows = self.connection.execute(
+                """
+                SELECT files.* FROM files
+                JOIN lookup_ids ON lookup_ids.file_id = files.file_id
+                """
+            ).fetchall()
+            self.connection.commit()
+        return {row[0]: self._row_to_file(row) for row in rows}
+
+    def diff_listing(
+        self: Self,
+        knowledge_files: List[dict]
+    ) -> Tuple[List[dict], List[dict], List[dict]]:
+        """
+        Files to create, update and delete so that the registry matches a
+        full listing of the folder. Files to delete are registry entries.
+        """
+        listed_files = {file_data["id"]: file_data for file_data in knowledge_files}
+        with self._lock:
+            self._fill_lookup_table(listed_files)
+            self.connection.executemany(
+                "UPDATE lookup_ids SET modified_time = ? WHERE file_id = ?",
+                [(file_data["modifiedTime"], file_id)
+                 for file_id, file_data in listed_files.items()]
+            )
+            new_file_ids = self.connection.execute(
+                """
+                SELECT lookup_ids.file_id FROM lookup_ids
+                LEFT JOIN files ON files.file_id = lookup_ids.file_id
+                WHERE files.file_id IS NULL
+                """
+            ).fetchall()
+            modified_file_ids = self.connection.execute(
+                """
+                SELECT lookup_ids.file_id FROM lookup_ids
+                JOIN files ON files.file_id = lookup_ids.file_id
+                WHERE files.modified_time != lookup_ids.modified_time
+                """
+            ).fetchall()
+            deleted_rows = self.connection.execute(
+                """
+                SELECT files.* FROM files
+                LEFT JOIN lookup_ids ON lookup_ids.file_id = files.file_id
+                WHERE lookup_ids.file_id IS NULL
+                """
+            ).fetchall()
+            self.connection.commit()
+
+        files_to_create = [listed_files[file_id] for (file_id,) in new_file_ids]
+        files_to_update = [listed_files[file_id] for (file_id,) in modified_file_ids]
+        files_to_delete = [self._row_to_file(row) for row in deleted_rows]
+        return files_to_create, files_to_update, files_to_delete
+
+    def put_file(self: Self, file_data: dict, point_ids: Iterable[str]) -> None:
+        """
+        Record file_data, the Drive metadata of the file, as soon as its
+        points are upserted: the ETL calls it for each file during the build.
+        """
+        with self._lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    file_data["id"],
+                    file_data["name"],
+                    file_data["modifiedTime"],
+                    file_data.get("md5Checksum"),
+                    file_data.get("mimeType"),
+                    json.dumps(sorted(point_ids))
+                )
+            )
+            self.connection.execute(
+                "DELETE FROM failed_files WHERE file_id = ?", (file_data["id"],))
+
+    def delete_file(self: Self, file_id: str) -> None:
+        with self._lock, self.connection:
+            self.connection.execute(
+                "DELETE FROM files WHERE file_id = ?", (file_id,))
+            self.connection.execute(
+                "DELETE FROM failed_files WHERE file_id = ?", (file_id,))
+
+    def record_failure(self: Self, file_data: dict, error: str) -> None:
+        """
+        Record a file which could not be read, retried no sooner than
+        RETRY_DELAY_SECONDS later, doubled at each failed attempt up to
+        MAX_RETRY_DELAY_SECONDS. Cleared once the file is put or deleted.
+        """
+        with self._lock, self.connection:
+            row = self.connection.execute(
+                "SELECT nb_attempts FROM failed_files WHERE file_id = ?",
+                (file_data["id"],)
+            ).fetchone()
+            nb_attempts = (row[0] if row else 0) + 1
+            retry_delay = min(
+                self.RETRY_DELAY_SECONDS * 2 ** (nb_attempts - 1),
+                self.MAX_RETRY_DELAY_SECONDS
+            )
+            self.connection.execute(
+                "INSERT OR REPLACE INTO failed_files VALUES (?, ?, ?, ?, ?)",
+                (
+                    file_data["id"],
+                    json.dumps(file_data),
+                    nb_attempts,
+                    time.time() + retry_delay,
+                    error
+                )
+            )
+
+    def get_failed_files(self: Self) -> dict[str, dict]:
+        """ Failed files by id: their Drive metadata, attempts and next attempt time """
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT file_id, file_data, nb_attempts, next_attempt, error FROM failed_files"
+            ).fetchall()
+        return {
+            file_id: {
+                "file": json.loads(file_data),
+                "nbAttempts": nb_attempts,
+                "nextAttempt": next_attempt,
+                "error": error
+            }
+            for file_id, file_data, nb_attempts, next_attempt, error in rows
+        }
+
+    def delete_failed_file(self: Self, file_id: str) -> None:
+        with self._lock, self.connection:
+            self.connection.execute(
+                "DELETE FROM failed_files WHERE file_id = ?", (file_id,))
+
+    def count(self: Self) -> int:
+        with self._lock:
+            return self.connection.execute(
+                "SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def read_changes_state(self: Self) -> dict:
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT value FROM sync_state WHERE key = 'changes'"
+            ).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def write_changes_state(self: Self, start_page_token: str, last_reconciliation: float) -> None:
+        """ Changes API position, only written once the changes are indexed """
+        with self._lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO sync_state VALUES ('changes', ?)",
+                (json.dumps({
+                    "startPageToken": start_page_token,
+                    "lastReconciliation": last_reconciliation
+                }),)
+            )
+
+    def import_json_cache(self: Self, cache_file: str) -> None:
+        """ One-off import of the former gdrive_known_files.json """
+        if not os.path.exists(cache_file) or self.count() > 0:
+            return
+        with open(cache_file, "r", encoding="utf8") as f:
+            cached_files = json.loads(f.read())
+        logger.info("Importing %d files from %s...", len(cached_files), cache_file)
+        for file_id, file_data in cached_files.items():
+            self.put_file(
+                {"id": file_id, **file_data}, file_data.get("pointIds", []))
+        os.replace(cache_file, f"{cache_file}.imported")
+
+    def close(self: Self) -> None:
+        self.connection.close()
+
+    def _fill_lookup_table(self: Self, file_ids: Iterable[str]) -> None:
+        # Joined against files instead of one query per id
+        self.connection.execute(
+            """
+            CREATE TEMP TABLE IF NOT EXISTS lookup_ids (
+                file_id TEXT PRIMARY KEY,
+                modified_time TEXT
+            )
+            """
+        )
+        self.connection.execute("DELETE FROM lookup_ids")
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO lookup_ids (file_id) VALUES (?)",
+            [(file_id,) for file_id in file_ids]
+        )
+
+    @staticmethod
+    def _row_to_file(row: tuple) -> dict:
+        file_id, name, modified_time, md5_checksum, mime_type, point_ids = row
+        return {
+            "id": file_id,
+            "name": name,
+            "modifiedTime": modified_time,
+            "md5Checksum": md5_checksum,
+            "mimeType": mime_type,
+            "pointIds": json.loads(point_ids)
+        }
@@ -0,0 +1,41 @@
+import os
+import logging
+import json
+from typing import Self
+
+from mevy_bot.path_finder import PathFinder
+
+logger = logging.getLogger()
+
+
+class LegifranceManifestService:
+    """
+    Per-article manifest of the last successful Legifrance run:
+    {code_name: {article_id: {"cid": ..., "hash": ..., "pointIds": [...]}}}
+    """
+
+    def __init__(self: Self) -> None:
+        data_storage = PathFinder.data_storage()
+        self.manifest_file = os.path.join(
+            data_storage, "legifrance_manifest.json")
+
+    def write(self: Self, new_manifest: dict) -> None:
+        manifest = json.dumps(new_manifest)
+
+        os.makedirs(os.path.dirname(self.manifest_file), exist_ok=True)
+        tmp_manifest_file = f"{self.manifest_file}.tmp"
+        with open(tmp_manifest_file, "w", encoding="utf8") as f:
+            logger.info("Updating manifest file %s...", self.manifest_file)
+            f.write(manifest)
+        # Never leave a truncated manifest behind if the process dies mid-write
+        os.replace(tmp_manifest_file, self.manifest_file)
+
+        logger.info("Manifest file updated.")
+
+    def read(self: Self) -> dict:
+        try:
+            with open(self.manifest_file, "r", encoding="utf8") as f:
+                manifest_file_content = f.read()
+            return json.loads(manifest_file_content)
+        except FileNotFoundError:
+            return {}
@@ -0,0 +1,41 @@
+from typing import Iterator, List, Tuple
+
+from mevy_bot.models.legifrance import Article
+
+
+class LegifranceParserService:
+    """
+    Flat record stream of a code (or law) payload.
+
+    The first record holds the text header, each following record one
+    article with its section titles path, in reading order. Articles at
+    the root of the text (common in décrets and arrêtés) have an empty
+    path. Articles are built lazily from the records, without validating
+    a whole Code tree.
+    """
+
+    HEADER_FIELDS = ("id", "cid", "title")
+    ARTICLE_FIELDS = tuple(Article.model_fields)
+
+    @classmethod
+    def iter_records(cls, raw_text: dict) -> Iterator[dict]:
+        yield {field: raw_text.get(field) for field in cls.HEADER_FIELDS}
+
+        # The text itself is the root section
+        stack: List[Tuple[List[str], dict]] = [([], raw_text)]
+        while stack:
+            section_path, section = stack.pop()
+            for article in sorted(section.get("articles", []), key=lambda x: x["intOrdre"]):
+                yield {
+                    "sectionPath": section_path,
+                    "article": {field: article.get(field) for field in cls.ARTICLE_FIELDS}
+                }
+            for subsection in sorted(section.get("sections", []), key=lambda x: x["intOrdre"], reverse=True):
+                stack.append((section_path + [subsection["title"]], subsection))
+
+    @staticmethod
+    def iter_articles(records: Iterator[dict]) -> Iterator[Tuple[List[str], Article]]:
+        """ (section titles path, article) from article records """
+        for record in records:
+            # Records come from the Legifrance API or from our own cache
+            yield record["sectionPath"], Article.model_construct(**record["article"])
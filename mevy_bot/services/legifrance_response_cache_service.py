@@ -0,0 +1,65 @@
+import os
+import gzip
+import json
+import time
+import hashlib
+import logging
+from typing import Self, Iterable, Iterator, Optional
+
+from mevy_bot.path_finder import PathFinder
+
+logger = logging.getLogger()
+
+
+class LegifranceResponseCacheService:
+    """
+    Legifrance API responses stored as gzipped JSON lines, one record per
+    line (see LegifranceParserService), so they can be read back lazily.
+
+    A response is reused while it is younger than max_age_seconds, so that
+    re-runs and predict-only runs do not download whole codes again.
+    """
+
+    MAX_AGE_SECONDS = int(os.getenv("LEGIFRANCE_CACHE_MAX_AGE_SECONDS", str(20 * 3600)))
+
+    def __init__(
+        self: Self,
+        cache_dir: Optional[str] = None,
+        max_age_seconds: int = MAX_AGE_SECONDS
+    ) -> None:
+        self.cache_dir = cache_dir or PathFinder.legifrance_response_cache()
+        self.max_age_seconds = max_age_seconds
+
+    def filepath(self: Self, key: str) -> str:
+        filename = hashlib.sha256(key.encode("utf8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{filename}.jsonl.gz")
+
+    def is_fresh(self: Self, key: str) -> bool:
+        try:
+            age_seconds = time.time() - os.path.getmtime(self.filepath(key))
+        except FileNotFoundError:
+            return False
+        return age_seconds <= self.max_age_seconds
+
+    def iter_records(self: Self, key: str) -> Optional[Iterator[dict]]:
+        """ Cached records for key, or None when missing or stale """
+        if not self.is_fresh(key):
+            return None
+        return self._read_records(self.filepath(key))
+
+    def write_records(self: Self, key: str, records: Iterable[dict]) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        filepath = self.filepath(key)
+        tmp_filepath = f"{filepath}.tmp"
+        with gzip.open(tmp_filepath, "wt", encoding="utf8") as f:
+            for record in records:
+                f.write(json.dumps(record))
+                f.write("\n")
+        os.replace(tmp_filepath, filepath)
+        logger.info("Legifrance response cached [%s]", key)
+
+    @staticmethod
+    def _read_records(filepath: str) -> Iterator[dict]:
+        with gzip.open(filepath, "rt", encoding="utf8") as f:
+            for line in f:
+                yield json.loads(line)
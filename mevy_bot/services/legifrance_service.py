@@ -1,53 +1,336 @@
 import os
-from typing import Self
+import time
+import hashlib
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import Self, Iterator, List, Tuple, Optional, Sequence, Any
 
-from pylegifrance import recherche_CODE, recherche_LODA
+from pylegifrance import LegiHandler, recherche_CODE, recherche_LODA
 from dotenv import load_dotenv
 from lxml.html import fromstring
 from unidecode import unidecode
 
-from mevy_bot.models.legifrance import Code, Section
+from mevy_bot.models.legifrance import Code, Law, Section, Article, LegifranceSource
+from mevy_bot.models.ingestion import SourceDocument
+from mevy_bot.embedder.human_number import HumanNumber
+from mevy_bot.services.legifrance_text_cache_service import LegifranceTextCacheService
+from mevy_bot.services.legifrance_response_cache_service import LegifranceResponseCacheService
+from mevy_bot.services.legifrance_parser_service import LegifranceParserService
 
 load_dotenv()
 
+logger = logging.getLogger()
+
+
+def html_to_text(html_content: str) -> str:
+    # Module level so that it can be sent to pool worker processes
+    return fromstring(html_content).text_content().strip()
+
 
 class LegifranceService:
 
+    EXTRACTION_MAX_WORKERS = int(
+        os.getenv("LEGIFRANCE_EXTRACTION_WORKERS", str(os.cpu_count() or 1)))
+    EXTRACTION_BATCH_SIZE = 256
+    DOWNLOAD_MAX_WORKERS = int(os.getenv("LEGIFRANCE_DOWNLOAD_WORKERS", "4"))
+
+    # Shared by all the sources of all the runs
+    _executor: Optional[ProcessPoolExecutor] = None
+    _executor_lock = threading.Lock()
+
+    def __init__(
+        self: Self,
+        text_cache: Optional[LegifranceTextCacheService] = None,
+        response_cache: Optional[LegifranceResponseCacheService] = None
+    ) -> None:
+        self.text_cache = text_cache
+        self.response_cache = response_cache
+        self.resolved_text_ids: dict[str, str] = {}
+
     def fetch_code(self: Self, code_name: str) -> str:
-        results = recherche_CODE(code_name=code_name)
-        code = Code.model_validate(results[0])
+        code = self.fetch_code_model(code_name)
         return self.build_code(code)
 
+    def fetch_code_model(self: Self, code_name: str) -> Code:
+        results = self.fetch_raw(LegifranceSource(kind="code", name=code_name))
+        return Code.model_validate(results[0])
+
+    def fetch_text_model(self: Self, source: LegifranceSource) -> Law:
+        """ Décret or arrêté, fetched by its Legifrance text id """
+        results = self.fetch_raw(source)
+        return Law.model_validate(results[0])
+
+    def fetch_raw(self: Self, source: LegifranceSource) -> Any:
+        if source.kind == "code":
+            return recherche_CODE(code_name=source.name)
+        return recherche_LODA(text_id=self.resolve_text_id(source))
+
+    def resolve_text_id(self: Self, source: LegifranceSource) -> str:
+        """
+        LEGITEXT id of a décret or arrêté. A LEGIARTI id is resolved to the
+        text of the article, a JORFTEXT id to the consolidated text it is the
+        chronical id of, searched by the title of the source.
+        """
+        text_id = source.text_id or ""
+        if text_id.startswith("LEGITEXT"):
+            return text_id
+        if text_id in self.resolved_text_ids:
+            return self.resolved_text_ids[text_id]
+
+        if text_id.startswith("LEGIARTI"):
+            response = self.call_api("consult/getArticle", {"id": text_id})
+            titles = response["article"]["textTitles"]
+        else:
+            response = self.call_api("search", self.title_search_query(source.name))
+            titles = [
+                title for result in response.get("results", [])
+                for title in result.get("titles", []) if title.get("cid") == text_id
+            ]
+        legitext_ids = [
+            title["id"] for title in titles if title.get("id", "").startswith("LEGITEXT")
+        ]
+        if not legitext_ids:
+            raise ValueError(f"{source.name}: no consolidated text found for {text_id}")
+        logger.info("%s resolved to %s", text_id, legitext_ids[0])
+        self.resolved_text_ids[text_id] = legitext_ids[0]
+        return legitext_ids[0]
+
+    @staticmethod
+    def title_search_query(title: str) -> dict:
+        return {
+            "fond": "LODA_DATE",
+            "recherche": {
+                "champs": [{
+                    "typeChamp": "TITLE",
+                    "criteres": [{"typeRecherche": "EXACTE", "valeur": title, "operateur": "ET"}],
+                    "operateur": "ET"
+                }],
+                "operateur": "ET",
+                "pageNumber": 1,
+                "pageSize": 10,
+                "sort": "PERTINENCE",
+                "typePagination": "DEFAUT"
+            }
+        }
+
+    @staticmethod
+    def call_api(route: str, data: dict) -> dict:
+        response = LegiHandler().call_api(route, data)
+        response.raise_for_status()
+        return response.json()
+
+    def iter_source(
+        self: Self,
+        source: LegifranceSource
+    ) -> Tuple[str, Iterator[Tuple[List[str], Article]]]:
+        """
+        Title of a source and its (section titles path, article) in reading
+        order. Articles are read lazily from the response cache, so the
+        whole tree is never held as pydantic objects.
+        """
+        records = None
+        if self.response_cache is not None:
+            records = self.response_cache.iter_records(source.key)
+        if records is None:
+            results = self.fetch_raw(source)
+            records = LegifranceParserService.iter_records(results[0])
+            if self.response_cache is not None:
+                self.response_cache.write_records(source.key, records)
+                records = self.response_cache.iter_records(source.key)
+
+        header = next(records)  # type: ignore
+        return header["title"], LegifranceParserService.iter_articles(records)  # type: ignore
+
+    def prefetch(
+        self: Self,
+        sources: Sequence[LegifranceSource],
+        stop_event: Optional[threading.Event] = None
+    ) -> None:
+        """
+        Download sources concurrently into the response cache. Failures are
+        only logged: the source is fetched again when it is processed.
+        Once stop_event is set, the downloads in progress complete and the
+        queued ones are dropped.
+        """
+        if self.response_cache is None:
+            raise ValueError("response_cache is required for this operation")
+
+        start_time = time.perf_counter()
+        with ThreadPoolExecutor(self.DOWNLOAD_MAX_WORKERS) as executor:
+            futures = {
+                executor.submit(self._download, source): source for source in sources
+            }
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.warning("Could not download %s: %s", futures[future].name, e)
+                if stop_event is not None and stop_event.is_set():
+                    for pending_future in futures:
+                        pending_future.cancel()
+                    logger.info("Download of Legifrance sources stopped.")
+                    return
+        logger.info("%d Legifrance sources downloaded in %.1fs",
+                    len(sources), time.perf_counter() - start_time)
+
+    def _download(self: Self, source: LegifranceSource) -> None:
+        if self.response_cache.is_fresh(source.key):  # type: ignore
+            return
+        # The response is dropped: it is read back from the cache when processed
+        results = self.fetch_raw(source)
+        self.response_cache.write_records(  # type: ignore
+            source.key, LegifranceParserService.iter_records(results[0]))
+
     def download_code(self: Self, code_name: str, target_dir: str) -> None:
-        code_content = self.fetch_code(code_name=code_name)
+        code = self.fetch_code_model(code_name)
 
         filename = unidecode(code_name).lower().replace(" ", "_")
 
         filepath = os.path.join(target_dir, f"{filename}.txt")
         with open(filepath, 'w', encoding='utf8') as f:
-            f.write(code_content)
+            f.writelines(self.iter_code_parts(code))
 
     def build_code(self: Self, code: Code) -> str:
-        code_content = f"{code.title}\n\n"
-        for section in sorted(code.sections, key=lambda x: x.intOrdre):
-            code_content += self.build_section(section)
-        return code_content
+        return "".join(self.iter_code_parts(code))
 
     def build_section(self: Self, section: Section) -> str:
-        section_content = f"{section.title}\n\n"
-        for article in sorted(section.articles, key=lambda x: x.intOrdre):
-            section_content += f"Article n°{article.num}\n"
-            html_tree = fromstring(article.content)
-            section_content += f"{html_tree.text_content().strip()}\n\n"
-
-        for section in sorted(section.sections, key=lambda x: x.intOrdre):
-            section_content += self.build_section(section)
-        return section_content
-    
-    def fetch_law(self: Self) -> str:
-        results = recherche_LODA(text_id="2025-127")
-        print(law_content)
-
-if __name__ == "__main__":
-    legifrance_service = LegifranceService()
-    legifrance_service.fetch_law()
+        return "".join(self.iter_section_parts(section))
+
+    def iter_code_parts(self: Self, code: Code) -> Iterator[str]:
+        """ Text of the whole code, piece by piece (see build_code) """
+        yield f"{code.title}\n\n"
+        for section in sorted(code.sections, key=lambda x: x.intOrdre):
+            yield from self.iter_section_parts(section)
+
+    def iter_section_parts(self: Self, section: Section) -> Iterator[str]:
+        stack = [section]
+        while stack:
+            section = stack.pop()
+            yield f"{section.title}\n\n"
+            for article in sorted(section.articles, key=lambda x: x.intOrdre):
+                yield f"Article n°{article.num}\n"
+                yield f"{html_to_text(article.content)}\n\n"
+            stack.extend(
+                sorted(section.sections, key=lambda x: x.intOrdre, reverse=True))
+
+    def iter_articles(self: Self, code: Code | Law) -> Iterator[Tuple[List[str], Article]]:
+        """ Yield (section titles path, article) in reading order """
+        stack = [
+            ([section.title], section)
+            for section in sorted(code.sections, key=lambda x: x.intOrdre, reverse=True)
+        ]
+        while stack:
+            section_path, section = stack.pop()
+            for article in sorted(section.articles, key=lambda x: x.intOrdre):
+                yield section_path, article
+            for subsection in sorted(section.sections, key=lambda x: x.intOrdre, reverse=True):
+                stack.append((section_path + [subsection.title], subsection))
+
+    def build_article(
+        self: Self,
+        section_path: List[str],
+        article: Article,
+        article_text: Optional[str] = None
+    ) -> str:
+        if article_text is None:
+            article_text = html_to_text(article.content)
+        # Articles at the root of a text have no section
+        section_line = f"{' > '.join(section_path)}\n" if section_path else ""
+        return (
+            f"{section_line}"
+            f"Article n°{article.num}\n"
+            f"{article_text}"
+        )
+
+    def extract_article_texts(self: Self, articles: Sequence[Article]) -> dict[str, str]:
+        """
+        Plain text of each article by article id. Texts missing from the
+        cache are extracted in batches across a process pool.
+
+        Not interruptible: a stop takes effect once the texts are extracted.
+        """
+        start_time = time.perf_counter()
+        keys = [self.article_text_key(article) for article in articles]
+        texts = self.text_cache.get_many(keys) if self.text_cache else [None] * len(keys)
+        missing_indices = [i for i, text in enumerate(texts) if text is None]
+        missing_contents = [articles[i].content for i in missing_indices]
+
+        nb_workers = min(
+            self.EXTRACTION_MAX_WORKERS,
+            len(missing_contents) // self.EXTRACTION_BATCH_SIZE
+        )
+        if nb_workers > 1:
+            batch_size = min(self.EXTRACTION_BATCH_SIZE,
+                             -(-len(missing_contents) // nb_workers))
+            extracted_texts = list(self._get_executor().map(
+                html_to_text, missing_contents, chunksize=batch_size))
+        else:
+            extracted_texts = [html_to_text(content) for content in missing_contents]
+
+        for i, text in zip(missing_indices, extracted_texts):
+            texts[i] = text
+        if self.text_cache is not None and missing_indices:
+            self.text_cache.put_many(
+                [keys[i] for i in missing_indices], extracted_texts)
+
+        elapsed_time = time.perf_counter() - start_time
+        logger.info("%s articles extracted (%s from cache) in %.1fs (%.1f articles/s)",
+                    HumanNumber.format(len(articles)),
+                    HumanNumber.format(len(articles) - len(missing_indices)),
+                    elapsed_time,
+                    len(articles) / max(elapsed_time, 1e-9))
+        return {
+            article.id: text for article, text in zip(articles, texts)  # type: ignore
+        }
+
+    @classmethod
+    def _get_executor(cls) -> ProcessPoolExecutor:
+        if cls._executor is None:
+            with cls._executor_lock:
+                if cls._executor is None:
+                    # Spawned workers: forking the threaded API process is unsafe
+                    cls._executor = ProcessPoolExecutor(
+                        cls.EXTRACTION_MAX_WORKERS,
+                        mp_context=multiprocessing.get_context("spawn")
+                    )
+        return cls._executor
+
+    def article_document(
+        self: Self,
+        code_title: str,
+        section_path: List[str],
+        article: Article,
+        article_text: Optional[str] = None
+    ) -> SourceDocument:
+        """
+        One document per article: chunks never span two articles and carry
+        the article location in their payload.
+        """
+        return SourceDocument(
+            article.id,
+            code_title,
+            self.build_article(section_path, article, article_text),
+            {
+                "code_title": code_title,
+                "section_path": section_path,
+                "article_id": article.id,
+                "article_num": article.num,
+                "article_cid": article.cid
+            }
+        )
+
+    @staticmethod
+    def article_text_key(article: Article) -> str:
+        content_hash = hashlib.sha256(article.content.encode("utf8")).hexdigest()
+        return f"{article.id}:{content_hash}"
+
+    @staticmethod
+    def article_hash(section_path: List[str], article: Article) -> str:
+        """ Hash of everything that ends up in the article embedding text """
+        digest = hashlib.sha256()
+        for part in [*section_path, article.cid, article.num or "", article.content]:
+            digest.update(part.encode("utf8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
@@ -0,0 +1,31 @@
+from typing import Self, List, Optional, Sequence
+
+from mevy_bot.path_finder import PathFinder
+from mevy_bot.database.sqlite_lru_cache import SqliteLruCache
+
+
+class LegifranceTextCacheService(SqliteLruCache):
+    """
+    Plain text extracted from article HTML, stored in SQLite and keyed by
+    article id and content hash (see LegifranceService.article_text_key).
+    """
+
+    TABLE = "article_texts"
+    COLUMNS = "key TEXT NOT NULL, text TEXT NOT NULL"
+    VALUE_COLUMN = "text"
+    DESCRIPTION = "article text cache"
+
+    def __init__(
+        self: Self,
+        filepath: Optional[str] = None,
+        max_entries: int = SqliteLruCache.MAX_ENTRIES
+    ) -> None:
+        super().__init__(filepath or PathFinder.legifrance_text_cache(), max_entries)
+
+    def get_many(self: Self, keys: Sequence[str]) -> List[Optional[str]]:
+        """ Return cached texts in input order (None on miss) """
+        found = self.get_values(keys)
+        return [found.get(key) for key in keys]
+
+    def put_many(self: Self, keys: Sequence[str], texts: Sequence[str]) -> None:
+        self.put_rows(list(zip(keys, texts)))
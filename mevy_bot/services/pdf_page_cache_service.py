@@ -0,0 +1,43 @@
+from typing import Self, List, Optional, Sequence
+
+from mevy_bot.path_finder import PathFinder
+from mevy_bot.database.sqlite_lru_cache import SqliteLruCache
+
+
+class PdfPageCacheService(SqliteLruCache):
+    """
+    Text extracted from PDF pages, stored in SQLite and keyed by the hash
+    of the PDF file and the page number.
+    """
+
+    TABLE = "pdf_pages"
+    COLUMNS = "file_hash TEXT NOT NULL, page_number INTEGER NOT NULL, text TEXT NOT NULL"
+    KEY_COLUMNS = ("file_hash", "page_number")
+    VALUE_COLUMN = "text"
+    DESCRIPTION = "PDF page cache"
+
+    def __init__(
+        self: Self,
+        filepath: Optional[str] = None,
+        max_entries: int = SqliteLruCache.MAX_ENTRIES
+    ) -> None:
+        super().__init__(filepath or PathFinder.pdf_page_cache(), max_entries)
+
+    def get_pages(self: Self, file_hash: str, nb_pages: int) -> List[Optional[str]]:
+        """ Cached text of each page of the file (None on miss) """
+        found = {
+            page_number: text
+            for _, page_number, text in self.select_rows("file_hash = ?", (file_hash,))
+        }
+        return [found.get(page_number) for page_number in range(nb_pages)]
+
+    def put_pages(
+        self: Self,
+        file_hash: str,
+        page_numbers: Sequence[int],
+        texts: Sequence[str]
+    ) -> None:
+        self.put_rows([
+            (file_hash, page_number, text)
+            for page_number, text in zip(page_numbers, texts)
+        ])
@@ -0,0 +1,133 @@
+import os
+import uuid
+import socket
+import logging
+from datetime import datetime
+from typing import Self, Optional
+
+from mevy_bot.database.redis_handler import RedisHandler
+
+logger = logging.getLogger()
+
+
+class WorkflowLeaseService:
+    """
+    Cluster-wide ownership of workflows, stored in Redis.
+
+    A worker owns a workflow while it holds its lease, which expires after
+    LEASE_TTL_SECONDS unless renewed by heartbeats. Every lease gets a
+    fencing token from a counter that only increases. Runs check their
+    token before each upsert batch and checkpoint write: an owner that lost
+    its lease (e.g. after a long pause) aborts its run at its next write.
+    A write already in flight when the lease expires may still land.
+    """
+
+    LEASE_TTL_SECONDS = int(os.getenv("WORKFLOW_LEASE_TTL_SECONDS", "30"))
+    HEARTBEAT_INTERVAL_SECONDS = LEASE_TTL_SECONDS / 3
+
+    # Leases are "owner|token" strings, checked and changed atomically
+    ACQUIRE_SCRIPT = """
+    if redis.call('EXISTS', KEYS[1]) == 1 then
+        return nil
+    end
+    redis.call('DEL', KEYS[3])
+    local token = redis.call('INCR', KEYS[2])
+    redis.call('SET', KEYS[1], ARGV[1] .. '|' .. token, 'PX', ARGV[2])
+    return token
+    """
+    HEARTBEAT_SCRIPT = """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    end
+    return 0
+    """
+    RELEASE_SCRIPT = """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        redis.call('DEL', KEYS[2])
+        return redis.call('DEL', KEYS[1])
+    end
+    return 0
+    """
+
+    def __init__(self: Self) -> None:
+        self.client = RedisHandler().client
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._acquire = self.client.register_script(self.ACQUIRE_SCRIPT)
+        self._heartbeat = self.client.register_script(self.HEARTBEAT_SCRIPT)
+        self._release = self.client.register_script(self.RELEASE_SCRIPT)
+
+    def acquire(self: Self, workflow_id: int) -> Optional[int]:
+        """ Fencing token of the new lease, None if the workflow is owned """
+        token = self._acquire(
+            keys=[
+                self.lease_key(workflow_id),
+                self.fencing_key(workflow_id),
+                self.stop_key(workflow_id)
+            ],
+            args=[self.owner, self.LEASE_TTL_SECONDS * 1000]
+        )
+        if token is None:
+            return None
+        logger.info("Lease of workflow %d acquired (token %s).", workflow_id, token)
+        return int(token)
+
+    def heartbeat(self: Self, workflow_id: int, token: int) -> bool:
+        """ Extend the lease, False if it was lost """
+        return bool(self._heartbeat(
+            keys=[self.lease_key(workflow_id)],
+            args=[self.lease_value(token), self.LEASE_TTL_SECONDS * 1000]
+        ))
+
+    def is_held(self: Self, workflow_id: int, token: int) -> bool:
+        """ Whether the lease of token is still the current one """
+        return self.client.get(self.lease_key(workflow_id)) == self.lease_value(token)
+
+    def release(self: Self, workflow_id: int, token: int) -> None:
+        self._release(
+            keys=[self.lease_key(workflow_id), self.stop_key(workflow_id)],
+            args=[self.lease_value(token)]
+        )
+        logger.info("Lease of workflow %d released (token %s).", workflow_id, token)
+
+    def get_owner(self: Self, workflow_id: int) -> Optional[str]:
+        lease = self.client.get(self.lease_key(workflow_id))
+        if lease is None:
+            return None
+        return lease.rpartition("|")[0]
+
+    def request_stop(self: Self, workflow_id: int) -> None:
+        """ Ask the owner of the workflow, possibly another worker, to stop it """
+        self.client.set(self.stop_key(workflow_id), "1",
+                        ex=self.LEASE_TTL_SECONDS * 10)
+
+    def is_stop_requested(self: Self, workflow_id: int) -> bool:
+        return self.client.exists(self.stop_key(workflow_id)) == 1
+
+    def get_last_run(self: Self, workflow_id: int) -> Optional[datetime]:
+        """ Start of the last successful run of the workflow, by any worker """
+        last_run = self.client.get(self.last_run_key(workflow_id))
+        if last_run is None:
+            return None
+        return datetime.fromisoformat(last_run)
+
+    def set_last_run(self: Self, workflow_id: int, last_run: datetime) -> None:
+        self.client.set(self.last_run_key(workflow_id), last_run.isoformat())
+
+    def lease_value(self: Self, token: int) -> str:
+        return f"{self.owner}|{token}"
+
+    @staticmethod
+    def lease_key(workflow_id: int) -> str:
+        return f"workflow:{workflow_id}:lease"
+
+    @staticmethod
+    def fencing_key(workflow_id: int) -> str:
+        return f"workflow:{workflow_id}:fencing"
+
+    @staticmethod
+    def stop_key(workflow_id: int) -> str:
+        return f"workflow:{workflow_id}:stop"
+
+    @staticmethod
+    def last_run_key(workflow_id: int) -> str:
+        return f"workflow:{workflow_id}:last_run"
@@ -1,108 +1,96 @@
 import logging
-import time
 import asyncio
-import multiprocessing
 
-from mevy_bot.models.workflows import WorkflowInfo
 from mevy_bot.exceptions.workflows import JobActiveError, JobNotActiveError
-from mevy_bot.factories.workflow_factory import WorkflowFactory
-from mevy_bot.etl.workflow_etl import WorkflowEtl
+from mevy_bot.etl.workflow_scheduler import WorkflowScheduler
+from mevy_bot.services.workflow_lease_service import WorkflowLeaseService
 
 l = logging.getLogger()
 
 
 class WorkflowService:
+    # Runs are planned from "cron" when set, otherwise every triggerInterval
+    # triggerIntervalUnit (seconds, minutes, hours or days)
     workflows = [
         {
             "id": 1,
             "name": "Google Drive",
             "description": "Watch files in Google Drive storage and update/delete/insert knowledge accordingly.",
-            "triggerInterval": 1
+            "triggerInterval": 1,
+            "triggerIntervalUnit": "minutes",
+            "cron": None
         },
         {
             "id": 2,
             "name": "Legifrance",
             "description": "Collect latest French laws and regulations.",
-            "triggerInterval": 31
+            "triggerInterval": 31,
+            "triggerIntervalUnit": "days",
+            "cron": None
         },
     ]
 
-    active_workflows: dict[int, WorkflowInfo] = {}
+    # Leases make sure a workflow is only scheduled by one worker of the cluster
+    scheduler = WorkflowScheduler(WorkflowLeaseService())
 
     @staticmethod
-    def start_workflow(workflow_id: int) -> None:
-        if workflow_id in WorkflowService.active_workflows:
+    async def start_workflow(workflow_id: int) -> None:
+        if await WorkflowService.is_workflow_active(workflow_id):
             raise JobActiveError()
 
-        # Create a dedicated process
-        l.info("Creating a process for workflow %d...", workflow_id)
-        workflow_process = multiprocessing.Process(
-            target=WorkflowService.workflow_loop,
-            args=(workflow_id,),
-            daemon=True  # Process shuts down if main process shuts down
-        )
-        workflow_process.start()
-        l.info("Process for workflow %d created.", workflow_id)
-
-        # Update workflows registry
-        workflow_info = WorkflowInfo(workflow_process)
-        WorkflowService.active_workflows[workflow_id] = workflow_info
-
-    @staticmethod
-    async def workflow_loop_async(workflow_id: int) -> None:
-        workflow: WorkflowEtl = WorkflowFactory.create_workflow(
-            workflow_id)
-        workflow_logger = workflow.get_workflow_logger()
-        workflow_delay = 60
-        while True:
-            await workflow.run()
-            workflow_logger.info(
-                f"Next execution in {workflow_delay} seconds.")
-            time.sleep(workflow_delay)
-
-    @staticmethod
-    def workflow_loop(workflow_id):
-        asyncio.run(WorkflowService.workflow_loop_async(workflow_id))
+        l.info("Scheduling workflow %d...", workflow_id)
+        await WorkflowService.scheduler.start(
+            WorkflowService.get_workflow_definition(workflow_id))
+        l.info("Workflow %d scheduled.", workflow_id)
 
     @staticmethod
-    def stop_workflow(workflow_id: int) -> None:
-        if workflow_id not in WorkflowService.active_workflows:
+    async def stop_workflow(workflow_id: int) -> None:
+        if not await WorkflowService.is_workflow_active(workflow_id):
             raise JobNotActiveError()
 
-        # Retrieve and stop process associated to workflow
-        workflow = WorkflowService.active_workflows[workflow_id]
-        l.info("Waiting for process to stop (Workflow %d).", workflow_id)
-        workflow.workflow_process.terminate()
-        l.info("Workflow %d process has been stopped.", workflow_id)
+        await WorkflowService.scheduler.request_stop(workflow_id)
+        l.info("Stop of workflow %d requested.", workflow_id)
 
-        # Update workflows registry
-        WorkflowService.active_workflows.pop(workflow_id)
+    @staticmethod
+    async def shutdown() -> None:
+        """ Unschedule the workflows of this worker, before it exits """
+        await WorkflowService.scheduler.shutdown()
 
     @staticmethod
-    def list_workflows() -> list:
-        for workflow in WorkflowService.workflows:
-            workflow["isActive"] = WorkflowService.is_workflow_active(
-                workflow["id"])
-        return WorkflowService.workflows
+    async def list_workflows() -> list:
+        return list(await asyncio.gather(*(
+            WorkflowService.get_workflow_by_id(workflow["id"])
+            for workflow in WorkflowService.workflows
+        )))
 
     @staticmethod
-    def list_active_workflows() -> list:
-        return list(WorkflowService.active_workflows.keys())
+    async def list_active_workflows() -> list:
+        """ Workflows scheduled anywhere in the cluster """
+        is_active = await asyncio.gather(*(
+            WorkflowService.is_workflow_active(workflow["id"])
+            for workflow in WorkflowService.workflows
+        ))
+        return [
+            workflow["id"]
+            for workflow, workflow_is_active in zip(WorkflowService.workflows, is_active)
+            if workflow_is_active
+        ]
 
     @staticmethod
-    def get_workflow_by_id(workflow_id) -> dict:
+    def get_workflow_definition(workflow_id: int) -> dict:
         for workflow in WorkflowService.workflows:
             if workflow["id"] == workflow_id:
-                workflow["isActive"] = WorkflowService.is_workflow_active(
-                    workflow["id"])
                 return workflow
         raise ValueError(f"Workflow with id {workflow_id} does not exist")
 
     @staticmethod
-    def is_workflow_active(workflow_id: int) -> bool:
-        return workflow_id in WorkflowService.active_workflows
+    async def get_workflow_by_id(workflow_id) -> dict:
+        """ Workflow definition with its schedule state (isActive, nextRun...) """
+        workflow = WorkflowService.get_workflow_definition(workflow_id)
+        # Reads the lease from Redis
+        status = await asyncio.to_thread(WorkflowService.scheduler.status, workflow_id)
+        return {**workflow, **status}
 
-
-if __name__ == "__main__":
-    workflow_service = WorkflowService()
-    workflow_service.workflow_loop(1)
+    @staticmethod
+    async def is_workflow_active(workflow_id: int) -> bool:
+        return await asyncio.to_thread(WorkflowService.scheduler.is_active, workflow_id)
@@ -1,13 +1,16 @@
 import re
+import zlib
 import logging
-from typing import Self, List
+import itertools
+from typing import Self, List, Sequence, Tuple, Iterable, Iterator
 
+import numpy as np
 import semchunk
-import tiktoken
 from langchain_text_splitters import CharacterTextSplitter
 
 from mevy_bot.models.openai import EmbeddingModel, ChatModel
 from mevy_bot.file_reader import FileReader
+from mevy_bot.embedder.tokenizer_registry import TokenizerRegistry
 
 l = logging.getLogger(__name__)
 
@@ -15,6 +18,8 @@ l = logging.getLogger(__name__)
 class TextChunker:
     CHUNK_SIZE = 1024
     CHUNK_OVERLAP = 200
+    # On average, one line out of BOUNDARY_DIVISOR may end a content-defined chunk
+    BOUNDARY_DIVISOR = 8
 
     def __init__(
         self: Self,
@@ -43,28 +48,115 @@ class TextChunker:
             raise ValueError(
                 f"max_tokens ({max_tokens}) > max_tokens_input ({self.embedding_model.max_tokens_input})")
 
-        tokenizer = tiktoken.encoding_for_model(self.chat_model.name)
-        tokenized_text: List[int] = tokenizer.encode(text)
+        return self.split_in_token_windows(text, max_tokens, 0)
 
-        chunks = []
-        current_chunk = []
-        current_length = 0
+    def split_in_token_windows(
+        self: Self,
+        text: str,
+        window_size: int,
+        overlap_fraction: float
+    ) -> List[str]:
+        """
+        Split text in windows of window_size tokens, consecutive windows
+        sharing int(window_size * overlap_fraction) tokens. Windows are
+        slices of a single token buffer and are decoded in one batch.
+        """
+        tokenizer = TokenizerRegistry.get(self.chat_model.name)
+        tokens = self.token_buffer(tokenizer.encode_ordinary(text))
+        windows = self.token_windows(
+            len(tokens), window_size, int(window_size * overlap_fraction))
+        # tiktoken reads a list much faster than a sequence of NumPy scalars
+        return TokenizerRegistry.decode_batch(
+            self.chat_model.name,
+            [tokens[window.start:window.stop].tolist() for window in windows]
+        )
+
+    def iter_in_token_windows(
+        self: Self,
+        text_parts: Iterable[str],
+        window_size: int,
+        overlap_fraction: float
+    ) -> Iterator[str]:
+        """
+        Streaming variant of split_in_token_windows: windows are yielded as
+        soon as the token buffer holds them, so only about one window of
+        tokens is kept in memory whatever the size of the text.
 
-        for token in tokenized_text:
-            current_chunk.append(token)
-            current_length += 1
+        The end of each part is only encoded with the next one: its tokens
+        may depend on the text that follows, which would make the windows
+        differ from those of the whole text. A text without line breaks is
+        thus encoded in one go.
+        """
+        overlap_tokens = int(window_size * overlap_fraction)
+        stride = self.window_stride(window_size, overlap_tokens)
+        tokenizer = TokenizerRegistry.get(self.chat_model.name)
+        tokens = np.empty(0, dtype=np.uint32)
+        pending_text = ""
+        has_emitted = False
+        for text_part in itertools.chain(text_parts, [None]):
+            if text_part is None:
+                # Nothing follows the pending text anymore
+                text, pending_text = pending_text, ""
+            else:
+                text = pending_text + text_part
+                stable_length = self.stable_text_length(text)
+                text, pending_text = text[:stable_length], text[stable_length:]
+            tokens = np.concatenate((
+                tokens, self.token_buffer(tokenizer.encode_ordinary(text))))
+            if len(tokens) < window_size:
+                continue
 
-            if current_length >= max_tokens:
-                current_text = tokenizer.decode(current_chunk)
-                chunks.append(current_text)
-                current_chunk = []
-                current_length = 0
+            nb_full_windows = (len(tokens) - window_size) // stride + 1
+            yield from TokenizerRegistry.decode_batch(self.chat_model.name, [
+                tokens[start:start + window_size].tolist()
+                for start in range(0, nb_full_windows * stride, stride)
+            ])
+            tokens = tokens[nb_full_windows * stride:]
+            has_emitted = True
 
-        if current_chunk:
-            remaining_text = tokenizer.decode(current_chunk)
-            chunks.append(remaining_text)
+        # The first overlap_tokens of the buffer were sent with the last window
+        if len(tokens) > (overlap_tokens if has_emitted else 0):
+            yield tokenizer.decode(tokens.tolist())
 
-        return chunks
+    @staticmethod
+    def stable_text_length(text: str) -> int:
+        """
+        Length of the start of text whose tokens do not change whatever
+        text follows. The cl100k and o200k pre-tokenization patterns never
+        put a line break and the non-whitespace character after it in the
+        same token: the text is cut after the last such line break.
+        """
+        line_end = text.rfind("\n", 0, len(text) - 1)
+        while line_end >= 0 and text[line_end + 1].isspace():
+            line_end = text.rfind("\n", 0, line_end)
+        return line_end + 1
+
+    @staticmethod
+    def token_buffer(tokens: List[int]) -> np.ndarray:
+        return np.fromiter(tokens, dtype=np.uint32, count=len(tokens))
+
+    @classmethod
+    def token_windows(
+        cls,
+        nb_tokens: int,
+        window_size: int,
+        overlap_tokens: int
+    ) -> List[range]:
+        """ Token ranges of the windows covering nb_tokens tokens """
+        stride = cls.window_stride(window_size, overlap_tokens)
+        if nb_tokens == 0:
+            return []
+        return [
+            range(start, min(start + window_size, nb_tokens))
+            for start in range(0, max(nb_tokens - overlap_tokens, 1), stride)
+        ]
+
+    @staticmethod
+    def window_stride(window_size: int, overlap_tokens: int) -> int:
+        if not 0 <= overlap_tokens < window_size:
+            raise ValueError(
+                f"overlap ({overlap_tokens} tokens) must be smaller than the window ({window_size} tokens)")
+        return window_size - overlap_tokens
 
     def word_splitter(self: Self, source_text: str) -> List[str]:
         # Replace multiple whitespaces
@@ -92,10 +184,104 @@ class TextChunker:
         chunk_size: int,
         overlap_fraction: float
     ) -> List[str]:
-        tokenizer = tiktoken.encoding_for_model(self.chat_model.name)
+        tokenizer = TokenizerRegistry.get(self.chat_model.name)
         chunker = semchunk.chunkerify(tokenizer, chunk_size)
         return chunker(text, overlap=overlap_fraction)  # type: ignore
 
+    def semchunk_offsets(
+        self: Self,
+        text: str,
+        chunk_size: int,
+        overlap_fraction: float
+    ) -> List[Tuple[int, int]]:
+        """ Same as split_in_chunks_semchunk but returns (start, end) offsets """
+        tokenizer = TokenizerRegistry.get(self.chat_model.name)
+        chunker = semchunk.chunkerify(tokenizer, chunk_size)
+        _, offsets = chunker(text, overlap=overlap_fraction, offsets=True)  # type: ignore
+        return offsets
+
+    def split_in_chunks_content_defined(
+        self: Self,
+        text: str,
+        chunk_size: int
+    ) -> List[str]:
+        """
+        Split text on line boundaries chosen from the content of the lines
+        themselves (not from their position), so that an edit only changes
+        the chunks around it. Chunks do not overlap.
+        """
+        return [
+            text[start:end]
+            for start, end in self.content_defined_offsets(text, chunk_size)
+        ]
+
+    def content_defined_offsets(
+        self: Self,
+        text: str,
+        chunk_size: int
+    ) -> List[Tuple[int, int]]:
+        """ (start, end) character offsets of content-defined chunks """
+        tokenizer = TokenizerRegistry.get(self.chat_model.name)
+        segment_offsets = []
+        position = 0
+        for line in text.splitlines(keepends=True):
+            if len(line) > chunk_size and len(tokenizer.encode_ordinary(line)) > chunk_size:
+                # A single line may be longer than a chunk
+                segment_offsets.extend(
+                    (position + start, position + end)
+                    for start, end in self.semchunk_offsets(line, chunk_size, 0)
+                )
+            else:
+                segment_offsets.append((position, position + len(line)))
+            position += len(line)
+
+        segments = [text[start:end] for start, end in segment_offsets]
+        token_counts = TokenizerRegistry.count_tokens(
+            self.chat_model.name, segments)
+        chunk_offsets = []
+        for group in self.content_defined_groups(segments, token_counts, chunk_size):
+            start = segment_offsets[group.start][0]
+            end = segment_offsets[group.stop - 1][1]
+            while start < end and text[start].isspace():
+                start += 1
+            while end > start and text[end - 1].isspace():
+                end -= 1
+            if start < end:
+                chunk_offsets.append((start, end))
+        return chunk_offsets
+
+    @classmethod
+    def content_defined_groups(
+        cls,
+        segments: Sequence[str],
+        token_counts: Sequence[int],
+        chunk_size: int
+    ) -> List[range]:
+        """
+        Group consecutive segments into chunks of at most chunk_size tokens.
+
+        A chunk ends after a segment whose checksum is a multiple of
+        BOUNDARY_DIVISOR (once it holds at least a quarter of chunk_size),
+        or when the next segment would not fit.
+        """
+        min_chunk_size = chunk_size // 4
+        groups = []
+        group_start, group_tokens = 0, 0
+        for index, (segment, nb_tokens) in enumerate(zip(segments, token_counts)):
+            if index > group_start and group_tokens + nb_tokens > chunk_size:
+                groups.append(range(group_start, index))
+                group_start, group_tokens = index, 0
+            group_tokens += nb_tokens
+
+            is_boundary = zlib.crc32(segment.encode("utf8")) % cls.BOUNDARY_DIVISOR == 0
+            if is_boundary and group_tokens >= min_chunk_size:
+                groups.append(range(group_start, index + 1))
+                group_start, group_tokens = index + 1, 0
+
+        if group_start < len(segments):
+            groups.append(range(group_start, len(segments)))
+        return groups
+
     def chunks_from_document(
         self: Self,
         filepath: str,
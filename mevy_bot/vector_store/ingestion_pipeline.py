@@ -0,0 +1,293 @@
+import asyncio
+import logging
+from collections import Counter
+from typing import Self, List, AsyncIterator, Optional, Callable, Awaitable
+
+from qdrant_client.models import PointStruct
+
+from mevy_bot.chunk_planner import ChunkPlanner
+from mevy_bot.vector_store.qdrant_collection import QdrantCollection
+from mevy_bot.embedder.qdrant_embedding_converter import QdrantEmbeddingConverter
+from mevy_bot.embedder.human_number import HumanNumber
+from mevy_bot.models.ingestion import SourceDocument, TextChunk, StageStats, ChunkPlan
+
+l = logging.getLogger(__name__)
+
+
+class IngestionPipeline:
+    """
+    Streaming read -> chunk -> embed -> upsert pipeline.
+
+    Each stage runs as its own task and hands its output to the next one
+    through a bounded queue, so stages overlap and a slow stage applies
+    back-pressure to the previous ones. Peak memory is bounded by the
+    queue sizes and the number of embedding batches in flight.
+
+    A source is indexed once all its chunks have been upserted: sources are
+    then reported one at a time, in the order they complete, to the
+    on_source_indexed callback, so that the caller can checkpoint them.
+    Each source is expected to come in a single document. before_upsert is
+    awaited before each upsert batch, and may raise to abort the run.
+    """
+
+    DOCUMENTS_QUEUE_SIZE = 2
+    CHUNKS_QUEUE_SIZE = 2048
+    POINTS_QUEUE_SIZE = 8
+    MAX_IN_FLIGHT_BATCHES = 8
+    MAX_IN_FLIGHT_UPSERTS = 4
+
+    def __init__(
+        self: Self,
+        store_client: QdrantCollection,
+        embedding_converter: QdrantEmbeddingConverter,
+        chunk_planner: ChunkPlanner,
+        chunk_size: int,
+        chunk_overlap: float,
+        content_defined_chunks: bool = False
+    ) -> None:
+        self.store_client = store_client
+        self.embedding_converter = embedding_converter
+        self.chunk_planner = chunk_planner
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.content_defined_chunks = content_defined_chunks
+        self.collection_name = ""
+        self.stats: dict[str, StageStats] = {}
+        self.point_ids_by_source: dict[str, set[str]] = {}
+        self.source_names: dict[str, str] = {}
+        self.known_point_ids: dict[str, set[str]] = {}
+        self.nb_skipped_chunks = 0
+        self.nb_pending_chunks: Counter[str] = Counter()
+        self.chunked_sources: set[str] = set()
+        self.indexed_sources_queue: asyncio.Queue = asyncio.Queue()
+
+    async def run(
+        self: Self,
+        collection_name: str,
+        documents: AsyncIterator[SourceDocument],
+        known_point_ids: Optional[dict[str, set[str]]] = None,
+        on_source_indexed: Optional[Callable[[str, set[str]], Awaitable[None]]] = None,
+        before_upsert: Optional[Callable[[], Awaitable[None]]] = None
+    ) -> dict[str, StageStats]:
+        """
+        known_point_ids maps source ids to the point ids already stored for
+        them: chunks whose point id is known are not embedded again.
+        on_source_indexed is awaited with the id and point ids of each
+        source once it is indexed.
+        """
+        documents_queue: asyncio.Queue = asyncio.Queue(self.DOCUMENTS_QUEUE_SIZE)
+        chunks_queue: asyncio.Queue = asyncio.Queue(self.CHUNKS_QUEUE_SIZE)
+        points_queue: asyncio.Queue = asyncio.Queue(self.POINTS_QUEUE_SIZE)
+        self.stats = {
+            name: StageStats(name) for name in ["read", "chunk", "embed", "upsert"]
+        }
+        self.point_ids_by_source = {}
+        self.source_names = {}
+        self.known_point_ids = known_point_ids or {}
+        self.nb_skipped_chunks = 0
+        self.collection_name = collection_name
+        self.nb_pending_chunks = Counter()
+        self.chunked_sources = set()
+        self.indexed_sources_queue = asyncio.Queue()
+
+        # A failing stage cancels the other ones instead of leaving them blocked
+        async with asyncio.TaskGroup() as task_group:
+            task_group.create_task(
+                self._read_stage(documents, documents_queue))
+            task_group.create_task(
+                self._chunk_stage(documents_queue, chunks_queue))
+            task_group.create_task(
+                self._embed_stage(chunks_queue, points_queue))
+            task_group.create_task(
+                self._upsert_stage(points_queue, collection_name, before_upsert))
+            task_group.create_task(
+                self._indexed_sources_stage(on_source_indexed))
+
+        self.log_stats()
+        return self.stats
+
+    async def _read_stage(
+        self: Self,
+        documents: AsyncIterator[SourceDocument],
+        documents_queue: asyncio.Queue
+    ) -> None:
+        stats = self.stats["read"]
+        async for document in documents:
+            await documents_queue.put(document)
+            stats.add(1)
+        await documents_queue.put(None)
+        stats.stop()
+
+    async def _chunk_stage(
+        self: Self,
+        documents_queue: asyncio.Queue,
+        chunks_queue: asyncio.Queue
+    ) -> None:
+        stats = self.stats["chunk"]
+        while (document := await documents_queue.get()) is not None:
+            chunk_plan = await asyncio.to_thread(self.plan_document, document)
+            text_chunks = chunk_plan.chunk_texts(document.text)
+            point_ids = self.embedding_converter.point_ids_for_chunks(
+                document.source_id, text_chunks)
+            self.point_ids_by_source.setdefault(
+                document.source_id, set()).update(point_ids)
+            self.source_names[document.source_id] = document.source_name
+
+            chunks = [
+                TextChunk(
+                    document.source_id,
+                    document.source_name,
+                    chunk_index,
+                    text_chunks[chunk_index],
+                    chunk_plan.chunk_token_counts[chunk_index],
+                    point_ids[chunk_index],
+                    document.metadata
+                )
+                for chunk_index in range(len(text_chunks))
+            ]
+            known_point_ids = self.known_point_ids.get(document.source_id, set())
+            new_chunks = [chunk for chunk in chunks if chunk.point_id not in known_point_ids]
+            kept_chunks = [chunk for chunk in chunks if chunk.point_id in known_point_ids]
+            self.nb_skipped_chunks += len(kept_chunks)
+            self.nb_pending_chunks[document.source_id] += len(new_chunks)
+            l.info("%s/%s chunks to embed [%s]",
+                   HumanNumber.format(len(new_chunks)),
+                   HumanNumber.format(len(text_chunks)),
+                   document.source_name)
+            if kept_chunks:
+                await self._update_kept_chunks(kept_chunks)
+            for text_chunk in new_chunks:
+                await chunks_queue.put(text_chunk)
+            stats.add(len(new_chunks))
+            self.chunked_sources.add(document.source_id)
+            self._check_source_indexed(document.source_id)
+        await chunks_queue.put(None)
+        stats.stop()
+
+    async def _update_kept_chunks(self: Self, kept_chunks: List[TextChunk]) -> None:
+        """
+        Kept chunks are not embedded again, but their position in the
+        document and its metadata (e.g. the section path) may have changed.
+        """
+        payloads = {}
+        for text_chunk in kept_chunks:
+            payload = self.embedding_converter.chunk_payload(text_chunk)
+            # Same text, no need to send it again
+            del payload["text"]
+            payloads[text_chunk.point_id] = payload
+        await self.store_client.set_payloads(
+            self.collection_name, payloads, wait=False)
+
+    def plan_document(self: Self, document: SourceDocument) -> ChunkPlan:
+        return self.chunk_planner.plan(
+            document.text,
+            self.chunk_size,
+            self.chunk_overlap,
+            self.content_defined_chunks
+        )
+
+    async def _embed_stage(
+        self: Self,
+        chunks_queue: asyncio.Queue,
+        points_queue: asyncio.Queue
+    ) -> None:
+        stats = self.stats["embed"]
+        embedding_model = self.embedding_converter.embedder.embedding_model
+        in_flight_batches = asyncio.Semaphore(self.MAX_IN_FLIGHT_BATCHES)
+
+        async def embed_batch(batch: List[TextChunk]) -> None:
+            try:
+                points = await self.embedding_converter.get_embeddings_for_chunks(batch)
+                await points_queue.put(
+                    (points, [text_chunk.source_id for text_chunk in batch]))
+                stats.add(len(batch))
+            finally:
+                in_flight_batches.release()
+
+        async with asyncio.TaskGroup() as task_group:
+            batch: List[TextChunk] = []
+            batch_tokens = 0
+            while (text_chunk := await chunks_queue.get()) is not None:
+                if text_chunk.nb_tokens > embedding_model.max_tokens_input:
+                    raise ValueError(
+                        f"Chunk has {text_chunk.nb_tokens} tokens > max_tokens_input "
+                        f"({embedding_model.max_tokens_input}) [{text_chunk.source_name}]")
+
+                if batch and (
+                    len(batch) >= self.embedding_converter.max_batch_size
+                    or batch_tokens + text_chunk.nb_tokens > embedding_model.max_tokens_per_request
+                ):
+                    await in_flight_batches.acquire()
+                    task_group.create_task(embed_batch(batch))
+                    batch, batch_tokens = [], 0
+                batch.append(text_chunk)
+                batch_tokens += text_chunk.nb_tokens
+
+            if batch:
+                await in_flight_batches.acquire()
+                task_group.create_task(embed_batch(batch))
+
+        await points_queue.put(None)
+        stats.stop()
+
+    async def _upsert_stage(
+        self: Self,
+        points_queue: asyncio.Queue,
+        collection_name: str,
+        before_upsert: Optional[Callable[[], Awaitable[None]]] = None
+    ) -> None:
+        stats = self.stats["upsert"]
+        in_flight_upserts = asyncio.Semaphore(self.MAX_IN_FLIGHT_UPSERTS)
+
+        async def upsert_points(points: List[PointStruct], source_ids: List[str]) -> None:
+            try:
+                # Fast mode: Qdrant acknowledges before applying the update
+                await self.store_client.upsert_points_in_batches(
+                    points, collection_name, wait=False)
+                stats.add(len(points))
+            finally:
+                in_flight_upserts.release()
+            self.nb_pending_chunks.subtract(source_ids)
+            for source_id in set(source_ids):
+                self._check_source_indexed(source_id)
+
+        last_points: List[PointStruct] = []
+        async with asyncio.TaskGroup() as task_group:
+            while (item := await points_queue.get()) is not None:
+                points, source_ids = item
+                if before_upsert is not None:
+                    await before_upsert()
+                await in_flight_upserts.acquire()
+                task_group.create_task(upsert_points(points, source_ids))
+                last_points = points
+
+        await self.store_client.consistency_barrier(collection_name, last_points)
+        await self.indexed_sources_queue.put(None)
+        stats.stop()
+
+    def _check_source_indexed(self: Self, source_id: str) -> None:
+        # Chunked and upserted, whichever comes last
+        if source_id in self.chunked_sources and self.nb_pending_chunks[source_id] == 0:
+            self.chunked_sources.discard(source_id)
+            del self.nb_pending_chunks[source_id]
+            self.indexed_sources_queue.put_nowait(source_id)
+
+    async def _indexed_sources_stage(
+        self: Self,
+        on_source_indexed: Optional[Callable[[str, set[str]], Awaitable[None]]]
+    ) -> None:
+        while (source_id := await self.indexed_sources_queue.get()) is not None:
+            if on_source_indexed is not None:
+                await on_source_indexed(
+                    source_id, self.point_ids_by_source[source_id])
+
+    def log_stats(self: Self) -> None:
+        if self.nb_skipped_chunks:
+            l.info("%s unchanged chunks skipped",
+                   HumanNumber.format(self.nb_skipped_chunks))
+        for stage_stats in self.stats.values():
+            l.info("[%s] %s items in %.1fs (%.1f items/s)",
+                   stage_stats.name,
+                   HumanNumber.format(stage_stats.nb_items),
+                   stage_stats.elapsed_seconds,
+                   stage_stats.throughput)
@@ -1,7 +1,9 @@
 import os
+import time
+import asyncio
 import logging
 import inspect
-from typing import Self, List, Sequence, Callable, Coroutine
+from typing import Self, List, Sequence, Callable, Coroutine, Iterable
 from functools import wraps
 from http import HTTPStatus
 
@@ -18,7 +20,13 @@ from qdrant_client.models import (
     Filter,
     FilterSelector,
     FieldCondition,
-    MatchValue
+    MatchValue,
+    IsEmptyCondition,
+    PayloadField,
+    PointIdsList,
+    SetPayload,
+    SetPayloadOperation,
+    WriteOrdering
 )
 
 l = logging.getLogger()
@@ -34,13 +42,17 @@ def ensure_collection_exists(method: Callable[..., Coroutine]) -> Callable[...,
         bound_args.apply_defaults()
 
         collection_name = bound_args.arguments.get("collection_name")
-        l.info("Using collection_name: %s", collection_name)
+        l.debug("Using collection_name: %s", collection_name)
         if not collection_name:
             raise ValueError("collection_name is required for this operation")
 
+        if collection_name in self.existing_collections:
+            return await method(self, *args, **kwargs)
+
         try:
             if not await self.client.collection_exists(collection_name):
                 await self.create_collection(collection_name)
+            self.existing_collections.add(collection_name)
         except Exception as e:
             l.error("Failed to check or create collection '%s': %s",
                     collection_name, e)
@@ -52,6 +64,12 @@ def ensure_collection_exists(method: Callable[..., Coroutine]) -> Callable[...,
 class QdrantCollection():
 
     URL = os.getenv('QDRANT_DB_URL')
+    SCROLL_PAGE_SIZE = 1000
+    UPSERT_BATCH_SIZE = 256
+    UPSERT_MAX_CONCURRENCY = 4
+    # Collections known to exist, to skip the existence check on each call.
+    # Shared by the instances so that delete_collection can forget them.
+    existing_collections: set[str] = set()
 
     def __init__(self: Self, vector_dimensions: int) -> None:
         self.vector_dimensions = vector_dimensions
@@ -70,20 +88,72 @@ class QdrantCollection():
             )
         )
 
-    @ensure_collection_exists
     async def insert_vectors_in_collection(
         self: Self,
         points: List[PointStruct],
         collection_name: str
     ) -> None:
-        if not self.client.collection_exists(collection_name):
-            await self.create_collection(collection_name)
+        await self.upsert_points_in_batches(points, collection_name)
 
-        self.client.upload_points(
-            collection_name=collection_name,
-            wait=True,
-            points=points
-        )
+    @ensure_collection_exists
+    async def upsert_points_in_batches(
+        self: Self,
+        points: List[PointStruct],
+        collection_name: str,
+        batch_size: int = UPSERT_BATCH_SIZE,
+        max_concurrency: int = UPSERT_MAX_CONCURRENCY,
+        wait: bool = True
+    ) -> None:
+        """
+        Upsert points in batches of batch_size, with up to max_concurrency
+        batches in flight.
+
+        With wait=False, Qdrant acknowledges batches before applying them:
+        call consistency_barrier once all batches have been sent.
+        Point ids are deterministic, so upserting the same chunk twice is a no-op.
+        """
+        batches = [
+            points[i:i + batch_size] for i in range(0, len(points), batch_size)
+        ]
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def upsert_batch(batch: List[PointStruct]) -> None:
+            async with semaphore:
+                await self.client.upsert(
+                    collection_name=collection_name,
+                    wait=wait,
+                    points=batch
+                )
+
+        start_time = time.perf_counter()
+        await asyncio.gather(*[upsert_batch(batch) for batch in batches])
+        elapsed_time = time.perf_counter() - start_time
+        l.info("%d points upserted in %d batches (%.1f points/s)",
+               len(points), len(batches), len(points) / max(elapsed_time, 1e-9))
+
+    @ensure_collection_exists
+    async def consistency_barrier(
+        self: Self,
+        collection_name: str,
+        points: List[PointStruct]
+    ) -> None:
+        """
+        Wait until the updates sent with wait=False have been applied.
+
+        Qdrant applies the updates of a shard in order, so once an update
+        sent with wait=True completes, the updates acknowledged before it
+        on the same shard are applied too. This assumes single-shard
+        collections, which is how create_collection makes them; strong
+        ordering covers the replicas of that shard. Upserting the last
+        points again is harmless since it does not change them.
+        """
+        if points:
+            await self.client.upsert(
+                collection_name=collection_name,
+                wait=True,
+                points=points,
+                ordering=WriteOrdering.STRONG
+            )
 
     @ensure_collection_exists
     async def search_in_collection(
@@ -121,10 +191,116 @@ class QdrantCollection():
             if exc.status_code == HTTPStatus.NOT_FOUND:
                 l.info("Cannot delete vectors, reason: %s", exc.content)
 
+    @ensure_collection_exists
+    async def list_point_ids_for_source(
+            self: Self,
+            collection_name: str,
+            source_id: str) -> set[str]:
+        point_ids: set[str] = set()
+        offset = None
+        while True:
+            records, offset = await self.client.scroll(
+                collection_name=collection_name,
+                scroll_filter=Filter(
+                    must=[
+                        FieldCondition(
+                            key="source_id",
+                            match=MatchValue(value=source_id)
+                        ),
+                    ],
+                ),
+                limit=self.SCROLL_PAGE_SIZE,
+                offset=offset,
+                with_payload=False,
+                with_vectors=False
+            )
+            point_ids.update(str(record.id) for record in records)
+            if offset is None:
+                return point_ids
+
+    @ensure_collection_exists
+    async def set_payloads(
+        self: Self,
+        collection_name: str,
+        payloads: dict[str, dict],
+        batch_size: int = UPSERT_BATCH_SIZE,
+        wait: bool = True
+    ) -> None:
+        """ Update payload keys point by point, vectors untouched """
+        operations = [
+            SetPayloadOperation(set_payload=SetPayload(payload=payload, points=[point_id]))
+            for point_id, payload in payloads.items()
+        ]
+        for i in range(0, len(operations), batch_size):
+            await self.client.batch_update_points(
+                collection_name=collection_name,
+                update_operations=operations[i:i + batch_size],
+                wait=wait
+            )
+
+    @ensure_collection_exists
+    async def set_payload_for_source(
+            self: Self,
+            collection_name: str,
+            source_id: str,
+            payload: dict) -> None:
+        """ Update payload keys of all the points of a source, vectors untouched """
+        await self.client.set_payload(
+            collection_name=collection_name,
+            payload=payload,
+            points=FilterSelector(
+                filter=Filter(
+                    must=[
+                        FieldCondition(
+                            key="source_id",
+                            match=MatchValue(value=source_id)
+                        ),
+                    ],
+                )
+            )
+        )
+
+    @ensure_collection_exists
+    async def delete_points(
+            self: Self,
+            collection_name: str,
+            point_ids: Iterable[str]) -> None:
+        point_ids = list(point_ids)
+        if not point_ids:
+            return
+        await self.client.delete(
+            collection_name=collection_name,
+            points_selector=PointIdsList(points=point_ids)
+        )
+
+    @ensure_collection_exists
+    async def delete_legacy_vectors_for_source(
+            self: Self,
+            collection_name: str,
+            source_name: str) -> None:
+        """ Delete points of a source indexed before point ids were deterministic """
+        await self.client.delete(
+            collection_name=collection_name,
+            points_selector=FilterSelector(
+                filter=Filter(
+                    must=[
+                        FieldCondition(
+                            key="source",
+                            match=MatchValue(value=source_name)
+                        ),
+                        IsEmptyCondition(
+                            is_empty=PayloadField(key="source_id")
+                        ),
+                    ],
+                )
+            )
+        )
+
     @staticmethod
     async def delete_collection(collection_name: str) -> None:
         client = QdrantCollection.get_qdrant_client()
         await client.delete_collection(collection_name=collection_name)
+        QdrantCollection.existing_collections.discard(collection_name)
 
     @staticmethod
     async def healthcheck() -> bool:
@@ -1,6 +1,5 @@
 import logging
-import os
-from typing import Self, List
+from typing import Self, List, AsyncIterator, Iterable, Optional, Callable, Awaitable
 from decimal import Decimal
 
 from qdrant_client.models import (
@@ -8,14 +7,20 @@ from qdrant_client.models import (
 )
 
 from mevy_bot.file_reader import FileReader
+from mevy_bot.services.pdf_page_cache_service import PdfPageCacheService
 from mevy_bot.text_chunker import TextChunker
+from mevy_bot.chunk_planner import ChunkPlanner
 from mevy_bot.vector_store.qdrant_collection import QdrantCollection
+from mevy_bot.vector_store.ingestion_pipeline import IngestionPipeline
 from mevy_bot.embedder.qdrant_embedding_converter import QdrantEmbeddingConverter
 from mevy_bot.embedder.openai_embedder import OpenAIEmbedder
+from mevy_bot.embedder.async_openai_embedder import AsyncOpenAIEmbedder
+from mevy_bot.embedder.embedding_cache import EmbeddingCache
+from mevy_bot.embedder.chunk_plan_cache import ChunkPlanCache
 from mevy_bot.embedder.cost_predictor import CostPredictor
-from mevy_bot.embedder.token_calculator import TokenCalculator
 from mevy_bot.embedder.human_number import HumanNumber
 from mevy_bot.models.openai import EmbeddingModel, ChatModel
+from mevy_bot.models.ingestion import SourceDocument
 
 l = logging.getLogger(__name__)
 
@@ -32,80 +37,148 @@ class VectorStore:
         chat_model: ChatModel
     ) -> None:
         self.store_client: QdrantCollection = store_client
-        self.embedder = OpenAIEmbedder(embedding_model)
-        self.embedding_converter = QdrantEmbeddingConverter(self.embedder)
+        self.embedding_cache = EmbeddingCache(embedding_model)
+        self.embedder = OpenAIEmbedder(embedding_model, self.embedding_cache)
+        self.async_embedder = AsyncOpenAIEmbedder(
+            embedding_model, self.embedding_cache)
+        self.embedding_converter = QdrantEmbeddingConverter(
+            self.embedder, async_embedder=self.async_embedder)
         self.embedding_model = embedding_model
         self.chat_model = chat_model
+        self.file_reader = FileReader(PdfPageCacheService())
+        # Shared by cost prediction and ingestion so a text is tokenized once
+        self.chunk_planner = ChunkPlanner(
+            TextChunker(embedding_model, chat_model),
+            embedding_model,
+            ChunkPlanCache()
+        )
 
-    async def build_from_directory_files(
+    async def build_from_documents(
         self: Self,
         collection_name: str,
-        target_dir: str
-    ) -> None:
-        """ Build a vector store from PDF files in target dir """
-        l.info("Building vector store from data storage files...")
-        for root, _, files in os.walk(target_dir):
-            for filename in files:
-                l.info("Processing %s...", filename)
-                filepath = os.path.join(root, filename)
-
-                text_chunker = TextChunker(
-                    self.embedding_model, self.chat_model)
-                text_chunks = text_chunker.chunks_from_document(
-                    filepath,
-                    self.CHUNK_SIZE,
-                    self.CHUNK_OVERLAP
-                )
+        documents: AsyncIterator[SourceDocument],
+        prune_stale_points: bool = True,
+        known_point_ids: Optional[dict[str, set[str]]] = None,
+        content_defined_chunks: bool = False,
+        on_source_indexed: Optional[Callable[[str, set[str]], Awaitable[None]]] = None,
+        before_upsert: Optional[Callable[[], Awaitable[None]]] = None
+    ) -> dict[str, set[str]]:
+        """
+        Stream documents through the read/chunk/embed/upsert pipeline and
+        return the point ids of each source.
+
+        Once a source has been fully upserted, its points that were not
+        produced by this run are deleted (unless prune_stale_points is False)
+        and on_source_indexed is awaited with its id and point ids.
+        Chunks whose point id is in known_point_ids are not embedded again,
+        which combined with content_defined_chunks makes small edits cheap.
+        before_upsert is awaited before each upsert batch.
+        """
+        known_point_ids = known_point_ids or {}
+        pipeline = IngestionPipeline(
+            self.store_client,
+            self.embedding_converter,
+            self.chunk_planner,
+            self.CHUNK_SIZE,
+            self.CHUNK_OVERLAP,
+            content_defined_chunks
+        )
 
-                vectors = self.embedding_converter.get_embeddings_text_chunks(
-                    text_chunks,
-                    filename
+        async def source_indexed(source_id: str, point_ids: set[str]) -> None:
+            if prune_stale_points:
+                await self.delete_stale_points(
+                    collection_name,
+                    source_id,
+                    pipeline.source_names[source_id],
+                    point_ids,
+                    known_point_ids.get(source_id)
                 )
-                await self.store_client.insert_vectors_in_collection(
-                    vectors, collection_name)
-        l.info("Vector store successfully built.")
-
-    def predict_costs_for_embedding_files(self: Self, target_dir: str) -> None:
+            if on_source_indexed is not None:
+                await on_source_indexed(source_id, point_ids)
+
+        stats = await pipeline.run(
+            collection_name, documents, known_point_ids, source_indexed, before_upsert)
+        l.info("Vector store successfully built (%s chunks, %.1f chunks/s).",
+               HumanNumber.format(stats["upsert"].nb_items), stats["embed"].throughput)
+        cache_stats = self.embedding_cache.stats()
+        l.info("Embedding cache: %d hits, %d misses (hit rate %.1f%%).",
+               cache_stats["hits"], cache_stats["misses"], cache_stats["hit_rate"] * 100)
+        return pipeline.point_ids_by_source
+
+    async def delete_stale_points(
+        self: Self,
+        collection_name: str,
+        source_id: str,
+        source_name: str,
+        point_ids: set[str],
+        existing_point_ids: Optional[set[str]] = None
+    ) -> None:
+        """
+        Delete the points of a source which are not in point_ids.
+
+        existing_point_ids are listed from the collection when not provided,
+        in which case points indexed before point ids were deterministic
+        are deleted as well.
+        """
+        if existing_point_ids is None:
+            existing_point_ids = await self.store_client.list_point_ids_for_source(
+                collection_name, source_id)
+            await self.store_client.delete_legacy_vectors_for_source(
+                collection_name, source_name)
+        stale_point_ids = existing_point_ids - point_ids
+        if stale_point_ids:
+            l.info("Deleting %d stale points [%s]...",
+                   len(stale_point_ids), source_name)
+            await self.store_client.delete_points(
+                collection_name, stale_point_ids)
+
+    def predict_costs_for_documents(
+        self: Self,
+        documents: Iterable[SourceDocument],
+        content_defined_chunks: bool = False
+    ) -> None:
+        """
+        Predict embedding costs from the chunk plans, which are cached so
+        that the following ingestion run does not tokenize the texts again.
+        Billed tokens are the chunk tokens, chunk overlap included.
+        """
         total_cost = Decimal("0")
-        total_chars, total_tokens, total_chunks = 0, 0, 0
-        for root, _, files in os.walk(target_dir):
-            for filename in files:
-                filepath = os.path.join(root, filename)
-                file_reader = FileReader()
-                file_text = file_reader.detect_format_and_read(filepath)
-
-                token_calculator = TokenCalculator(self.chat_model)
-                nb_tokens, nb_chars = token_calculator.nb_tokens_nb_chars(
-                    file_text)
-                total_tokens += nb_tokens
-                total_chars += nb_chars
-                l.info(
-                    "Embeddings generation for %s tokens (%s characters) [%s]",
-                    HumanNumber.format(nb_tokens),
-                    HumanNumber.format(nb_chars),
-                    filename
-                )
-
-                text_chunker = TextChunker(
-                    self.embedding_model, self.chat_model)
-                text_chunks = text_chunker.split_in_chunks_semchunk(
-                    file_text, self.CHUNK_SIZE, self.CHUNK_OVERLAP)
-                total_chunks += len(text_chunks)
-
-                cost_predictor = CostPredictor(
-                    self.embedding_model.price_per_1k_input_tokens)
-                expected_cost = cost_predictor.calculate_cost_based_on_token_count(
-                    Decimal(nb_tokens))
-                total_cost += expected_cost
-                l.info("Embeddings generation for %s text chunks is expected to cost %f$ [%s]",
-                       HumanNumber.format(len(text_chunks)), expected_cost, filename)
+        total_chars, total_tokens, total_chunk_tokens, total_chunks = 0, 0, 0, 0
+        cost_predictor = CostPredictor(
+            self.embedding_model.price_per_1k_input_tokens)
+        for document in documents:
+            chunk_plan = self.chunk_planner.plan(
+                document.text,
+                self.CHUNK_SIZE,
+                self.CHUNK_OVERLAP,
+                content_defined_chunks
+            )
+            total_tokens += chunk_plan.nb_tokens
+            total_chunk_tokens += chunk_plan.nb_chunk_tokens
+            total_chars += chunk_plan.nb_chars
+            total_chunks += len(chunk_plan.chunk_offsets)
             l.info(
-                "\n[TOTAL] Embeddings generation for %s tokens (%s characters) [total]",
-                HumanNumber.format(total_tokens),
-                HumanNumber.format(total_chars)
+                "Embeddings generation for %s tokens (%s characters, %s tokens with overlap) [%s]",
+                HumanNumber.format(chunk_plan.nb_tokens),
+                HumanNumber.format(chunk_plan.nb_chars),
+                HumanNumber.format(chunk_plan.nb_chunk_tokens),
+                document.source_name
             )
-            l.info("[TOTAL] Embeddings generation for %s text chunks is expected to cost %f$ [total]",
-                   HumanNumber.format(total_chunks), total_cost)
+
+            expected_cost = cost_predictor.calculate_cost_based_on_token_count(
+                Decimal(chunk_plan.nb_chunk_tokens))
+            total_cost += expected_cost
+            l.info("Embeddings generation for %s text chunks is expected to cost %f$ [%s]",
+                   HumanNumber.format(len(chunk_plan.chunk_offsets)), expected_cost,
+                   document.source_name)
+        l.info(
+            "\n[TOTAL] Embeddings generation for %s tokens (%s characters, %s tokens with overlap) [total]",
+            HumanNumber.format(total_tokens),
+            HumanNumber.format(total_chars),
+            HumanNumber.format(total_chunk_tokens)
+        )
+        l.info("[TOTAL] Embeddings generation for %s text chunks is expected to cost %f$ [total]",
+               HumanNumber.format(total_chunks), total_cost)
 
     async def search_in_store(
         self: Self,
@@ -137,6 +210,17 @@ class VectorStore:
             collection_name, source_name)
         l.info("Points deleted.")
 
+    async def rename_source(
+        self: Self,
+        collection_name: str,
+        source_id: str,
+        source_name: str
+    ) -> None:
+        """ Point the existing chunks of a source to its new name """
+        l.info("Renaming points in vector store for %s...", source_name)
+        await self.store_client.set_payload_for_source(
+            collection_name, source_id, {"source": source_name})
+
     @staticmethod
     async def delete_collection(collection_name: str) -> None:
         return await QdrantCollection.delete_collection(collection_name)
@@ -0,0 +1,77 @@
+import os
+import asyncio
+import time
+import unittest
+from types import SimpleNamespace
+
+import httpx
+from openai import RateLimitError
+
+from mevy_bot.embedder.async_openai_embedder import AsyncOpenAIEmbedder
+from mevy_bot.embedder.rate_limiter import RateLimiter
+from mevy_bot.models.openai import OpenAIModelFactory
+
+
+class FakeEmbeddings:
+
+    def __init__(self, nb_failures: int = 0):
+        self.nb_failures = nb_failures
+        self.nb_calls = 0
+
+    async def create(self, input, model):
+        self.nb_calls += 1
+        if self.nb_failures > 0:
+            self.nb_failures -= 1
+            request = httpx.Request("POST", "https://api.openai.com/v1/embeddings")
+            raise RateLimitError(
+                "rate limited", response=httpx.Response(429, request=request), body=None)
+        # Vary the latency so batches complete out of order
+        await asyncio.sleep(0.01 * (len(input) % 3))
+        data = [
+            SimpleNamespace(index=i, embedding=[float(len(text))])
+            for i, text in enumerate(input)
+        ]
+        return SimpleNamespace(data=list(reversed(data)))
+
+
+class TestAsyncOpenAIEmbedder(unittest.TestCase):
+
+    def setUp(self):
+        os.environ.setdefault("OPENAI_API_KEY", "test")
+        self.embedder = AsyncOpenAIEmbedder(
+            OpenAIModelFactory.text_embedding_3_small(), max_concurrency=2)
+        self.embedder.BACKOFF_BASE_SECONDS = 0.01
+
+    def test_batches_results_in_input_order(self):
+        self.embedder.client = SimpleNamespace(embeddings=FakeEmbeddings())
+        batches = [["a"], ["bb", "ccc"], ["dddd", "e", "ff"]]
+        embeddings = asyncio.run(
+            self.embedder.generate_embeddings_batches(batches))
+        self.assertEqual(
+            embeddings, [[[1.0]], [[2.0], [3.0]], [[4.0], [1.0], [2.0]]])
+
+    def test_retry_on_rate_limit(self):
+        fake_embeddings = FakeEmbeddings(nb_failures=2)
+        self.embedder.client = SimpleNamespace(embeddings=fake_embeddings)
+        embeddings = asyncio.run(
+            self.embedder.generate_embeddings_batch(["abc"]))
+        self.assertEqual(embeddings, [[3.0]])
+        self.assertEqual(fake_embeddings.nb_calls, 3)
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_requests_are_throttled(self):
+        async def acquire_all():
+            rate_limiter = RateLimiter(
+                requests_per_period=2, tokens_per_period=1000, period_seconds=0.2)
+            for _ in range(3):
+                await rate_limiter.acquire(1)
+
+        start_time = time.monotonic()
+        asyncio.run(acquire_all())
+        self.assertGreaterEqual(time.monotonic() - start_time, 0.09)
+
+
+if __name__ == "__main__":
+    unittest.main()
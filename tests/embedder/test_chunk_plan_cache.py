@@ -0,0 +1,40 @@
+import os
+import tempfile
+import unittest
+
+from mevy_bot.models.ingestion import ChunkPlan
+from mevy_bot.embedder.chunk_plan_cache import ChunkPlanCache
+
+
+class TestChunkPlanCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = ChunkPlanCache(
+            os.path.join(self.tmp_dir.name, "chunk_plans.sqlite3"), max_entries=2)
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmp_dir.cleanup()
+
+    def test_plan_round_trip(self):
+        plan = ChunkPlan(5, 20, [(0, 12), (8, 20)], [3, 3])
+        self.cache.put("key", plan)
+
+        self.assertEqual(self.cache.get("key"), plan)
+        self.assertIsNone(self.cache.get("unknown"))
+        self.assertEqual(plan.chunk_texts("a" * 12 + "b" * 8), ["a" * 12, "aaaa" + "b" * 8])
+        self.assertEqual(plan.nb_chunk_tokens, 6)
+
+    def test_least_recently_used_plans_are_evicted(self):
+        for key in ["a", "b"]:
+            self.cache.put(key, ChunkPlan(1, 1, [(0, 1)], [1]))
+        self.cache.get("a")
+        self.cache.put("c", ChunkPlan(1, 1, [(0, 1)], [1]))
+
+        self.assertIsNotNone(self.cache.get("a"))
+        self.assertIsNone(self.cache.get("b"))
+
+
+if __name__ == "__main__":
+    unittest.main()
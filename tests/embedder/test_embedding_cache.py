@@ -0,0 +1,47 @@
+import os
+import tempfile
+import unittest
+
+from mevy_bot.embedder.embedding_cache import EmbeddingCache
+from mevy_bot.models.openai import OpenAIModelFactory
+
+
+class TestEmbeddingCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = EmbeddingCache(
+            OpenAIModelFactory.text_embedding_3_small(),
+            os.path.join(self.tmp_dir.name, "embeddings.sqlite3"),
+            max_entries=10
+        )
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmp_dir.cleanup()
+
+    def test_hit_and_miss(self):
+        self.cache.put_many(["a"], [[0.5, -1.0]])
+        embeddings = self.cache.get_many(["a", "b"])
+        self.assertEqual(embeddings, [[0.5, -1.0], None])
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_key_depends_on_model(self):
+        other_cache = EmbeddingCache(
+            OpenAIModelFactory.text_embedding_3_large(),
+            self.cache.filepath
+        )
+        self.cache.put_many(["a"], [[0.5]])
+        self.assertEqual(other_cache.get_many(["a"]), [None])
+        other_cache.close()
+
+    def test_size_bounded_eviction(self):
+        texts = [str(i) for i in range(25)]
+        for text in texts:
+            self.cache.put_many([text], [[float(text)]])
+        self.assertLessEqual(self.cache.nb_entries(), 10)
+        self.assertEqual(self.cache.get_many(["24"]), [[24.0]])
+
+
+if __name__ == "__main__":
+    unittest.main()
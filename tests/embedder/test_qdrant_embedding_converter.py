@@ -0,0 +1,25 @@
+import unittest
+
+from mevy_bot.embedder.qdrant_embedding_converter import QdrantEmbeddingConverter
+
+
+class TestQdrantEmbeddingConverter(unittest.TestCase):
+
+    def test_point_ids_are_deterministic(self):
+        point_ids = QdrantEmbeddingConverter.point_ids_for_chunks(
+            "file-id", ["a", "b", "a"])
+        self.assertEqual(
+            point_ids,
+            QdrantEmbeddingConverter.point_ids_for_chunks("file-id", ["a", "b", "a"]))
+        self.assertEqual(len(set(point_ids)), 3)
+
+    def test_point_ids_do_not_depend_on_position(self):
+        point_ids = QdrantEmbeddingConverter.point_ids_for_chunks(
+            "file-id", ["a", "b"])
+        shifted_point_ids = QdrantEmbeddingConverter.point_ids_for_chunks(
+            "file-id", ["new", "a", "b"])
+        self.assertEqual(point_ids, shifted_point_ids[1:])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+
+import tiktoken
+
+from mevy_bot.embedder.tokenizer_registry import TokenizerRegistry
+
+
+def byte_encoding() -> tiktoken.Encoding:
+    return tiktoken.Encoding(
+        name="test-bytes",
+        pat_str=r"[\s\S]",
+        mergeable_ranks={bytes([i]): i for i in range(256)},
+        special_tokens={}
+    )
+
+
+class TestTokenizerRegistry(unittest.TestCase):
+
+    def setUp(self):
+        TokenizerRegistry.register("test-model", byte_encoding())
+
+    def test_encoding_is_built_once(self):
+        self.assertIs(TokenizerRegistry.get("test-model"),
+                      TokenizerRegistry.get("test-model"))
+
+    def test_batch_round_trip_keeps_order(self):
+        texts = [f"document {i}\n" * i for i in range(20)]
+
+        token_batches = TokenizerRegistry.encode_batch("test-model", texts)
+
+        self.assertEqual(TokenizerRegistry.count_tokens("test-model", texts),
+                         [len(text) for text in texts])
+        self.assertEqual(TokenizerRegistry.decode_batch("test-model", token_batches), texts)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,295 @@
+import os
+import time
+import asyncio
+import hashlib
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+
+from googleapiclient.errors import HttpError
+
+from mevy_bot.etl import gdrive_etl
+from mevy_bot.etl.gdrive_etl import GdriveEtl
+from mevy_bot.exceptions.workflows import LeaseLostError
+from mevy_bot.file_reader import FileReader
+from mevy_bot.services.gdrive_source_registry_service import GdriveSourceRegistryService
+
+
+def drive_file(file_id, modified_time="2024-01-01T00:00:00Z", name=None):
+    return {
+        "id": file_id, "name": name or f"{file_id}.txt", "modifiedTime": modified_time,
+        "md5Checksum": f"md5-{file_id}-{modified_time}", "mimeType": "text/plain",
+        "size": "12", "parents": ["folder"]
+    }
+
+
+class FakeGdriveService:
+
+    KNOWLEDGE_FOLDER_NAME = "mevy_files"
+
+    def __init__(self, files, changes=None):
+        self.files = files
+        self.changes = changes or []
+        self.download_errors = {}
+
+    def get_folder_id(self, folder_name):
+        return "folder"
+
+    def get_start_page_token(self):
+        return "token-1"
+
+    def list_files_in_folder(self, folder_id):
+        return {"files": self.files}
+
+    def list_changes(self, page_token):
+        return self.changes, "token-2"
+
+    def download_file(self, file_id, file_mime_type):
+        if file_id in self.download_errors:
+            raise self.download_errors[file_id]
+        return f"Contenu de {file_id}".encode("utf8")
+
+
+class FakeVectorStore:
+
+    def __init__(self):
+        self.file_reader = FileReader()
+        self.indexed_source_ids = []
+        self.renamed_sources = []
+        # Set once stop_after files are indexed
+        self.stop_event = None
+        self.stop_after = None
+
+    async def build_from_documents(self, collection_name, documents, known_point_ids=None,
+                                   content_defined_chunks=False, on_source_indexed=None,
+                                   before_upsert=None):
+        async for document in documents:
+            await before_upsert()
+            self.indexed_source_ids.append(document.source_id)
+            await on_source_indexed(document.source_id, {f"{document.source_id}-point"})
+            if len(self.indexed_source_ids) == self.stop_after:
+                self.stop_event.set()
+
+    async def delete_vectors_for_source(self, collection_name, source_name):
+        pass
+
+    async def rename_source(self, collection_name, source_id, source_name):
+        self.renamed_sources.append((source_id, source_name))
+
+
+class GdriveEtlTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.source_registry = GdriveSourceRegistryService(
+            os.path.join(self.tmp_dir.name, "sources.sqlite3"))
+
+    def tearDown(self):
+        self.source_registry.close()
+        self.tmp_dir.cleanup()
+
+    def build_gdrive_etl(self, gdrive_service):
+        with patch.object(gdrive_etl, "GdriveService"), \
+                patch.object(gdrive_etl, "GdriveSourceRegistryService"), \
+                patch.object(gdrive_etl, "QdrantCollection"), \
+                patch.object(gdrive_etl, "VectorStore"):
+            etl = GdriveEtl(Mock())
+        etl.gdrive_service = gdrive_service
+        etl.source_registry = self.source_registry
+        etl.vector_store = FakeVectorStore()
+        return etl
+
+
+class TestGdriveDownloads(GdriveEtlTestCase):
+
+    def test_failed_download_is_not_recorded(self):
+        gdrive_service = FakeGdriveService([drive_file("a"), drive_file("b")])
+        gdrive_service.download_errors["b"] = HttpError(
+            Mock(status=500, reason="Backend Error"), b"")
+        etl = self.build_gdrive_etl(gdrive_service)
+
+        asyncio.run(etl.run())
+
+        self.assertEqual(etl.vector_store.indexed_source_ids, ["a"])
+        self.assertEqual(list(self.source_registry.get_files(["a", "b"])), ["a"])
+        self.assertEqual([file["id"] for file, _ in etl.failed_files], ["b"])
+        # Retried from the registry: the changes position is saved
+        self.assertEqual(self.source_registry.get_failed_files()["b"]["nbAttempts"], 1)
+        self.assertIn("startPageToken", self.source_registry.read_changes_state())
+
+    def test_failed_file_is_retried_once_due(self):
+        gdrive_service = FakeGdriveService([drive_file("a")])
+        gdrive_service.download_errors["a"] = HttpError(
+            Mock(status=500, reason="Backend Error"), b"")
+        asyncio.run(self.build_gdrive_etl(gdrive_service).run())
+
+        # Not due yet: not listed by the changes and skipped
+        waiting_etl = self.build_gdrive_etl(gdrive_service)
+        asyncio.run(waiting_etl.run())
+        self.assertEqual(waiting_etl.failed_files, [])
+
+        with patch.object(gdrive_etl.time, "time",
+                          return_value=time.time() + self.source_registry.RETRY_DELAY_SECONDS):
+            retried_etl = self.build_gdrive_etl(FakeGdriveService([drive_file("a")]))
+            asyncio.run(retried_etl.run())
+
+        self.assertEqual(retried_etl.vector_store.indexed_source_ids, ["a"])
+        self.assertEqual(list(self.source_registry.get_files(["a"])), ["a"])
+        self.assertEqual(self.source_registry.get_failed_files(), {})
+
+    def test_failed_file_leaving_the_folder_is_forgotten(self):
+        gdrive_service = FakeGdriveService([drive_file("a")])
+        gdrive_service.download_errors["a"] = HttpError(
+            Mock(status=500, reason="Backend Error"), b"")
+        asyncio.run(self.build_gdrive_etl(gdrive_service).run())
+
+        etl = self.build_gdrive_etl(FakeGdriveService(
+            [], changes=[{"fileId": "a", "removed": True}]))
+        asyncio.run(etl.run())
+
+        self.assertEqual(self.source_registry.get_failed_files(), {})
+
+    def test_files_are_recorded_as_they_are_indexed(self):
+        etl = self.build_gdrive_etl(FakeGdriveService([drive_file("a"), drive_file("b")]))
+        vector_store = etl.vector_store
+        build_from_documents = vector_store.build_from_documents
+
+        async def crash_after_first_file(*args, on_source_indexed=None, **kwargs):
+            async def record_then_crash(file_id, point_ids):
+                await on_source_indexed(file_id, point_ids)
+                raise RuntimeError("Crash")
+            await build_from_documents(*args, on_source_indexed=record_then_crash, **kwargs)
+
+        vector_store.build_from_documents = crash_after_first_file
+        with self.assertRaises(RuntimeError):
+            asyncio.run(etl.run())
+
+        self.assertEqual(list(self.source_registry.get_files(["a", "b"])), ["a"])
+
+    def test_stopped_run_resumes_from_the_registry(self):
+        files = [drive_file("a"), drive_file("b"), drive_file("c")]
+        etl = self.build_gdrive_etl(FakeGdriveService(files))
+        etl.DOWNLOAD_WORKERS = 1
+        etl.vector_store.stop_event = etl.stop_event
+        etl.vector_store.stop_after = 1
+
+        asyncio.run(etl.run())
+
+        # The download in progress when stopping is still indexed
+        self.assertEqual(etl.vector_store.indexed_source_ids, ["a", "b"])
+        self.assertEqual(sorted(self.source_registry.get_files(["a", "b", "c"])), ["a", "b"])
+        self.assertEqual(self.source_registry.read_changes_state(), {})
+
+        resumed_etl = self.build_gdrive_etl(FakeGdriveService(files))
+        asyncio.run(resumed_etl.run())
+
+        self.assertEqual(resumed_etl.vector_store.indexed_source_ids, ["c"])
+        self.assertEqual(self.source_registry.count(), 3)
+        self.assertIn("startPageToken", self.source_registry.read_changes_state())
+
+    def test_lost_lease_aborts_before_any_write(self):
+        etl = self.build_gdrive_etl(FakeGdriveService([drive_file("a")]))
+        etl.lease_check = Mock(return_value=False)
+
+        with self.assertRaises(LeaseLostError):
+            asyncio.run(etl.run())
+
+        self.assertEqual(etl.vector_store.indexed_source_ids, [])
+        self.assertEqual(self.source_registry.count(), 0)
+
+
+class TestGdriveUpdates(GdriveEtlTestCase):
+
+    def test_same_checksum_is_a_metadata_only_update(self):
+        self.source_registry.put_file(drive_file("a"), ["a-point"])
+        renamed_file = {**drive_file("a", "2024-02-01T00:00:00Z", "renamed.txt"),
+                        "md5Checksum": drive_file("a")["md5Checksum"]}
+        etl = self.build_gdrive_etl(FakeGdriveService([renamed_file]))
+
+        asyncio.run(etl.run())
+
+        self.assertEqual(etl.vector_store.indexed_source_ids, [])
+        self.assertEqual(etl.vector_store.renamed_sources, [("a", "renamed.txt")])
+        registered_file = self.source_registry.get_files(["a"])["a"]
+        self.assertEqual(registered_file["name"], "renamed.txt")
+        self.assertEqual(registered_file["pointIds"], ["a-point"])
+
+    def test_renamed_and_edited_file_is_reindexed_and_renamed(self):
+        self.source_registry.put_file(drive_file("a"), ["a-point"])
+        etl = self.build_gdrive_etl(FakeGdriveService(
+            [drive_file("a", "2024-02-01T00:00:00Z", "renamed.txt")]))
+
+        asyncio.run(etl.run())
+
+        self.assertEqual(etl.vector_store.indexed_source_ids, ["a"])
+        self.assertEqual(etl.vector_store.renamed_sources, [("a", "renamed.txt")])
+        self.assertEqual(self.source_registry.get_files(["a"])["a"]["name"], "renamed.txt")
+
+    def test_unchanged_google_doc_is_not_parsed(self):
+        exported_checksum = "sha256:" + hashlib.sha256(b"Contenu de doc").hexdigest()
+        google_doc = {**drive_file("doc"), "mimeType": "application/vnd.google-apps.document"}
+        del google_doc["md5Checksum"]
+        self.source_registry.put_file(
+            {**google_doc, "md5Checksum": exported_checksum}, ["doc-point"])
+        etl = self.build_gdrive_etl(FakeGdriveService(
+            [{**google_doc, "modifiedTime": "2024-02-01T00:00:00Z"}]))
+        etl.vector_store.file_reader = Mock()
+
+        asyncio.run(etl.run())
+
+        etl.vector_store.file_reader.detect_format_and_read_bytes.assert_not_called()
+        self.assertEqual(etl.vector_store.indexed_source_ids, [])
+        self.assertEqual(self.source_registry.get_files(["doc"])["doc"]["modifiedTime"],
+                         "2024-02-01T00:00:00Z")
+
+
+class TestGdriveChanges(GdriveEtlTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.etl = self.build_gdrive_etl(FakeGdriveService([]))
+        for file_id in ["removed", "trashed", "moved", "kept", "edited"]:
+            self.source_registry.put_file(drive_file(file_id), [f"{file_id}-point"])
+
+    def test_files_leaving_the_folder_are_deleted(self):
+        moved_file = {**drive_file("moved", "2024-02-01T00:00:00Z"), "parents": ["elsewhere"]}
+        files_to_create, files_to_update, files_to_delete = self.etl.diff_changes([
+            {"fileId": "removed", "removed": True},
+            {"fileId": "trashed", "file": {**drive_file("trashed"), "trashed": True}},
+            {"fileId": "moved", "file": moved_file},
+            {"fileId": "kept", "file": drive_file("kept")},
+            {"fileId": "unknown", "removed": True}
+        ], "folder")
+
+        self.assertEqual(files_to_create, [])
+        self.assertEqual(files_to_update, [])
+        self.assertEqual([file["id"] for file in files_to_delete],
+                         ["removed", "trashed", "moved"])
+
+    def test_last_change_of_a_file_wins(self):
+        files_to_create, files_to_update, files_to_delete = self.etl.diff_changes([
+            {"fileId": "new", "file": drive_file("new")},
+            {"fileId": "edited", "removed": True},
+            {"fileId": "new", "file": {**drive_file("new"), "trashed": True}},
+            {"fileId": "edited", "file": drive_file("edited", "2024-02-01T00:00:00Z")}
+        ], "folder")
+
+        self.assertEqual(files_to_create, [])
+        self.assertEqual([file["id"] for file in files_to_update], ["edited"])
+        self.assertEqual(files_to_delete, [])
+
+    def test_reconciliation_is_due_without_token_or_when_stale(self):
+        self.assertTrue(self.etl.is_reconciliation_due({}))
+
+        self.source_registry.write_changes_state("token-1", time.time())
+        self.assertFalse(self.etl.is_reconciliation_due(
+            self.source_registry.read_changes_state()))
+
+        stale_time = time.time() - self.etl.RECONCILIATION_INTERVAL_SECONDS - 1
+        self.source_registry.write_changes_state("token-1", stale_time)
+        self.assertTrue(self.etl.is_reconciliation_due(
+            self.source_registry.read_changes_state()))
+
+
+if __name__ == "__main__":
+    unittest.main()
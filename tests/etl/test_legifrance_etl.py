@@ -0,0 +1,207 @@
+import json
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, Mock, patch
+
+from mevy_bot.etl import legifrance_etl
+from mevy_bot.etl.legifrance_etl import LegifranceEtl
+from mevy_bot.models.legifrance import LegifranceSource
+from mevy_bot.services.legifrance_service import LegifranceService
+
+
+def raw_article(num, etat="VIGUEUR"):
+    return {
+        "id": f"LEGIARTI{num}", "cid": f"LEGIARTI{num}", "etat": etat, "num": num,
+        "content": f"<p>Le bailleur est tenu de remettre un logement décent ({num}).</p>",
+        "intOrdre": int(num)
+    }
+
+
+def raw_code(articles):
+    return {
+        "id": "LEGITEXT000000000001", "cid": "LEGITEXT000000000001", "title": "Code civil",
+        "sections": [{"title": "Livre Ier", "intOrdre": 0, "articles": articles, "sections": []}]
+    }
+
+
+class FakeLegifranceService(LegifranceService):
+
+    def __init__(self, raw_text):
+        super().__init__()
+        self.raw_text = raw_text
+
+    def fetch_raw(self, source):
+        return [self.raw_text]
+
+
+class FakeManifestService:
+
+    def __init__(self, manifest=None):
+        self.manifest = manifest or {}
+
+    def read(self):
+        return json.loads(json.dumps(self.manifest))
+
+    def write(self, manifest):
+        self.manifest = json.loads(json.dumps(manifest))
+
+
+class FakeVectorStore:
+
+    def __init__(self, stop_event=None, stop_after=None):
+        self.documents = []
+        self.indexed_source_ids = []
+        # Set once stop_after articles are indexed
+        self.stop_event = stop_event
+        self.stop_after = stop_after
+
+    def predict_costs_for_documents(self, documents):
+        self.documents.extend(documents)
+
+    async def build_from_documents(self, collection_name, documents, known_point_ids=None,
+                                   on_source_indexed=None, before_upsert=None):
+        async for document in documents:
+            await before_upsert()
+            self.indexed_source_ids.append(document.source_id)
+            await on_source_indexed(document.source_id, {f"{document.source_id}-point"})
+            if len(self.indexed_source_ids) == self.stop_after:
+                self.stop_event.set()
+
+    async def delete_vectors_for_source(self, collection_name, source_name):
+        pass
+
+
+def build_legifrance_etl(raw_text, manifest=None):
+    with patch.object(legifrance_etl, "LegifranceTextCacheService"), \
+            patch.object(legifrance_etl, "LegifranceResponseCacheService"):
+        etl = LegifranceEtl(Mock())
+    etl.legifrance_service = FakeLegifranceService(raw_text)
+    etl.manifest_service = FakeManifestService(manifest)
+    return etl
+
+
+class TestLegifranceReferential(unittest.TestCase):
+
+    def test_sources_are_listed_once(self):
+        sources, errors = LegifranceEtl.sources_from_referential({
+            "codes": ["Code civil", "Code de la consommation", "Code de la consommation"],
+            "decrets": [
+                {"name": "Décret A", "id": "LEGITEXT000000000001"},
+                {"name": "Décret A, bis", "id": "LEGITEXT000000000001"}
+            ]
+        })
+
+        self.assertEqual([source.key for source in sources], [
+            "code:Code civil",
+            "code:Code de la consommation",
+            "decret:LEGITEXT000000000001"
+        ])
+        self.assertEqual(errors, [])
+
+    def test_texts_need_a_legifrance_id(self):
+        sources, errors = LegifranceEtl.sources_from_referential({
+            "decrets": [{"name": "Décret A", "id": "2015-587"}],
+            "arretes": [{"name": "Arrêté B", "id": None}]
+        })
+
+        self.assertEqual(sources, [])
+        self.assertEqual(len(errors), 2)
+        self.assertIn("Décret A", errors[0])
+
+
+class TestTextIdResolution(unittest.TestCase):
+
+    def test_article_id_is_resolved_to_its_text(self):
+        source = LegifranceSource(kind="decret", name="Décret A", text_id="LEGIARTI000000000002")
+        with patch.object(LegifranceService, "call_api", return_value={"article": {
+            "textTitles": [{"id": "LEGITEXT000000000001", "cid": "JORFTEXT000000000001"}]
+        }}) as call_api:
+            legifrance_service = LegifranceService()
+            self.assertEqual(legifrance_service.resolve_text_id(source), "LEGITEXT000000000001")
+            self.assertEqual(legifrance_service.resolve_text_id(source), "LEGITEXT000000000001")
+
+        call_api.assert_called_once_with("consult/getArticle", {"id": "LEGIARTI000000000002"})
+
+    def test_jorf_id_is_resolved_by_title_search(self):
+        source = LegifranceSource(kind="arrete", name="Arrêté B", text_id="JORFTEXT000000000003")
+        with patch.object(LegifranceService, "call_api", return_value={"results": [
+            {"titles": [{"id": "LEGITEXT000000000009", "cid": "JORFTEXT000000000009"}]},
+            {"titles": [{"id": "LEGITEXT000000000003", "cid": "JORFTEXT000000000003"}]}
+        ]}) as call_api:
+            text_id = LegifranceService().resolve_text_id(source)
+
+        self.assertEqual(text_id, "LEGITEXT000000000003")
+        route, query = call_api.call_args.args
+        self.assertEqual(route, "search")
+        self.assertEqual(query["recherche"]["champs"][0]["criteres"][0]["valeur"], "Arrêté B")
+
+    def test_unresolved_id_is_an_error(self):
+        source = LegifranceSource(kind="arrete", name="Arrêté B", text_id="JORFTEXT000000000003")
+        with patch.object(LegifranceService, "call_api", return_value={"results": []}):
+            with self.assertRaises(ValueError):
+                LegifranceService().resolve_text_id(source)
+
+    def test_legitext_id_is_used_as_is(self):
+        source = LegifranceSource(kind="decret", name="Décret A", text_id="LEGITEXT000000000001")
+        with patch.object(LegifranceService, "call_api") as call_api:
+            self.assertEqual(LegifranceService().resolve_text_id(source), "LEGITEXT000000000001")
+        call_api.assert_not_called()
+
+
+class TestArticleStateFilter(unittest.TestCase):
+
+    def test_only_articles_in_force_are_indexed(self):
+        etl = build_legifrance_etl(raw_code([
+            raw_article("1"), raw_article("2", "ABROGE"),
+            raw_article("3"), raw_article("4", "ABROGE"), raw_article("5", "MODIFIE")
+        ]))
+        vector_store = FakeVectorStore()
+
+        asyncio.run(etl.sync_source(
+            LegifranceSource(kind="code", name="Code civil"), {}, Mock(), vector_store, True))
+
+        self.assertEqual([document.source_id for document in vector_store.documents],
+                         ["LEGIARTI1", "LEGIARTI3"])
+        messages = [call.args[0] for call in etl.logger.info.call_args_list]
+        self.assertIn("3 articles not indexed (2 ABROGE, 1 MODIFIE)", " ".join(messages))
+
+    def test_states_are_configurable(self):
+        etl = build_legifrance_etl(raw_code([]))
+
+        with patch.object(LegifranceEtl, "ARTICLE_STATES", {"VIGUEUR", "MODIFIE"}):
+            self.assertTrue(etl.is_article_kept(Mock(etat="MODIFIE")))
+            self.assertFalse(etl.is_article_kept(Mock(etat="ABROGE")))
+
+
+class TestLegifranceCheckpoint(unittest.TestCase):
+
+    def sync(self, etl, vector_store, store_client):
+        asyncio.run(etl.sync_source(
+            LegifranceSource(kind="code", name="Code civil"),
+            etl.manifest_service.read(), store_client, vector_store, False))
+
+    def test_stopped_run_resumes_from_the_checkpoint(self):
+        raw_text = raw_code([raw_article(num) for num in ["1", "2", "3", "4"]])
+        removed_entry = {"cid": "LEGIARTI9", "hash": "obsolete", "pointIds": ["LEGIARTI9-point"]}
+        etl = build_legifrance_etl(raw_text, {"Code civil": {"LEGIARTI9": removed_entry}})
+        store_client = Mock(delete_points=AsyncMock())
+
+        self.sync(etl, FakeVectorStore(etl.stop_event, stop_after=2), store_client)
+
+        checkpoint = etl.manifest_service.manifest["Code civil"]
+        self.assertEqual(sorted(checkpoint), ["LEGIARTI1", "LEGIARTI2"])
+        store_client.delete_points.assert_awaited_once_with(
+            etl.collection_name, ["LEGIARTI9-point"])
+
+        resumed_etl = build_legifrance_etl(raw_text, etl.manifest_service.manifest)
+        vector_store = FakeVectorStore()
+        self.sync(resumed_etl, vector_store, Mock(delete_points=AsyncMock()))
+
+        self.assertEqual(vector_store.indexed_source_ids, ["LEGIARTI3", "LEGIARTI4"])
+        manifest = resumed_etl.manifest_service.manifest["Code civil"]
+        self.assertEqual(sorted(manifest), ["LEGIARTI1", "LEGIARTI2", "LEGIARTI3", "LEGIARTI4"])
+        self.assertEqual(manifest["LEGIARTI1"]["pointIds"], ["LEGIARTI1-point"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,220 @@
+import asyncio
+import unittest
+from unittest.mock import Mock, patch
+from datetime import datetime, timedelta, timezone
+
+from redis import RedisError
+
+from mevy_bot.etl.cron_schedule import CronSchedule
+from mevy_bot.etl.workflow_scheduler import WorkflowScheduler
+
+NOW = datetime(2024, 3, 15, 10, 30, 20, tzinfo=timezone.utc)  # A Friday
+
+
+class TestCronSchedule(unittest.TestCase):
+
+    def test_next_after(self):
+        self.assertEqual(CronSchedule("*/15 * * * *").next_after(NOW),
+                         NOW.replace(minute=45, second=0))
+        self.assertEqual(CronSchedule("0 3 * * *").next_after(NOW),
+                         datetime(2024, 3, 16, 3, 0, tzinfo=timezone.utc))
+        self.assertEqual(CronSchedule("0 3 1 * *").next_after(NOW),
+                         datetime(2024, 4, 1, 3, 0, tzinfo=timezone.utc))
+        # Sunday
+        self.assertEqual(CronSchedule("30 8 * * 7").next_after(NOW),
+                         datetime(2024, 3, 17, 8, 30, tzinfo=timezone.utc))
+
+    def test_both_day_fields_match_either(self):
+        # The 20th or any Monday
+        self.assertEqual(CronSchedule("0 0 20 * 1").next_after(NOW),
+                         datetime(2024, 3, 18, 0, 0, tzinfo=timezone.utc))
+
+    def test_invalid_expression(self):
+        with self.assertRaises(ValueError):
+            CronSchedule("* * *")
+        with self.assertRaises(ValueError):
+            CronSchedule("61 * * * *")
+
+
+class TestWorkflowScheduler(unittest.TestCase):
+
+    def test_interval_next_run_time(self):
+        workflow = {"triggerInterval": 2, "triggerIntervalUnit": "hours"}
+        last_run = NOW - timedelta(minutes=30)
+
+        next_run = WorkflowScheduler.next_run_time(workflow, last_run, NOW)
+
+        expected_run = last_run + timedelta(hours=2)
+        self.assertGreaterEqual(next_run, expected_run)
+        self.assertLessEqual(next_run, expected_run + timedelta(
+            seconds=WorkflowScheduler.MAX_JITTER_SECONDS))
+
+    def test_late_run_is_not_caught_up(self):
+        workflow = {"triggerInterval": 1, "triggerIntervalUnit": "minutes"}
+        last_run = NOW - timedelta(hours=1)
+
+        next_run = WorkflowScheduler.next_run_time(workflow, last_run, NOW)
+
+        self.assertGreaterEqual(next_run, NOW)
+        self.assertLessEqual(next_run, NOW + timedelta(seconds=6))
+
+    def test_cron_takes_precedence(self):
+        workflow = {"triggerInterval": 1, "triggerIntervalUnit": "minutes", "cron": "0 3 * * *"}
+
+        next_run = WorkflowScheduler.next_run_time(workflow, None, NOW)
+
+        self.assertGreaterEqual(next_run, datetime(2024, 3, 16, 3, 0, tzinfo=timezone.utc))
+
+    def test_failed_run_is_retried_with_a_capped_backoff(self):
+        workflow = {"triggerInterval": 31, "triggerIntervalUnit": "days"}
+
+        first_retry = WorkflowScheduler.next_run_time(workflow, NOW, NOW, nb_failed_runs=1)
+        last_retry = WorkflowScheduler.next_run_time(workflow, NOW, NOW, nb_failed_runs=30)
+
+        retry_delay = timedelta(seconds=WorkflowScheduler.RETRY_DELAY_SECONDS)
+        self.assertGreaterEqual(first_retry, NOW + retry_delay)
+        self.assertLessEqual(first_retry, NOW + retry_delay * 1.1)
+        max_retry_delay = timedelta(seconds=WorkflowScheduler.MAX_RETRY_DELAY_SECONDS)
+        self.assertGreaterEqual(last_retry, NOW + max_retry_delay)
+        self.assertLessEqual(last_retry, NOW + max_retry_delay + timedelta(
+            seconds=WorkflowScheduler.MAX_JITTER_SECONDS))
+
+
+
+class TestWorkflowSchedulerLeases(unittest.TestCase):
+
+    def setUp(self):
+        self.lease_service = Mock(HEARTBEAT_INTERVAL_SECONDS=60)
+        self.lease_service.acquire.return_value = 1
+        self.lease_service.heartbeat.return_value = True
+        self.lease_service.is_stop_requested.return_value = False
+        self.lease_service.get_last_run.return_value = None
+        self.scheduler = WorkflowScheduler(self.lease_service)
+
+    def test_invalid_schedule_is_rejected_at_start(self):
+        with self.assertRaises(ValueError):
+            asyncio.run(self.scheduler.start(
+                {"id": 1, "triggerInterval": 1, "cron": "61 * * * *"}))
+        with self.assertRaises(ValueError):
+            asyncio.run(self.scheduler.start(
+                {"id": 1, "triggerInterval": 0, "triggerIntervalUnit": "hours"}))
+        self.lease_service.acquire.assert_not_called()
+
+    def test_saved_last_run_delays_the_first_run(self):
+        last_run = datetime.now(timezone.utc) - timedelta(minutes=30)
+        self.lease_service.get_last_run.return_value = last_run
+        lease_service, scheduler = self.lease_service, self.scheduler
+
+        async def start_then_stop():
+            await scheduler.start({"id": 1, "triggerInterval": 2, "triggerIntervalUnit": "hours"})
+            await asyncio.sleep(0.1)
+            next_run = scheduler.workflows[1].next_run
+            scheduler.stop(1, release_lease=False)
+            return next_run
+
+        next_run = asyncio.run(start_then_stop())
+
+        lease_service.get_last_run.assert_called_once_with(1)
+        self.assertGreaterEqual(next_run, last_run + timedelta(hours=2))
+
+    def test_run_checks_its_fencing_token(self):
+        workflow = {"id": 1, "triggerInterval": 1, "triggerIntervalUnit": "seconds"}
+
+        async def run_once():
+            await self.scheduler.start(workflow)
+            while not self.lease_service.set_last_run.called:
+                await asyncio.sleep(0.01)
+            self.scheduler.stop(1)
+            await self.scheduler.shutdown()
+
+        with patch.object(WorkflowScheduler, "run_workflow") as run_workflow:
+            asyncio.run(run_once())
+
+        workflow_id, _, lease_check = run_workflow.call_args.args
+        self.assertEqual(workflow_id, 1)
+        lease_check()
+        self.lease_service.is_held.assert_called_once_with(1, 1)
+        self.lease_service.set_last_run.assert_called_once()
+        self.lease_service.release.assert_called_once_with(1, 1)
+
+    def test_failed_run_is_not_saved_as_last_run(self):
+        workflow = {"id": 1, "triggerInterval": 31, "triggerIntervalUnit": "days"}
+
+        async def fail_once():
+            await self.scheduler.start(workflow)
+            while not self.scheduler.workflows[1].nb_failed_runs:
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(0.01)
+            next_run = self.scheduler.workflows[1].next_run
+            self.scheduler.stop(1)
+            await self.scheduler.shutdown()
+            return next_run
+
+        with patch.object(WorkflowScheduler, "run_workflow", side_effect=RuntimeError("Down")), \
+                patch.object(WorkflowScheduler, "MAX_JITTER_SECONDS", 0):
+            next_run = asyncio.run(fail_once())
+
+        self.lease_service.set_last_run.assert_not_called()
+        self.assertLess(next_run, datetime.now(timezone.utc) + timedelta(
+            seconds=WorkflowScheduler.RETRY_DELAY_SECONDS * 1.1))
+
+    def test_pre_run_heartbeat_is_retried(self):
+        self.lease_service.HEARTBEAT_INTERVAL_SECONDS = 0.01
+        self.lease_service.heartbeat.side_effect = [RedisError("Connection refused"), True]
+
+        is_lease_held = asyncio.run(self.scheduler._renew_lease(1, 1))
+
+        self.assertTrue(is_lease_held)
+        self.assertEqual(self.lease_service.heartbeat.call_count, 2)
+
+    def schedule_for_heartbeats(self):
+        """ Schedule a workflow whose next run is hours away, heartbeats only """
+        self.lease_service.HEARTBEAT_INTERVAL_SECONDS = 0.01
+        self.lease_service.get_last_run.return_value = datetime.now(timezone.utc)
+
+        async def schedule():
+            await self.scheduler.start(
+                {"id": 1, "triggerInterval": 2, "triggerIntervalUnit": "hours"})
+            for _ in range(50):
+                await asyncio.sleep(0.01)
+                if 1 not in self.scheduler.workflows:
+                    break
+            await self.scheduler.shutdown()
+
+        asyncio.run(schedule())
+
+    def test_stop_requested_by_another_worker(self):
+        self.lease_service.is_stop_requested.return_value = True
+
+        self.schedule_for_heartbeats()
+
+        self.assertNotIn(1, self.scheduler.workflows)
+        self.lease_service.release.assert_called_once_with(1, 1)
+
+    def test_lost_lease_unschedules_without_release(self):
+        self.lease_service.heartbeat.return_value = False
+
+        self.schedule_for_heartbeats()
+
+        self.assertNotIn(1, self.scheduler.workflows)
+        self.lease_service.release.assert_not_called()
+
+    def test_status_of_a_workflow_scheduled_elsewhere(self):
+        self.lease_service.get_owner.return_value = "host:12:abcd"
+
+        status = self.scheduler.status(1)
+
+        self.assertTrue(status["isActive"])
+        self.assertEqual(status["owner"], "host:12:abcd")
+        self.lease_service.get_owner.assert_called_once_with(1)
+
+    def test_stop_request_reaches_the_owner(self):
+        with patch.object(self.scheduler, "stop") as stop:
+            asyncio.run(self.scheduler.request_stop(1))
+
+        stop.assert_not_called()
+        self.lease_service.request_stop.assert_called_once_with(1)
+
+
+if __name__ == "__main__":
+    unittest.main()
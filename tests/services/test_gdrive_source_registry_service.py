@@ -0,0 +1,97 @@
+import os
+import json
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from mevy_bot.services import gdrive_source_registry_service
+from mevy_bot.services.gdrive_source_registry_service import GdriveSourceRegistryService
+
+
+def drive_file(file_id, modified_time="2024-01-01T00:00:00Z"):
+    return {
+        "id": file_id, "name": f"{file_id}.pdf", "modifiedTime": modified_time,
+        "md5Checksum": f"md5-{file_id}", "mimeType": "application/pdf"
+    }
+
+
+class TestGdriveSourceRegistryService(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.registry = GdriveSourceRegistryService(
+            os.path.join(self.tmp_dir.name, "sources.sqlite3"))
+
+    def tearDown(self):
+        self.registry.close()
+        self.tmp_dir.cleanup()
+
+    def test_diff_listing(self):
+        self.registry.put_file(drive_file("kept"), ["p1"])
+        self.registry.put_file(drive_file("modified"), ["p2"])
+        self.registry.put_file(drive_file("deleted"), ["p3"])
+
+        files_to_create, files_to_update, files_to_delete = self.registry.diff_listing([
+            drive_file("kept"),
+            drive_file("modified", "2024-02-01T00:00:00Z"),
+            drive_file("new")
+        ])
+
+        self.assertEqual([file["id"] for file in files_to_create], ["new"])
+        self.assertEqual([file["id"] for file in files_to_update], ["modified"])
+        self.assertEqual([file["id"] for file in files_to_delete], ["deleted"])
+        self.assertEqual(files_to_delete[0]["pointIds"], ["p3"])
+
+    def test_put_get_and_delete_file(self):
+        self.registry.put_file(drive_file("a"), {"p2", "p1"})
+
+        self.assertEqual(self.registry.get_files(["a", "missing"]), {
+            "a": {**drive_file("a"), "pointIds": ["p1", "p2"]}
+        })
+        self.registry.delete_file("a")
+        self.assertEqual(self.registry.get_files(["a"]), {})
+
+    def test_failure_backoff_doubles_up_to_the_maximum(self):
+        registry = self.registry
+        with patch.object(gdrive_source_registry_service.time, "time", return_value=0):
+            registry.record_failure(drive_file("a"), "PdfReadError")
+            self.assertEqual(registry.get_failed_files()["a"], {
+                "file": drive_file("a"), "nbAttempts": 1,
+                "nextAttempt": registry.RETRY_DELAY_SECONDS, "error": "PdfReadError"
+            })
+            registry.record_failure(drive_file("a"), "PdfReadError")
+            self.assertEqual(registry.get_failed_files()["a"]["nextAttempt"],
+                             registry.RETRY_DELAY_SECONDS * 2)
+            for _ in range(20):
+                registry.record_failure(drive_file("a"), "PdfReadError")
+            self.assertEqual(registry.get_failed_files()["a"]["nextAttempt"],
+                             registry.MAX_RETRY_DELAY_SECONDS)
+
+    def test_failure_is_cleared_once_the_file_is_put(self):
+        self.registry.record_failure(drive_file("a"), "PdfReadError")
+        self.registry.record_failure(drive_file("b"), "PdfReadError")
+
+        self.registry.put_file(drive_file("a"), ["p1"])
+        self.registry.delete_failed_file("b")
+
+        self.assertEqual(self.registry.get_failed_files(), {})
+
+    def test_changes_state(self):
+        self.assertEqual(self.registry.read_changes_state(), {})
+        self.registry.write_changes_state("42", 1.5)
+        self.assertEqual(self.registry.read_changes_state(),
+                         {"startPageToken": "42", "lastReconciliation": 1.5})
+
+    def test_import_json_cache(self):
+        cache_file = os.path.join(self.tmp_dir.name, "gdrive_known_files.json")
+        with open(cache_file, "w", encoding="utf8") as f:
+            json.dump({"a": {"name": "a.pdf", "modifiedTime": "t", "pointIds": ["p1"]}}, f)
+
+        self.registry.import_json_cache(cache_file)
+
+        self.assertEqual(self.registry.get_files(["a"])["a"]["pointIds"], ["p1"])
+        self.assertFalse(os.path.exists(cache_file))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import time
+import tempfile
+import unittest
+
+from mevy_bot.services.legifrance_parser_service import LegifranceParserService
+from mevy_bot.services.legifrance_response_cache_service import LegifranceResponseCacheService
+
+
+def raw_section(title, int_ordre, articles, sections):
+    return {"title": title, "intOrdre": int_ordre, "articles": articles, "sections": sections}
+
+
+def raw_article(num, int_ordre):
+    return {
+        "id": f"LEGIARTI{num}", "cid": f"LEGIARTI{num}", "etat": "VIGUEUR",
+        "num": num, "content": f"<p>Article {num}</p>", "intOrdre": int_ordre,
+        "dateDebut": 0
+    }
+
+
+RAW_CODE = {
+    "id": "LEGITEXT000006070721",
+    "cid": "LEGITEXT000006070721",
+    "title": "Code civil",
+    "sections": [
+        raw_section("Livre II", 2, [raw_article("3", 0)], []),
+        raw_section("Livre Ier", 1, [raw_article("2", 1), raw_article("1", 0)], [
+            raw_section("Titre Ier", 0, [raw_article("1-1", 0)], [])
+        ])
+    ]
+}
+
+
+class TestLegifranceResponseCacheService(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = LegifranceResponseCacheService(self.tmp_dir.name, max_age_seconds=60)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_articles_are_streamed_in_reading_order(self):
+        self.cache.write_records(
+            "code:Code civil", LegifranceParserService.iter_records(RAW_CODE))
+
+        records = self.cache.iter_records("code:Code civil")
+        self.assertEqual(next(records)["title"], "Code civil")
+        articles = list(LegifranceParserService.iter_articles(records))
+        self.assertEqual(
+            [(section_path, article.num) for section_path, article in articles],
+            [(["Livre Ier"], "1"), (["Livre Ier"], "2"),
+             (["Livre Ier", "Titre Ier"], "1-1"), (["Livre II"], "3")]
+        )
+        self.assertEqual(articles[0][1].content, "<p>Article 1</p>")
+        self.assertIsNone(self.cache.iter_records("code:Code de commerce"))
+
+    def test_root_articles_have_an_empty_path(self):
+        raw_law = {
+            "id": "LEGITEXT000000000001", "cid": "JORFTEXT000000000001",
+            "title": "Décret", "articles": [raw_article("2", 1), raw_article("1", 0)]
+        }
+
+        records = LegifranceParserService.iter_records(raw_law)
+        next(records)
+        articles = list(LegifranceParserService.iter_articles(records))
+        self.assertEqual(
+            [(section_path, article.num) for section_path, article in articles],
+            [([], "1"), ([], "2")]
+        )
+
+    def test_stale_response_is_ignored(self):
+        self.cache.write_records("code:Code civil", [{"title": "Code civil"}])
+        filepath = self.cache.filepath("code:Code civil")
+        one_hour_ago = time.time() - 3600
+        os.utime(filepath, (one_hour_ago, one_hour_ago))
+
+        self.assertFalse(self.cache.is_fresh("code:Code civil"))
+        self.assertIsNone(self.cache.iter_records("code:Code civil"))
+
+
+if __name__ == "__main__":
+    unittest.main()
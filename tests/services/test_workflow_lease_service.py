@@ -0,0 +1,102 @@
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import Mock, patch
+
+from mevy_bot.services import workflow_lease_service
+from mevy_bot.services.workflow_lease_service import WorkflowLeaseService
+
+
+class TestWorkflowLeaseService(unittest.TestCase):
+
+    def setUp(self):
+        self.client = Mock()
+        self.scripts = {}
+
+        def register_script(script):
+            self.scripts[script] = Mock()
+            return self.scripts[script]
+
+        self.client.register_script.side_effect = register_script
+        with patch.object(workflow_lease_service, "RedisHandler") as redis_handler:
+            redis_handler.return_value.client = self.client
+            self.lease_service = WorkflowLeaseService()
+        self.ttl_ms = WorkflowLeaseService.LEASE_TTL_SECONDS * 1000
+
+    def script(self, script):
+        return self.scripts[script]
+
+    def test_acquire_returns_the_fencing_token(self):
+        acquire = self.script(WorkflowLeaseService.ACQUIRE_SCRIPT)
+        acquire.return_value = 7
+
+        self.assertEqual(self.lease_service.acquire(1), 7)
+        acquire.assert_called_once_with(
+            keys=["workflow:1:lease", "workflow:1:fencing", "workflow:1:stop"],
+            args=[self.lease_service.owner, self.ttl_ms]
+        )
+
+    def test_acquire_fails_when_owned(self):
+        self.script(WorkflowLeaseService.ACQUIRE_SCRIPT).return_value = None
+
+        self.assertIsNone(self.lease_service.acquire(1))
+
+    def test_heartbeat_is_fenced_by_the_token(self):
+        heartbeat = self.script(WorkflowLeaseService.HEARTBEAT_SCRIPT)
+        heartbeat.return_value = 1
+
+        self.assertTrue(self.lease_service.heartbeat(1, 7))
+        heartbeat.assert_called_once_with(
+            keys=["workflow:1:lease"],
+            args=[f"{self.lease_service.owner}|7", self.ttl_ms]
+        )
+
+        heartbeat.return_value = 0
+        self.assertFalse(self.lease_service.heartbeat(1, 7))
+
+    def test_release_clears_the_stop_request(self):
+        release = self.script(WorkflowLeaseService.RELEASE_SCRIPT)
+
+        self.lease_service.release(1, 7)
+
+        release.assert_called_once_with(
+            keys=["workflow:1:lease", "workflow:1:stop"],
+            args=[f"{self.lease_service.owner}|7"]
+        )
+
+    def test_is_held_compares_the_token(self):
+        self.client.get.return_value = f"{self.lease_service.owner}|7"
+
+        self.assertTrue(self.lease_service.is_held(1, 7))
+        self.assertFalse(self.lease_service.is_held(1, 6))
+        self.client.get.assert_called_with("workflow:1:lease")
+
+    def test_owner_is_read_from_the_lease(self):
+        self.client.get.return_value = "host:12:abcd|7"
+        self.assertEqual(self.lease_service.get_owner(1), "host:12:abcd")
+
+        self.client.get.return_value = None
+        self.assertIsNone(self.lease_service.get_owner(1))
+
+    def test_stop_request(self):
+        self.lease_service.request_stop(1)
+
+        self.client.set.assert_called_once_with(
+            "workflow:1:stop", "1", ex=WorkflowLeaseService.LEASE_TTL_SECONDS * 10)
+        self.client.exists.return_value = 1
+        self.assertTrue(self.lease_service.is_stop_requested(1))
+        self.client.exists.return_value = 0
+        self.assertFalse(self.lease_service.is_stop_requested(1))
+
+    def test_last_run_round_trip(self):
+        last_run = datetime(2024, 3, 15, 10, 30, tzinfo=timezone.utc)
+
+        self.lease_service.set_last_run(1, last_run)
+
+        key, value = self.client.set.call_args.args
+        self.assertEqual(key, "workflow:1:last_run")
+        self.client.get.return_value = value
+        self.assertEqual(self.lease_service.get_last_run(1), last_run)
+
+
+if __name__ == "__main__":
+    unittest.main()
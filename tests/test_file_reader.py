@@ -0,0 +1,102 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from PyPDF2 import PdfReader
+
+from mevy_bot.file_reader import FileReader
+from mevy_bot.services.pdf_page_cache_service import PdfPageCacheService
+
+
+def pdf_bytes(page_texts):
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for text in page_texts:
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        page_ids.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {len(page_ids)} >>"
+    content = b"%PDF-1.4\n"
+    offsets = []
+    for i, obj in enumerate(objects, start=1):
+        offsets.append(len(content))
+        content += f"{i} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+    xref_offset = len(content)
+    content += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        content += f"{offset:010d} 00000 n \n".encode()
+    content += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode()
+    return content
+
+
+class TestPdfReading(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.filepath = os.path.join(self.tmp_dir.name, "bail.pdf")
+        with open(self.filepath, "wb") as f:
+            f.write(pdf_bytes([f"Page {i}" for i in range(20)]))
+        self.page_cache = PdfPageCacheService(
+            os.path.join(self.tmp_dir.name, "pdf_pages.sqlite3"))
+
+    def tearDown(self):
+        self.page_cache.close()
+        self.tmp_dir.cleanup()
+
+    def test_pages_are_extracted_in_parallel_in_order(self):
+        with mock.patch.object(FileReader, "PDF_EXTRACTION_WORKERS", 2):
+            pages = list(FileReader(self.page_cache).iter_pdf_pages(self.filepath))
+
+        self.assertEqual(pages, [f"Page {i}" for i in range(20)])
+
+    def test_pdf_is_parsed_once_for_all_batches(self):
+        with mock.patch.object(FileReader, "PDF_EXTRACTION_WORKERS", 1), \
+                mock.patch("mevy_bot.file_reader.PdfReader", wraps=PdfReader) as pdf_reader:
+            pages = list(FileReader().iter_pdf_pages(self.filepath))
+
+        self.assertEqual(len(pages), 20)
+        self.assertLessEqual(pdf_reader.call_count, 1)
+
+    def test_cached_pages_are_not_extracted_again(self):
+        file_reader = FileReader(self.page_cache)
+        file_reader.read_text_from_pdf(self.filepath)
+
+        with mock.patch("mevy_bot.file_reader.extract_pdf_pages") as extract_pdf_pages:
+            file_text = file_reader.read_text_from_pdf(self.filepath)
+
+        extract_pdf_pages.assert_not_called()
+        self.assertEqual(file_text, "".join(f"Page {i}" for i in range(20)))
+
+    def test_in_memory_pdf_pages_are_extracted_by_the_pool(self):
+        with open(self.filepath, "rb") as f:
+            pdf_content = f.read()
+
+        with mock.patch.object(FileReader, "PDF_EXTRACTION_WORKERS", 2), \
+                mock.patch.object(FileReader, "_get_executor") as get_executor:
+            get_executor.return_value.map.side_effect = map
+            pages = list(FileReader().iter_pdf_pages_from_bytes(pdf_content))
+
+        self.assertEqual(pages, [f"Page {i}" for i in range(20)])
+        get_executor.return_value.map.assert_called_once()
+
+    def test_in_memory_files_are_read_like_files_on_disk(self):
+        with open(self.filepath, "rb") as f:
+            pdf_content = f.read()
+        file_reader = FileReader(self.page_cache)
+
+        self.assertEqual(
+            file_reader.detect_format_and_read_bytes(pdf_content, "bail.pdf"),
+            FileReader().read_text_from_pdf(self.filepath))
+        self.assertEqual(
+            file_reader.detect_format_and_read_bytes(
+                "Notice d'information".encode("utf8"), "Notice",
+                "application/vnd.google-apps.document"),
+            "Notice d'information")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+import os
+import gzip
+import json
+import time
+import logging
+import resource
+import tempfile
+import unittest
+import multiprocessing
+
+from mevy_bot.models.legifrance import Code
+from mevy_bot.services.legifrance_parser_service import LegifranceParserService
+from mevy_bot.services.legifrance_response_cache_service import LegifranceResponseCacheService
+
+NB_BRANCHES = 10
+NB_ARTICLES_PER_SECTION = 30
+
+l = logging.getLogger(__name__)
+
+
+def raw_section(path: str, depth: int, int_ordre: int) -> dict:
+    return {
+        "id": f"LEGISCTA{path}",
+        "cid": f"LEGISCTA{path}",
+        "title": f"Section {path}",
+        "etat": "VIGUEUR",
+        "intOrdre": int_ordre,
+        "articles": [
+            {
+                "id": f"LEGIARTI{path}-{i}",
+                "cid": f"LEGIARTI{path}-{i}",
+                "etat": "VIGUEUR",
+                "num": f"L{path}-{i}",
+                "content": "<p>" + "Le bailleur est obligé de délivrer le logement. " * 20 + "</p>",
+                "intOrdre": i,
+                "dateDebut": 0,
+                "dateFin": 0
+            }
+            for i in range(NB_ARTICLES_PER_SECTION if depth == 0 else 0)
+        ],
+        "sections": [
+            raw_section(f"{path}.{i}", depth - 1, i) for i in range(NB_BRANCHES if depth > 0 else 0)
+        ]
+    }
+
+
+def raw_code() -> dict:
+    # 30,000 articles, about 30MB of JSON (Code général des impôts scale)
+    return {
+        "id": "LEGITEXT000006069577",
+        "cid": "LEGITEXT000006069577",
+        "title": "Code général des impôts",
+        "jurisState": "VIGUEUR",
+        "nature": "CODE",
+        "sections": [raw_section(str(i), 2, i) for i in range(NB_BRANCHES)]
+    }
+
+
+def count_articles_model_validate(filepath: str) -> int:
+    with gzip.open(filepath, "rt", encoding="utf8") as f:
+        code = Code.model_validate(json.load(f))
+    nb_articles = 0
+    stack = list(code.sections)
+    while stack:
+        section = stack.pop()
+        nb_articles += len(section.articles)
+        stack.extend(section.sections)
+    return nb_articles
+
+
+def count_articles_streaming(cache_dir: str) -> int:
+    records = LegifranceResponseCacheService(cache_dir).iter_records("code:test")
+    next(records)  # header
+    return sum(1 for _ in LegifranceParserService.iter_articles(records))
+
+
+def measure(mode: str, path: str, results: multiprocessing.Queue) -> None:
+    start_time = time.perf_counter()
+    if mode == "model_validate":
+        nb_articles = count_articles_model_validate(path)
+    else:
+        nb_articles = count_articles_streaming(path)
+    elapsed_time = time.perf_counter() - start_time
+    # ru_maxrss is in kilobytes on Linux
+    results.put((nb_articles, elapsed_time, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+
+
+@unittest.skipUnless(os.getenv("RUN_BENCHMARKS"), "set RUN_BENCHMARKS=1 to run benchmarks")
+class TestLegifranceParseBenchmark(unittest.TestCase):
+    """
+    Compares reading articles back from the response cache with validating
+    the whole code from a JSON file. The download itself is not measured:
+    fetch_raw still loads the full API response as a dict before it is
+    written to the cache, so its peak is unchanged by streaming.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        code = raw_code()
+        self.json_filepath = os.path.join(self.tmp_dir.name, "code.json.gz")
+        with gzip.open(self.json_filepath, "wt", encoding="utf8") as f:
+            json.dump(code, f)
+        LegifranceResponseCacheService(self.tmp_dir.name).write_records(
+            "code:test", LegifranceParserService.iter_records(code))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def run_in_fresh_process(self, mode: str, path: str) -> tuple:
+        # A fresh process per mode, so that peak RSS is not shared
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        process = context.Process(target=measure, args=(mode, path, results))
+        process.start()
+        result = results.get()
+        process.join()
+        nb_articles, elapsed_time, max_rss_kb = result
+        l.info("%-16s %d articles in %.2fs, peak RSS %.0fMB",
+               mode, nb_articles, elapsed_time, max_rss_kb / 1024)
+        return result
+
+    def test_streaming_parse_uses_less_memory(self):
+        nb_validated, _, validate_rss = self.run_in_fresh_process(
+            "model_validate", self.json_filepath)
+        nb_streamed, _, streaming_rss = self.run_in_fresh_process(
+            "streaming", self.tmp_dir.name)
+
+        self.assertEqual(nb_streamed, nb_validated)
+        self.assertEqual(nb_streamed, NB_BRANCHES ** 3 * NB_ARTICLES_PER_SECTION)
+        self.assertLess(streaming_rss, validate_rss)
+
+
+if __name__ == "__main__":
+    unittest.main()
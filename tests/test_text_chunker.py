@@ -0,0 +1,112 @@
+import unittest
+from dataclasses import replace
+
+import tiktoken
+
+from mevy_bot.text_chunker import TextChunker
+from mevy_bot.models.openai import OpenAIModelFactory
+from mevy_bot.embedder.tokenizer_registry import TokenizerRegistry
+
+
+def chunk_texts(segments, chunk_size=40):
+    token_counts = [len(segment.split()) for segment in segments]
+    groups = TextChunker.content_defined_groups(segments, token_counts, chunk_size)
+    return ["".join(segments[group.start:group.stop]) for group in groups]
+
+
+class TestContentDefinedChunks(unittest.TestCase):
+
+    def setUp(self):
+        self.segments = [
+            f"Article {i} : le bailleur est tenu de remettre au locataire un logement décent.\n"
+            for i in range(200)
+        ]
+
+    def test_groups_cover_all_segments_within_chunk_size(self):
+        token_counts = [len(segment.split()) for segment in self.segments]
+        groups = TextChunker.content_defined_groups(self.segments, token_counts, 40)
+        self.assertEqual(
+            [index for group in groups for index in group], list(range(200)))
+        for group in groups:
+            self.assertLessEqual(sum(token_counts[i] for i in group), 40)
+
+    def test_edit_only_changes_nearby_chunks(self):
+        chunks = chunk_texts(self.segments)
+        edited_segments = list(self.segments)
+        edited_segments.insert(100, "Un nouvel alinéa inséré au milieu du document.\n")
+        edited_chunks = chunk_texts(edited_segments)
+
+        changed_chunks = set(edited_chunks) - set(chunks)
+        self.assertLessEqual(len(changed_chunks), 3)
+        self.assertGreater(len(chunks), 20)
+
+
+
+class TestTokenWindows(unittest.TestCase):
+
+    def setUp(self):
+        TokenizerRegistry.register("test-bytes", tiktoken.Encoding(
+            name="test-bytes",
+            pat_str=r"[\s\S]",
+            mergeable_ranks={bytes([i]): i for i in range(256)},
+            special_tokens={}
+        ))
+        self.text_chunker = TextChunker(
+            OpenAIModelFactory.text_embedding_3_small(),
+            replace(OpenAIModelFactory.gpt4o_mini(), name="test-bytes")
+        )
+        self.text = "".join(f"Article {i} : texte de l'article.\n" for i in range(50))
+
+    def test_windows_overlap_and_cover_all_tokens(self):
+        windows = TextChunker.token_windows(10, 4, 1)
+        self.assertEqual(windows, [range(0, 4), range(3, 7), range(6, 10)])
+        self.assertEqual(TextChunker.token_windows(10, 4, 0)[-1], range(8, 10))
+        self.assertEqual(TextChunker.token_windows(0, 4, 1), [])
+        with self.assertRaises(ValueError):
+            TextChunker.token_windows(10, 4, 4)
+
+    def test_windows_are_decoded_in_order(self):
+        chunks = self.text_chunker.split_in_token_windows(self.text, 100, 0.2)
+
+        self.assertEqual(chunks[0], self.text[:100])
+        self.assertEqual(chunks[1], self.text[80:180])
+        self.assertEqual("".join(chunk[20:] for chunk in chunks[1:]),
+                         self.text[100:])
+        self.assertEqual(self.text_chunker.split_text_into_chunks(self.text, 100),
+                         self.text_chunker.split_in_token_windows(self.text, 100, 0))
+
+    def test_streaming_windows_match_batch_windows(self):
+        for overlap_fraction in [0, 0.2]:
+            streamed_chunks = list(self.text_chunker.iter_in_token_windows(
+                self.text.splitlines(keepends=True), 100, overlap_fraction))
+            self.assertEqual(streamed_chunks, self.text_chunker.split_in_token_windows(
+                self.text, 100, overlap_fraction))
+
+    def test_streaming_windows_with_merges_across_parts(self):
+        # Parts split inside words and whitespace runs that BPE merges
+        merges = [b"ar", b"ti", b"cl", b"cle", b"ar" + b"ti", b"arti" + b"cle",
+                  b"  ", b"    ", b" t", b" te"]
+        mergeable_ranks = {bytes([i]): i for i in range(256)}
+        mergeable_ranks.update({merge: 256 + i for i, merge in enumerate(merges)})
+        TokenizerRegistry.register("test-bpe", tiktoken.Encoding(
+            name="test-bpe",
+            pat_str=r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\p{L}\p{N}]?+\p{L}+|\p{N}{1,3}| ?[^\s\p{L}\p{N}]++[\r\n]*|\s*[\r\n]|\s+(?!\S)|\s+""",
+            mergeable_ranks=mergeable_ranks,
+            special_tokens={}
+        ))
+        text_chunker = TextChunker(
+            OpenAIModelFactory.text_embedding_3_small(),
+            replace(OpenAIModelFactory.gpt4o_mini(), name="test-bpe")
+        )
+        text = "".join(f"article {i} :    texte de l'article.\n" for i in range(50))
+        text_parts = [text[i:i + 7] for i in range(0, len(text), 7)]
+
+        for overlap_fraction in [0, 0.2]:
+            streamed_chunks = list(text_chunker.iter_in_token_windows(
+                text_parts, 50, overlap_fraction))
+            self.assertEqual(streamed_chunks, text_chunker.split_in_token_windows(
+                text, 50, overlap_fraction))
+
+
+if __name__ == "__main__":
+    unittest.main()
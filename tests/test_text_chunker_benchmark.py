@@ -0,0 +1,93 @@
+import os
+import time
+import logging
+import unittest
+
+import tiktoken
+
+from mevy_bot.text_chunker import TextChunker
+from mevy_bot.models.openai import OpenAIModelFactory
+from mevy_bot.embedder.tokenizer_registry import TokenizerRegistry
+
+CHUNK_SIZE = 1024
+OVERLAP_FRACTION = 0.2
+NB_ARTICLES = 5000
+
+l = logging.getLogger(__name__)
+
+
+def legifrance_like_text() -> str:
+    # About the size of a large code (Code civil: ~2.5M characters)
+    return "".join(
+        f"Livre {i // 1000} > Titre {i // 100} > Chapitre {i // 10}\n"
+        f"Article n°L{i}\n"
+        "Le bailleur est obligé de délivrer au locataire le logement en bon état "
+        "d'usage et de réparation ainsi que les équipements mentionnés au contrat "
+        "de location en bon état de fonctionnement.\n\n"
+        for i in range(NB_ARTICLES)
+    )
+
+
+def token_loop_chunks(text_chunker: TextChunker, text: str, max_tokens: int) -> list:
+    """ Token-by-token loop used before the token-window chunker """
+    tokenizer = TokenizerRegistry.get(text_chunker.chat_model.name)
+    chunks, current_chunk = [], []
+    for token in tokenizer.encode_ordinary(text):
+        current_chunk.append(token)
+        if len(current_chunk) >= max_tokens:
+            chunks.append(tokenizer.decode(current_chunk))
+            current_chunk = []
+    if current_chunk:
+        chunks.append(tokenizer.decode(current_chunk))
+    return chunks
+
+
+@unittest.skipUnless(os.getenv("RUN_BENCHMARKS"), "set RUN_BENCHMARKS=1 to run benchmarks")
+class TestTextChunkerBenchmark(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        chat_model = OpenAIModelFactory.gpt4o_mini()
+        try:
+            TokenizerRegistry.get(chat_model.name)
+        except Exception:  # pylint: disable=broad-exception-caught
+            # Offline: tiktoken files cannot be downloaded, use byte tokens
+            TokenizerRegistry.register(chat_model.name, tiktoken.Encoding(
+                name="bytes",
+                pat_str=r"[\s\S]",
+                mergeable_ranks={bytes([i]): i for i in range(256)},
+                special_tokens={}
+            ))
+        cls.text_chunker = TextChunker(
+            OpenAIModelFactory.text_embedding_3_small(), chat_model)
+        cls.text = legifrance_like_text()
+
+    def measure(self, name: str, split) -> list:
+        start_time = time.perf_counter()
+        chunks = split()
+        elapsed_time = time.perf_counter() - start_time
+        l.info("%-32s %6d chunks in %.3fs", name, len(chunks), elapsed_time)
+        self.assertGreater(len(chunks), 0)
+        return chunks
+
+    def test_chunkers(self):
+        l.info("Text: %d characters", len(self.text))
+        loop_chunks = self.measure("token loop", lambda: token_loop_chunks(
+            self.text_chunker, self.text, CHUNK_SIZE))
+        window_chunks = self.measure("token windows", lambda: self.text_chunker.split_in_token_windows(
+            self.text, CHUNK_SIZE, 0))
+        overlap_chunks = self.measure("token windows (overlap)", lambda: self.text_chunker.split_in_token_windows(
+            self.text, CHUNK_SIZE, OVERLAP_FRACTION))
+        streamed_chunks = self.measure("token windows (streaming)", lambda: list(self.text_chunker.iter_in_token_windows(
+            self.text.splitlines(keepends=True), CHUNK_SIZE, OVERLAP_FRACTION)))
+        self.measure("words with overlap", lambda: self.text_chunker.split_in_chunks_with_overlap(
+            self.text, CHUNK_SIZE, OVERLAP_FRACTION))
+        self.measure("semchunk", lambda: self.text_chunker.split_in_chunks_semchunk(
+            self.text, CHUNK_SIZE, OVERLAP_FRACTION))
+
+        self.assertEqual(window_chunks, loop_chunks)
+        self.assertEqual(streamed_chunks, overlap_chunks)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,158 @@
+import re
+import asyncio
+import unittest
+from types import SimpleNamespace
+
+from mevy_bot.models.ingestion import SourceDocument, ChunkPlan
+from mevy_bot.models.openai import OpenAIModelFactory
+from mevy_bot.vector_store.ingestion_pipeline import IngestionPipeline
+
+
+class FakeChunkPlanner:
+
+    def plan(self, text, chunk_size, chunk_overlap, content_defined=False):
+        chunk_offsets = [
+            (match.start(), match.end()) for match in re.finditer(r"\S+", text)
+        ]
+        return ChunkPlan(
+            len(chunk_offsets),
+            len(text),
+            chunk_offsets,
+            [end - start for start, end in chunk_offsets]
+        )
+
+
+class FakeEmbeddingConverter:
+
+    max_batch_size = 3
+
+    def __init__(self):
+        self.embedder = SimpleNamespace(
+            embedding_model=OpenAIModelFactory.text_embedding_3_small())
+        self.batch_sizes = []
+
+    def point_ids_for_chunks(self, source_id, text_chunks):
+        return [f"{source_id}/{text_chunk}" for text_chunk in text_chunks]
+
+    async def get_embeddings_for_chunks(self, text_chunks):
+        self.batch_sizes.append(len(text_chunks))
+        await asyncio.sleep(0)
+        return [(text_chunk.source_name, text_chunk.text) for text_chunk in text_chunks]
+
+    def chunk_payload(self, text_chunk):
+        return {"text": text_chunk.text, "chunk_index": text_chunk.chunk_index,
+                **text_chunk.metadata}
+
+
+class FakeStoreClient:
+
+    def __init__(self):
+        self.points = []
+        self.barrier_points = None
+        self.payloads = {}
+
+    async def set_payloads(self, collection_name, payloads, wait=True):
+        self.payloads.update(payloads)
+
+    async def upsert_points_in_batches(self, points, collection_name, wait=True):
+        self.points.extend(points)
+
+    async def consistency_barrier(self, collection_name, points):
+        self.barrier_points = points
+
+
+async def documents():
+    yield SourceDocument("id-a", "a.txt", "un deux trois quatre", {"section": "Titre II"})
+    yield SourceDocument("id-b", "b.txt", "cinq six")
+
+
+class TestIngestionPipeline(unittest.TestCase):
+
+    def test_all_chunks_are_upserted(self):
+        store_client = FakeStoreClient()
+        embedding_converter = FakeEmbeddingConverter()
+        pipeline = IngestionPipeline(
+            store_client, embedding_converter, FakeChunkPlanner(), 1024, 0.2)
+
+        stats = asyncio.run(pipeline.run("test", documents()))
+
+        self.assertCountEqual(store_client.points, [
+            ("a.txt", "un"), ("a.txt", "deux"), ("a.txt", "trois"),
+            ("a.txt", "quatre"), ("b.txt", "cinq"), ("b.txt", "six")
+        ])
+        self.assertEqual(embedding_converter.batch_sizes, [3, 3])
+        self.assertEqual(stats["read"].nb_items, 2)
+        self.assertEqual(stats["upsert"].nb_items, 6)
+        self.assertIsNotNone(store_client.barrier_points)
+        self.assertEqual(pipeline.point_ids_by_source["id-b"], {"id-b/cinq", "id-b/six"})
+
+    def test_known_chunks_are_not_embedded_again(self):
+        store_client = FakeStoreClient()
+        pipeline = IngestionPipeline(
+            store_client, FakeEmbeddingConverter(), FakeChunkPlanner(), 1024, 0.2)
+
+        asyncio.run(pipeline.run(
+            "test", documents(), {"id-a": {"id-a/un", "id-a/deux", "id-a/obsolete"}}))
+
+        self.assertCountEqual(store_client.points, [
+            ("a.txt", "trois"), ("a.txt", "quatre"),
+            ("b.txt", "cinq"), ("b.txt", "six")
+        ])
+        self.assertEqual(pipeline.nb_skipped_chunks, 2)
+        self.assertEqual(len(pipeline.point_ids_by_source["id-a"]), 4)
+
+    def test_known_chunks_payload_is_updated(self):
+        store_client = FakeStoreClient()
+        pipeline = IngestionPipeline(
+            store_client, FakeEmbeddingConverter(), FakeChunkPlanner(), 1024, 0.2)
+
+        asyncio.run(pipeline.run("test", documents(), {"id-a": {"id-a/deux"}}))
+
+        self.assertEqual(store_client.payloads, {
+            "id-a/deux": {"chunk_index": 1, "section": "Titre II"}
+        })
+
+    def test_sources_are_reported_once_indexed(self):
+        store_client = FakeStoreClient()
+        indexed_sources = []
+
+        async def on_source_indexed(source_id, point_ids):
+            # All the points of the source are upserted by then
+            upserted_texts = {text for _, text in store_client.points}
+            self.assertTrue(all(
+                point_id.split("/")[1] in upserted_texts
+                for point_id in point_ids - {"id-a/un"}
+            ))
+            indexed_sources.append((source_id, point_ids))
+
+        pipeline = IngestionPipeline(
+            store_client, FakeEmbeddingConverter(), FakeChunkPlanner(), 1024, 0.2)
+        asyncio.run(pipeline.run(
+            "test", documents(), {"id-a": {"id-a/un"}}, on_source_indexed))
+
+        self.assertCountEqual(indexed_sources, [
+            ("id-a", {"id-a/un", "id-a/deux", "id-a/trois", "id-a/quatre"}),
+            ("id-b", {"id-b/cinq", "id-b/six"})
+        ])
+
+    def test_failing_before_upsert_aborts_the_run(self):
+        store_client = FakeStoreClient()
+        nb_upserts = 0
+
+        async def before_upsert():
+            nonlocal nb_upserts
+            if nb_upserts == 1:
+                raise RuntimeError("Lease lost")
+            nb_upserts += 1
+
+        pipeline = IngestionPipeline(
+            store_client, FakeEmbeddingConverter(), FakeChunkPlanner(), 1024, 0.2)
+        with self.assertRaises(ExceptionGroup):
+            asyncio.run(pipeline.run(
+                "test", documents(), before_upsert=before_upsert))
+
+        self.assertEqual(len(store_client.points), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
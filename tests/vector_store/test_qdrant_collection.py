@@ -0,0 +1,64 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+
+from qdrant_client.models import PointStruct
+
+from mevy_bot.vector_store.qdrant_collection import QdrantCollection
+
+
+class FakeQdrantClient:
+
+    def __init__(self):
+        self.upserts = []
+        self.nb_in_flight = 0
+        self.max_in_flight = 0
+
+    async def collection_exists(self, collection_name):
+        return True
+
+    async def delete_collection(self, collection_name):
+        pass
+
+    async def upsert(self, collection_name, wait, points, ordering=None):
+        self.nb_in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.nb_in_flight)
+        await asyncio.sleep(0.01)
+        self.nb_in_flight -= 1
+        self.upserts.append((wait, len(points)))
+
+
+class TestQdrantCollection(unittest.TestCase):
+
+    def setUp(self):
+        self.collection = QdrantCollection(vector_dimensions=2)
+        self.collection.client = FakeQdrantClient()
+        self.points = [
+            PointStruct(id=i, vector=[0.0, 1.0], payload={}) for i in range(10)
+        ]
+
+    def test_upsert_points_in_batches(self):
+        asyncio.run(self.collection.upsert_points_in_batches(
+            self.points, "test", batch_size=3, max_concurrency=2, wait=False))
+
+        client = self.collection.client
+        self.assertCountEqual(
+            client.upserts, [(False, 3), (False, 3), (False, 3), (False, 1)])
+        self.assertEqual(client.max_in_flight, 2)
+
+    def test_consistency_barrier_waits(self):
+        asyncio.run(self.collection.consistency_barrier("test", self.points[-3:]))
+        self.assertEqual(self.collection.client.upserts, [(True, 3)])
+
+    def test_deleted_collection_is_forgotten(self):
+        asyncio.run(self.collection.upsert_points_in_batches(self.points, "test"))
+        self.assertIn("test", QdrantCollection.existing_collections)
+
+        with patch.object(QdrantCollection, "get_qdrant_client", FakeQdrantClient):
+            asyncio.run(QdrantCollection.delete_collection("test"))
+
+        self.assertNotIn("test", QdrantCollection.existing_collections)
+
+
+if __name__ == "__main__":
+    unittest.main()